@@ -0,0 +1,130 @@
+"""Offline batch mode: OCR a folder of saved screenshots and match each one against the question bank.
+
+Images are split into chunks and spread over a process pool with one PaddleOCR instance per
+worker. Within a chunk, detection runs per image and all detected line crops then go through
+the recognizer as one batch. Results are streamed to a JSONL file as chunks finish, one record
+per image: {"image", "text", "matches", "correct_answer"}.
+
+Usage:
+    python batch_ocr.py screenshots/                       # -> batch_ocr_results.jsonl
+    python batch_ocr.py screenshots/ --workers 8 --output answers.jsonl
+    python batch_ocr.py screenshots/ --db                  # match against questions.db
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+
+import realtime_ocr
+from question_search import QuestionIndex
+from question_db import QuestionDB, QUESTION_DB_FILE
+
+# --- Batch Configuration ---
+DEFAULT_BANK_FILE = 'combined_questions_data.json'
+DEFAULT_OUTPUT_FILE = 'batch_ocr_results.jsonl'
+DEFAULT_TOP_K = 5
+DEFAULT_CHUNK_SIZE = 8 # Images per task: their line crops share one recognition batch
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+# --- Worker Side ---
+def _init_worker(cpu_threads):
+    """Process pool initializer: one OCR engine instance per worker, limited to its share of the cores."""
+    if not realtime_ocr.initialize_ocr(cpu_threads=cpu_threads): raise RuntimeError("OCR engine failed to initialize")
+
+def ocr_images(paths):
+    """OCRs a chunk of images. Returns [(path, cleaned text, error or None)]."""
+    results, pending = [], [] # pending: (result index, processed image, boxes)
+    for path in paths:
+        try:
+            img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if img is None: raise ValueError("unreadable image")
+            processed = realtime_ocr.preprocess_screen_capture(img)
+            if processed is None: raise ValueError("preprocessing failed")
+            pending.append((len(results), processed, realtime_ocr.detect_text_boxes(processed)))
+            results.append([path, "", None])
+        except Exception as e:
+            results.append([path, "", str(e)])
+
+    # One recognition call for every line of every image in the chunk
+    crops = [processed[y0:y1, x0:x1] for _, processed, boxes in pending for x0, y0, x1, y1 in boxes]
+    recognized = iter(realtime_ocr.recognize_crops_scored(crops))
+    for i, _, boxes in pending:
+        lines = [text for text, score in (next(recognized) for _ in boxes) if score >= realtime_ocr.REC_DROP_SCORE]
+        results[i][1] = realtime_ocr.clean_ocr_text("".join(lines).strip())
+    return [tuple(r) for r in results]
+
+# --- Parent Side ---
+def list_images(input_dir, recursive=False):
+    if recursive:
+        paths = [os.path.join(root, name) for root, _, names in os.walk(input_dir) for name in names]
+    else:
+        paths = [os.path.join(input_dir, name) for name in os.listdir(input_dir)]
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(p))
+
+def match_record(path, text, error, index, top_k):
+    if error: return {'image': path, 'error': error}
+    matches = index.search(text, top_k) if text else []
+    return {
+        'image': path,
+        'text': text,
+        'matches': [{'bank_name': m['question'].get('bank_name'), 'id': m['question'].get('id'), 'text': m['question'].get('text'),
+                     'correct_answer': m['question'].get('correct_answer'), 'similarity': m['similarity'], 'score': m['score']} for m in matches],
+        'correct_answer': matches[0]['question'].get('correct_answer') if matches else None,
+    }
+
+def run_batch(paths, index, output_file, workers, chunk_size=DEFAULT_CHUNK_SIZE, top_k=DEFAULT_TOP_K):
+    """OCRs `paths` across `workers` processes, writing one JSONL record per image as results arrive.
+
+    Returns (images done, errors, paths that never ran because the worker pool broke).
+    """
+    cpu_threads = max(1, (os.cpu_count() or 1) // workers) # Avoid oversubscribing cores with per-worker thread pools
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    done = errors = 0
+    not_run = []
+    start = time.perf_counter()
+    with open(output_file, 'w', encoding='utf-8') as out, \
+         ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cpu_threads,)) as executor:
+        futures = {executor.submit(ocr_images, chunk): chunk for chunk in chunks}
+        try:
+            for future in as_completed(futures):
+                for path, text, error in future.result():
+                    record = match_record(path, text, error, index, top_k)
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    done += 1; errors += 'error' in record
+                del futures[future]
+                out.flush() # Downstream tools can tail the file while the batch runs
+                elapsed = time.perf_counter() - start
+                print(f"  {done}/{len(paths)} images, {done / elapsed:.2f} images/s", end='\r')
+        except BrokenProcessPool as e: # A worker died or failed to initialize: every unfinished chunk is lost
+            not_run = sorted(path for chunk in futures.values() for path in chunk)
+            print(f"\nERROR: worker pool broke ({e}). {len(not_run)} image(s) were not OCR'd:")
+            for path in not_run: print(f"  {path}")
+    elapsed = time.perf_counter() - start
+    print(f"\nOCR'd {done} images ({errors} errors) in {elapsed:.1f} s with {workers} worker(s) x {cpu_threads} thread(s): {done / elapsed:.2f} images/s")
+    return done, errors, not_run
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OCR a folder of screenshots across a process pool and write JSONL answers.")
+    parser.add_argument('input_dir', help="Folder of screenshots (png/jpg/bmp/webp)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_FILE, help="JSONL output file")
+    parser.add_argument('--workers', type=int, default=0, help="Worker processes, each with its own PaddleOCR (0 = CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Images per task; their lines are recognized as one batch")
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help="Matches per image")
+    parser.add_argument('--bank', default=DEFAULT_BANK_FILE, help="Question bank JSON to match against")
+    parser.add_argument('--db', nargs='?', const=QUESTION_DB_FILE, help=f"Match against a SQLite bank instead (default path: {QUESTION_DB_FILE})")
+    parser.add_argument('--recursive', action='store_true', help="Include images in subfolders")
+    args = parser.parse_args()
+
+    paths = list_images(args.input_dir, args.recursive)
+    if not paths: print(f"No images found in {args.input_dir}."); sys.exit(1)
+    try: index = QuestionDB(args.db) if args.db else QuestionIndex.from_json_file(args.bank)
+    except Exception as e: print(f"ERROR loading question bank: {e}"); sys.exit(1)
+    workers = min(args.workers if args.workers > 0 else (os.cpu_count() or 1), len(paths))
+    print(f"{len(paths)} images, {len(index)} questions, {workers} worker(s). Writing {args.output}...")
+    _, errors, not_run = run_batch(paths, index, args.output, workers, max(1, args.chunk_size), args.top_k)
+    sys.exit(1 if not_run or errors == len(paths) else 0)
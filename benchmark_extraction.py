@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""extract_questions.py 的吞吐量与内存基准测试。
+
+生成指定规模的合成 i博思 风格 HTML 题库（与解析器期望的 question-item / question-item__option /
+stu-answer / analysis 结构一致），分别测量 extract_questions_from_html、流式解析器以及
+merge_and_deduplicate_data 的耗时和内存峰值，并写出 JSON 报告。
+
+用法:
+    python benchmark_extraction.py                      # 1k / 10k / 100k 题
+    python benchmark_extraction.py --sizes 1000,5000 --output report.json
+    python benchmark_extraction.py --compare old_report.json --threshold 1.25
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import extract_questions
+
+try:
+    import resource  # 仅 Unix 可用，用于读取进程 RSS 峰值
+except ImportError:
+    resource = None
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_REPORT_FILE = 'bench_extraction_report.json'
+DUPLICATE_RATIO = 0.1  # 合并阶段输入中完全重复题目的比例
+NEAR_DUPLICATE_RATIO = 0.05  # 合并阶段输入中近似重复题目 (另一个 id、未作答、空白不同) 的比例
+STAGES = ('extract', 'extract_streaming', 'merge')
+
+# --- 合成题库生成 ---
+_CJK_POOL = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+_OPTION_LETTERS = "ABCDEFGH"
+_QUESTION_TYPES = ("单选", "多选", "判断", "填空")
+
+def random_cjk(rng, min_len, max_len):
+    return "".join(rng.choice(_CJK_POOL) for _ in range(rng.randint(min_len, max_len)))
+
+def render_question_item(rng, number, question_id):
+    """生成一个与 i博思 导出页面结构一致的 div.question-item。"""
+    q_type = rng.choice(_QUESTION_TYPES)
+    n_options = 2 if q_type == "判断" else rng.randint(3, 5)
+    options = "".join(f'<li><span>{_OPTION_LETTERS[i]}.</span> {random_cjk(rng, 2, 16)}</li>' for i in range(n_options))
+    correct = _OPTION_LETTERS[rng.randrange(n_options)]
+    student = rng.choice([f'<span>我的答案：<b>{_OPTION_LETTERS[rng.randrange(n_options)]}</b></span>', ''])
+    # 覆盖解析器支持的三种解析结构
+    analysis_kind = rng.randrange(3)
+    if analysis_kind == 0:
+        analysis = f'<div class="analysis"><div class="analysis-content"><p>{random_cjk(rng, 10, 60)}</p></div></div>'
+    elif analysis_kind == 1:
+        analysis = f'<div class="analysis"><p>本题解析：<span>{random_cjk(rng, 10, 60)}</span></p></div>'
+    else:
+        analysis = '<div class="analysis"><p>本题解析：【无】</p></div>'
+    return (
+        f'<div class="question-item" id="{question_id}">'
+        f'<p class="question-item__type">{number}.【{q_type}】</p>'
+        f'<div class="question-item__content"><p>{random_cjk(rng, 12, 80)}（ ）</p></div>'
+        f'<ul class="question-item__option">{options}</ul>'
+        f'<div class="stu-answer">{student}<span class="true-answer">正确答案：<b>{correct}</b></span></div>'
+        f'{analysis}'
+        f'</div>\n'
+    )
+
+def generate_bank_html(filepath, n_questions, seed=0):
+    """写出包含 n_questions 道题的合成 HTML 题库，返回文件大小 (字节)。"""
+    rng = random.Random(seed)
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>合成题库</title></head><body><div class="question-list">\n')
+        for number in range(1, n_questions + 1):
+            f.write(render_question_item(rng, number, f"{seed}{number:09d}"))
+        f.write('</div></body></html>\n')
+    return os.path.getsize(filepath)
+
+# --- 测量 ---
+def _max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # macOS 以字节为单位，Linux 以 KB 为单位
+
+def _run_stage(stage, html_path, merge_input_path):
+    if stage == 'merge':
+        with open(merge_input_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        output_path = merge_input_path + '.out.json'
+        start = time.perf_counter()
+        extract_questions.merge_and_deduplicate_data(records, output_path)
+        return time.perf_counter() - start, len(records)
+    extractor = (extract_questions.extract_questions_from_html_streaming if stage == 'extract_streaming'
+                 else extract_questions.extract_questions_from_html)
+    start = time.perf_counter()
+    records = extractor(html_path, 'benchmark')
+    return time.perf_counter() - start, len(records)
+
+def _measure_in_child(stage, html_path, merge_input_path, trace_memory):
+    """在独立进程中运行，确保 RSS 峰值和 tracemalloc 结果互不干扰。"""
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        if trace_memory:
+            tracemalloc.start()
+            _, n_records = _run_stage(stage, html_path, merge_input_path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return {'records': n_records, 'tracemalloc_peak_mb': round(peak / (1024 * 1024), 1)}
+        seconds, n_records = _run_stage(stage, html_path, merge_input_path)
+    return {'records': n_records, 'seconds': round(seconds, 4), 'max_rss_mb': _max_rss_mb()}
+
+def measure(stage, html_path, merge_input_path):
+    result = {}
+    for trace_memory in (False, True):  # 计时与内存跟踪分开运行，避免 tracemalloc 拖慢计时
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result.update(executor.submit(_measure_in_child, stage, html_path, merge_input_path, trace_memory).result())
+    result['records_per_second'] = round(result['records'] / result['seconds'], 1) if result['seconds'] else None
+    return result
+
+def build_merge_input(html_path, merge_input_path):
+    """合并阶段的输入: 提取结果加上一定比例的完全重复和近似重复题目（与实际多次导出同一题库的情况相同）。"""
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        records = extract_questions.extract_questions_from_html_streaming(html_path, 'benchmark')
+    rng = random.Random(1)
+    near_duplicates = [dict(r, id=f"re-{r['id']}", student_answer='未提供', text=f" {r['text']} ")
+                       for r in rng.sample(records, int(len(records) * NEAR_DUPLICATE_RATIO))]
+    records += [dict(r) for r in rng.sample(records, int(len(records) * DUPLICATE_RATIO))] + near_duplicates
+    rng.shuffle(records)
+    with open(merge_input_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+
+def run_benchmark(sizes, stages=STAGES):
+    cases = []
+    with tempfile.TemporaryDirectory(prefix='bench_extraction_') as tmp_dir:
+        for size in sizes:
+            html_path = os.path.join(tmp_dir, f'bank_{size}.html')
+            merge_input_path = os.path.join(tmp_dir, f'merge_{size}.json')
+            html_bytes = generate_bank_html(html_path, size)
+            print(f"规模 {size} 题: 已生成 {html_bytes / (1024 * 1024):.1f} MB 的合成 HTML。")
+            if 'merge' in stages:
+                build_merge_input(html_path, merge_input_path)
+            for stage in stages:
+                result = measure(stage, html_path, merge_input_path)
+                result.update({'stage': stage, 'questions': size, 'html_mb': round(html_bytes / (1024 * 1024), 2)})
+                cases.append(result)
+                print(f"  {stage:<18} {result['seconds']:>9.3f} s  {result['records_per_second'] or 0:>10.1f} 条/s  "
+                      f"tracemalloc 峰值 {result['tracemalloc_peak_mb']:>8.1f} MB  RSS 峰值 {result['max_rss_mb']} MB")
+    return {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'cases': cases,
+    }
+
+def compare_reports(report, baseline, threshold):
+    """与基准报告比较，返回耗时或内存超过 threshold 倍的条目。"""
+    baseline_cases = {(c['stage'], c['questions']): c for c in baseline.get('cases', [])}
+    regressions = []
+    for case in report['cases']:
+        old = baseline_cases.get((case['stage'], case['questions']))
+        if not old:
+            continue
+        for metric in ('seconds', 'tracemalloc_peak_mb', 'max_rss_mb'):
+            if old.get(metric) and case.get(metric) and case[metric] > old[metric] * threshold:
+                regressions.append({'stage': case['stage'], 'questions': case['questions'], 'metric': metric,
+                                    'baseline': old[metric], 'current': case[metric]})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="extract_questions.py 吞吐量与内存基准测试")
+    parser.add_argument('--sizes', default=",".join(str(s) for s in DEFAULT_SIZES), help="逗号分隔的题目数量 (默认: 1000,10000,100000)")
+    parser.add_argument('--stages', default=",".join(STAGES), help=f"要测量的阶段 (默认: {','.join(STAGES)})")
+    parser.add_argument('--output', default=DEFAULT_REPORT_FILE, help="JSON 报告输出路径")
+    parser.add_argument('--compare', help="与之前的 JSON 报告比较，发现回退时以退出码 1 结束")
+    parser.add_argument('--threshold', type=float, default=1.25, help="判定为回退的倍数 (默认: 1.25)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    stages = [s.strip() for s in args.stages.split(',') if s.strip() in STAGES]
+    report = run_benchmark(sizes, stages)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['regressions'] = compare_reports(report, baseline, args.threshold)
+        for r in report['regressions']:
+            print(f"回退: {r['stage']} @ {r['questions']} 题 - {r['metric']}: {r['baseline']} -> {r['current']}")
+        if report['regressions']:
+            exit_code = 1
+        else:
+            print(f"与 {args.compare} 相比没有超过 {args.threshold} 倍的回退。")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"报告已写入: {args.output}")
+    sys.exit(exit_code)
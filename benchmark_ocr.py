@@ -0,0 +1,260 @@
+"""End-to-end latency and accuracy benchmark for the realtime OCR loop.
+
+Renders questions from combined_questions_data.json into synthetic screenshots, replays them
+through realtime_ocr.ReplaySource -> preprocess_screen_capture -> OCR engine -> clean_ocr_text ->
+question search, and reports per-stage latency percentiles plus hit@1 / hit@5 match accuracy.
+Runs headless (no screen, tkinter or hotkeys needed).
+
+Usage:
+    python benchmark_ocr.py                                  # 50 random questions
+    python benchmark_ocr.py --samples 200 --output report.json
+    python benchmark_ocr.py --frames-dir frames/             # keep (and reuse) the rendered screenshots
+    python benchmark_ocr.py --preprocess gray --line-cache   # compare settings
+    python benchmark_ocr.py --preprocess auto --no-normalize
+    python benchmark_ocr.py --compare old_report.json
+    python benchmark_ocr.py --engines paddle,onnx,onnx-int8    # OCR engines side by side on the same frames
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+
+import cv2
+import numpy as np
+
+import realtime_ocr
+from question_search import QuestionIndex, question_key
+from question_db import QuestionDB
+
+try:
+    from PIL import Image, ImageDraw, ImageFont # Installed with PaddleOCR
+except ImportError:
+    Image = ImageDraw = ImageFont = None
+
+# --- Benchmark Configuration ---
+DEFAULT_BANK_FILE = 'combined_questions_data.json'
+DEFAULT_REPORT_FILE = 'bench_ocr_report.json'
+DEFAULT_SAMPLES = 50
+GROUND_TRUTH_FILE = 'ground_truth.json' # Written next to the rendered frames
+FRAME_WIDTH = 900
+FRAME_MARGIN = 24
+FONT_SIZE = 22
+LINE_SPACING = 1.5
+OPTION_LETTERS = "ABCDEFGH"
+# Common CJK fonts on Windows / macOS / Linux; override with --font
+FONT_CANDIDATES = (
+    'C:/Windows/Fonts/msyh.ttc', 'C:/Windows/Fonts/simhei.ttf', 'C:/Windows/Fonts/simsun.ttc',
+    '/System/Library/Fonts/PingFang.ttc', '/System/Library/Fonts/STHeiti Light.ttc',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc', '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc', '/usr/share/fonts/wenquanyi/wqy-microhei/wqy-microhei.ttc',
+)
+STAGES = ('grab', 'preprocess', 'ocr', 'clean', 'search')
+PERCENTILES = (50, 90, 99)
+
+# --- Synthetic Screenshots ---
+def find_font(path=None):
+    for candidate in ((path,) if path else FONT_CANDIDATES):
+        if candidate and os.path.exists(candidate): return candidate
+    raise FileNotFoundError(f"No CJK font found{' at ' + path if path else ''}; pass one with --font")
+
+def wrap_text(draw, text, font, max_width):
+    """Greedy per-character wrapping (CJK has no word boundaries)."""
+    lines = []
+    for paragraph in str(text).split('\n'):
+        line = ""
+        for ch in paragraph:
+            if line and draw.textlength(line + ch, font=font) > max_width:
+                lines.append(line); line = ""
+            line += ch
+        lines.append(line)
+    return lines
+
+def question_lines(question):
+    lines = [f"{question.get('number') or '?'}.【{question.get('type') or ''}】", question.get('text') or ""]
+    lines += [f"{OPTION_LETTERS[i]}. {opt}" for i, opt in enumerate(question.get('options') or []) if i < len(OPTION_LETTERS)]
+    return lines
+
+def render_question_image(question, font, width=FRAME_WIDTH):
+    """Renders a question the way the exam page shows it: black text on white. Returns a BGR array."""
+    scratch = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+    lines = []
+    for text in question_lines(question): lines += wrap_text(scratch, text, font, width - 2 * FRAME_MARGIN)
+    line_height = int(font.size * LINE_SPACING)
+    image = Image.new('RGB', (width, 2 * FRAME_MARGIN + line_height * len(lines)), 'white')
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((FRAME_MARGIN, FRAME_MARGIN + i * line_height), line, font=font, fill='black')
+    return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+
+def generate_frames(questions, frames_dir, font_path, font_size=FONT_SIZE):
+    """Writes one PNG per question plus ground_truth.json mapping frame name -> (bank_name, id)."""
+    if ImageFont is None: raise RuntimeError("Pillow is required to render frames (pip install pillow)")
+    font = ImageFont.truetype(font_path, font_size)
+    os.makedirs(frames_dir, exist_ok=True)
+    truth = {}
+    for i, question in enumerate(questions):
+        name = f"frame_{i:05d}.png"
+        cv2.imwrite(os.path.join(frames_dir, name), render_question_image(question, font))
+        truth[name] = list(question_key(question)) # JSON stores the key as a list
+    with open(os.path.join(frames_dir, GROUND_TRUTH_FILE), 'w', encoding='utf-8') as f:
+        json.dump(truth, f, ensure_ascii=False, indent=1)
+    return truth
+
+def sample_questions(bank_file, n, seed=0):
+    with open(bank_file, 'r', encoding='utf-8') as f: questions = json.load(f)
+    questions = [q for q in questions if isinstance(q, dict) and q.get('text')]
+    return random.Random(seed).sample(questions, min(n, len(questions)))
+
+# --- Replay & Measurement ---
+def run_replay(frames_dir, index, truth, top_k=5, strategy='adaptive', normalize=True, line_cache=False, warmup=1):
+    """Replays every frame once through the OCR stages. Returns (per-stage ms lists, per-frame rows, preprocessing strategy).
+
+    strategy 'auto' calibrates on the first frame (outside the timings) and uses the result for every frame.
+    """
+    source = realtime_ocr.ReplaySource(frames_dir)
+    recognizer = realtime_ocr.IncrementalRecognizer() if line_cache else None
+    timings = {stage: [] for stage in STAGES + ('total',)}
+    rows = []
+    while True:
+        t0 = time.perf_counter()
+        img_np = source.grab()
+        if img_np is None: break
+        t1 = time.perf_counter()
+        if strategy == 'auto' or warmup > 0: # Calibration and warm-up stay out of the numbers: shift the frame's clock past them
+            if strategy == 'auto':
+                strategy = realtime_ocr.calibrate_strategy(img_np, normalize)[0] or realtime_ocr.PREPROCESS_FALLBACK_STRATEGY
+                print(f"Calibrated preprocessing: {strategy}")
+            if warmup > 0: # First inferences pay for lazy initialization
+                realtime_ocr.detect_and_recognize(realtime_ocr.preprocess_screen_capture(img_np, strategy, normalize)); warmup -= 1
+            setup = time.perf_counter() - t1
+            t0 += setup; t1 += setup
+        processed = realtime_ocr.preprocess_screen_capture(img_np, strategy, normalize)
+        t2 = time.perf_counter()
+        raw_text = recognizer.recognize(processed) if recognizer else "".join(text for _, text in realtime_ocr.detect_and_recognize(processed))
+        t3 = time.perf_counter()
+        cleaned_text = realtime_ocr.clean_ocr_text(raw_text.strip())
+        t4 = time.perf_counter()
+        matches = index.search(cleaned_text, top_k) if cleaned_text else []
+        t5 = time.perf_counter()
+
+        durations = (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)
+        for stage, seconds in zip(STAGES + ('total',), durations + (sum(durations),)):
+            timings[stage].append(seconds * 1000)
+        expected = truth.get(source.current_name)
+        keys = [list(question_key(m['question'])) for m in matches]
+        rows.append({'frame': source.current_name, 'expected': expected, 'text': cleaned_text,
+                     'rank': keys.index(expected) + 1 if expected in keys else None,
+                     'top_similarity': matches[0]['similarity'] if matches else None})
+    source.close()
+    return timings, rows, strategy
+
+def summarize(timings, rows):
+    stages = {}
+    for stage, values in timings.items():
+        if not values: continue
+        stats = {'mean_ms': round(float(np.mean(values)), 2), 'max_ms': round(float(np.max(values)), 2)}
+        stats.update({f"p{p}_ms": round(float(np.percentile(values, p)), 2) for p in PERCENTILES})
+        stages[stage] = stats
+    labelled = [r for r in rows if r['expected'] is not None]
+    accuracy = {f"hit@{k}": round(sum(1 for r in labelled if r['rank'] and r['rank'] <= k) / len(labelled), 4) if labelled else None for k in (1, 5)}
+    accuracy['empty_text'] = sum(1 for r in rows if not r['text'])
+    return stages, accuracy
+
+def engine_spec(label):
+    """Engine config for a --engines label: the ocr_config.json entry if it names that engine, else the bare name.
+    'onnx-int8' is the ONNX engine with its INT8 models."""
+    name, int8 = (label[:-len('-int8')], True) if label.endswith('-int8') else (label, False)
+    configured = realtime_ocr.load_engine_config()
+    spec = dict(configured) if isinstance(configured, dict) and configured.get('name') == name else {'name': name}
+    if int8: spec['int8'] = True
+    return spec
+
+def print_engine_table(results):
+    """Per-stage p50/p90 and accuracy of each engine, side by side."""
+    labels = list(results)
+    print(f"\n{'':<12}" + "".join(f"{label:>22}" for label in labels))
+    for stage in ('ocr', 'total'):
+        print(f"{stage + ' p50/p90':<12}" + "".join(f"{results[l]['stages'][stage]['p50_ms']:.1f}/{results[l]['stages'][stage]['p90_ms']:.1f}".rjust(22) for l in labels))
+    for metric in ('hit@1', 'hit@5'):
+        print(f"{metric:<12}" + "".join(f"{results[l]['accuracy'][metric]!s:>22}" for l in labels))
+
+def compare_reports(report, baseline):
+    """Prints per-stage p50/p90 and accuracy next to a previous report."""
+    print(f"\n{'stage':<12}{'p50 base':>10}{'p50 now':>10}{'p90 base':>10}{'p90 now':>10}")
+    for stage, now in report['stages'].items():
+        old = baseline.get('stages', {}).get(stage)
+        if not old: continue
+        print(f"{stage:<12}{old['p50_ms']:>10.1f}{now['p50_ms']:>10.1f}{old['p90_ms']:>10.1f}{now['p90_ms']:>10.1f}")
+    for metric in ('hit@1', 'hit@5'):
+        print(f"{metric:<12}{baseline.get('accuracy', {}).get(metric)!s:>10} -> {report['accuracy'].get(metric)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency/accuracy benchmark: synthetic screenshots -> preprocess -> OCR -> clean -> match")
+    parser.add_argument('--bank', default=DEFAULT_BANK_FILE, help="Question bank JSON to sample and render from")
+    parser.add_argument('--db', nargs='?', const='questions.db', help="Match against questions.db (QuestionDB) instead of indexing --bank")
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help="Number of questions to render")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frames-dir', help="Directory for the rendered PNGs (reused if it already has ground_truth.json); default: a temp dir")
+    parser.add_argument('--font', help="TrueType/TTC font with CJK glyphs")
+    parser.add_argument('--font-size', type=int, default=FONT_SIZE)
+    parser.add_argument('--preprocess', choices=('auto',) + realtime_ocr.PREPROCESS_STRATEGIES, default='adaptive', help="Strategy passed to preprocess_screen_capture; auto = calibrate on the first frame")
+    parser.add_argument('--normalize', action=argparse.BooleanOptionalAction, default=realtime_ocr.PREPROCESS_NORMALIZE_ENABLED, help="Crop and downscale to the target text height before detection")
+    parser.add_argument('--line-cache', action='store_true', help="Recognize through IncrementalRecognizer like the live loop")
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--details', action='store_true', help="Include per-frame rows in the report")
+    parser.add_argument('--output', default=DEFAULT_REPORT_FILE)
+    parser.add_argument('--compare', help="Previous report to print side by side")
+    parser.add_argument('--engines', help="Comma-separated OCR engines to run on the same frames (paddle, onnx, onnx-int8); default: the configured engine")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_ocr_') as tmp_dir:
+        frames_dir = args.frames_dir or tmp_dir
+        truth_path = os.path.join(frames_dir, GROUND_TRUTH_FILE)
+        if os.path.exists(truth_path):
+            with open(truth_path, 'r', encoding='utf-8') as f: truth = json.load(f)
+            print(f"Reusing {len(truth)} rendered frames in {frames_dir}.")
+        else:
+            questions = sample_questions(args.bank, args.samples, args.seed)
+            render_start = time.perf_counter()
+            truth = generate_frames(questions, frames_dir, find_font(args.font), args.font_size)
+            print(f"Rendered {len(truth)} frames into {frames_dir} in {time.perf_counter() - render_start:.1f} s.")
+
+        index = QuestionDB(args.db) if args.db else QuestionIndex.from_json_file(args.bank)
+        engine_results = {}
+        for label in [label.strip() for label in args.engines.split(',') if label.strip()] if args.engines else [None]:
+            if not realtime_ocr.initialize_ocr(engine_spec(label) if label else None): sys.exit(1)
+            timings, rows, strategy = run_replay(frames_dir, index, truth, args.top_k, args.preprocess, args.normalize, args.line_cache)
+            stages, accuracy = summarize(timings, rows)
+            engine_results[label or realtime_ocr.ocr_engine.name] = {'engine': realtime_ocr.ocr_engine.describe(), 'preprocess': strategy, 'stages': stages, 'accuracy': accuracy, 'rows': rows}
+
+    # The first engine is the report's headline (what --compare reads)
+    headline = next(iter(engine_results.values()))
+    stages, accuracy, rows = headline['stages'], headline['accuracy'], headline['rows']
+    report = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'settings': {'bank': args.db or args.bank, 'frames': len(rows), 'preprocess': headline['preprocess'], 'normalize': args.normalize, 'line_cache': args.line_cache,
+                     'top_k': args.top_k, 'font_size': args.font_size, 'ocr_lang': realtime_ocr.OCR_LANG, 'use_gpu': realtime_ocr.USE_GPU,
+                     'cpu_threads': realtime_ocr.OCR_CPU_THREADS, 'mkldnn': realtime_ocr.OCR_ENABLE_MKLDNN, 'engine': headline['engine']},
+        'stages': stages,
+        'accuracy': accuracy,
+    }
+    if len(engine_results) > 1: report['engines'] = {label: {k: v for k, v in result.items() if k != 'rows'} for label, result in engine_results.items()}
+    if args.details: report['frames'] = rows
+
+    print(f"\n{'stage':<12}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms, {len(rows)} frames)")
+    for stage, s in stages.items():
+        print(f"{stage:<12}{s['mean_ms']:>9.1f}{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+    print(f"hit@1 {accuracy['hit@1']}, hit@5 {accuracy['hit@5']}, frames with no text: {accuracy['empty_text']}")
+    if len(engine_results) > 1: print_engine_table(engine_results)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f: compare_reports(report, json.load(f))
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"Report written to {args.output}")
@@ -3,7 +3,43 @@ import json
 import re
 import os
 import glob  # 用于查找文件
+import math
+import hashlib
+import difflib
+import gzip
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from bs4 import BeautifulSoup
+from lxml import etree
+import question_db
+
+try:
+    import brotli  # 可选依赖: 安装后额外生成 .br 预压缩文件
+except ImportError:
+    brotli = None
+
+# --- 增量提取配置 ---
+MANIFEST_FILE = 'extraction_manifest.json'  # 按输出目标 (模式 + 路径) 分别记录每个源 HTML 的路径、大小、修改时间和内容哈希
+HASH_INDEX_FILE = 'question_hash_index.json'  # 已写入输出文件的题目签名哈希索引
+COMPACT_FORMAT = 'ibos-compact-v1'  # 紧凑输出格式的版本标识，search_questions.html 据此解码
+COMPACT_FIELDS = ('id', 'number', 'type', 'text', 'options', 'student_answer', 'correct_answer', 'analysis')  # bank_name 按题库只存一次
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9  # 11 压缩率略高但慢得多
+FUSE_VERSION = '6.6.2'  # 与 search_worker.js 加载的 Fuse.js 版本一致，版本不符时页面会自行重建索引
+FUSE_INDEX_FORMAT = 'fuse-index-v1'
+FUSE_KEYS = (('text', 0.7), ('options', 0.5), ('correct_answer', 0.3), ('analysis', 0.2), ('bank_name', 0.4), ('type', 0.1))  # 页面搜索字段及权重
+
+# --- 近似去重配置 (MinHash + LSH) ---
+NEAR_DUP_THRESHOLD = 0.9  # 规范化后 题干+选项 的字符 3-gram 集合 Jaccard 相似度达到该值即视为同一题；0 表示关闭
+NEAR_DUP_KEEP = 'answer'  # 每组近似重复保留哪一条: 'answer' 优先有正确答案、其次有解析和我的答案的记录；'first' 保留排序后的第一条
+NEAR_DUP_SAME_BANK_ONLY = False  # True 时只合并同一题库 (bank_name) 内的近似重复
+NEAR_DUP_REPORT_FILE = 'near_duplicate_report.json'  # 被合并的重复组报告，写在输出文件旁
+MINHASH_PERMUTATIONS = 64  # MinHash 签名长度 (候选对随后用精确 Jaccard 验证，64 已足够)
+SHINGLE_SIZE = 3
+LSH_MIN_RECALL = 0.95  # 相似度恰好等于阈值的一对题目成为 LSH 候选的最低概率，据此选择分带数
+NEAR_DUP_KEY_CHARS_RE = re.compile(r'[0-9a-z不非否没未错]')  # 两个题干的字符级差异中含有数字、字母或否定词时不合并 (如 FDM/TDM、10/20、正确/不正确)
+MISSING_VALUES = (None, '', '未提供', '无', '内容未找到')  # parse_question_item 对缺失字段使用的占位值
 
 # --- Functions from extract_questions.py ---
 def clean_text(text):
@@ -23,92 +59,150 @@ def get_bank_name_from_filepath(filepath):
     name_part = os.path.splitext(base_name)[0]
     return name_part if name_part else "未知题库"
 
+def parse_question_item(item, bank_name, index):
+    """从一个 div.question-item 节点提取题目字典，出错时返回 None。"""
+    question_data = {'bank_name': bank_name}
+    try:
+        question_data['id'] = item.get('id', f'unknown_{bank_name}_{index}')
+        type_tag = item.find('p', class_='question-item__type')
+        q_num, q_type = None, "未知类型"
+        if type_tag:
+            type_text = clean_text(type_tag.get_text(strip=True))
+            match = re.match(r'(\d+)\.【(\S+)】', type_text)
+            if match:
+                q_num, q_type = int(match.group(1)), match.group(2)
+            else:
+                num_match = re.match(r'(\d+)\.', type_text)
+                if num_match:
+                    q_num = int(num_match.group(1))
+                q_type = type_text
+        question_data['number'] = q_num
+        question_data['type'] = q_type
+        content_tag = item.find('div', class_='question-item__content')
+        question_data['text'] = clean_text(content_tag.get_text(separator='\n', strip=True)) if content_tag else "内容未找到"
+        options_list = []
+        options_ul = item.find('ul', class_='question-item__option')
+        if options_ul:
+            options_li = options_ul.find_all('li')
+            for li in options_li:
+                 option_full_text = clean_text(li.get_text(strip=True))
+                 options_list.append(option_full_text)
+        question_data['options'] = options_list
+        answer_div = item.find('div', class_='stu-answer')
+        student_answer, correct_answer = "未提供", "未提供"
+        if answer_div:
+            student_ans_span = answer_div.find('span', string=lambda t: t and '我的答案：' in t)
+            if student_ans_span and student_ans_span.find('b'):
+                 student_answer = clean_text(student_ans_span.find('b').get_text(strip=True))
+            correct_ans_span = answer_div.find('span', class_='true-answer')
+            if correct_ans_span and correct_ans_span.find('b'):
+                correct_answer = clean_text(correct_ans_span.find('b').get_text(strip=True))
+            elif correct_ans_span:
+                correct_answer_raw = clean_text(correct_ans_span.get_text(strip=True))
+                match_ans = re.search(r'正确答案：(.*)', correct_answer_raw)
+                correct_answer = match_ans.group(1).strip() if match_ans else correct_answer_raw
+        question_data['student_answer'] = student_answer
+        question_data['correct_answer'] = correct_answer
+        analysis_tag = item.find('div', class_='analysis')
+        analysis_text = ""
+        if analysis_tag:
+            analysis_content = analysis_tag.find('div', class_='analysis-content')
+            if analysis_content:
+                 analysis_text = clean_text(analysis_content.get_text(separator='\n', strip=True))
+            else:
+                 base_text_tag = analysis_tag.find('p')
+                 if base_text_tag and "本题解析" in base_text_tag.get_text():
+                    analysis_span = base_text_tag.find('span')
+                    if analysis_span:
+                        analysis_text = clean_text(analysis_span.get_text(strip=True))
+                    else:
+                        analysis_text = clean_text(base_text_tag.get_text(strip=True))
+                        analysis_text = re.sub(r'^本题解析\s*：【无】', '', analysis_text).strip()
+                 else:
+                      analysis_text = clean_text(analysis_tag.get_text(separator='\n', strip=True))
+                      analysis_text = re.sub(r'本题解析.*$', '', analysis_text).strip()
+        question_data['analysis'] = analysis_text if analysis_text else "无"
+        return question_data
+    except Exception as e:
+        print(f"   处理问题项时出错 ({bank_name} - ID: {item.get('id', 'N/A')}): {e}")
+        return None
+
 def extract_questions_from_html(html_filepath, bank_name):
-    """从单个HTML文件提取问题数据，并标记题库名称。"""
+    """从单个HTML文件提取问题数据，并标记题库名称。文件缺失或读取失败时返回 None。"""
     extracted_data = []
     print(f"   正在处理 HTML 文件: {html_filepath} (题库: {bank_name})")
     if not os.path.exists(html_filepath):
         print(f"   错误: 文件未找到。")
-        return []
+        return None
     try:
         with open(html_filepath, 'r', encoding='utf-8') as f:
             html_content = f.read()
     except Exception as e:
         print(f"   读取文件时出错: {e}")
-        return []
+        return None
 
     soup = BeautifulSoup(html_content, 'lxml')
     question_items = soup.find_all('div', class_='question-item')
     print(f"   找到 {len(question_items)} 个潜在问题项。")
 
     for item in question_items:
-        question_data = {'bank_name': bank_name}
-        try:
-            question_data['id'] = item.get('id', f'unknown_{bank_name}_{len(extracted_data)}')
-            type_tag = item.find('p', class_='question-item__type')
-            q_num, q_type = None, "未知类型"
-            if type_tag:
-                type_text = clean_text(type_tag.get_text(strip=True))
-                match = re.match(r'(\d+)\.【(\S+)】', type_text)
-                if match:
-                    q_num, q_type = int(match.group(1)), match.group(2)
-                else:
-                    num_match = re.match(r'(\d+)\.', type_text)
-                    if num_match:
-                        q_num = int(num_match.group(1))
-                    q_type = type_text
-            question_data['number'] = q_num
-            question_data['type'] = q_type
-            content_tag = item.find('div', class_='question-item__content')
-            question_data['text'] = clean_text(content_tag.get_text(separator='\n', strip=True)) if content_tag else "内容未找到"
-            options_list = []
-            options_ul = item.find('ul', class_='question-item__option')
-            if options_ul:
-                options_li = options_ul.find_all('li')
-                for li in options_li:
-                     option_full_text = clean_text(li.get_text(strip=True))
-                     options_list.append(option_full_text)
-            question_data['options'] = options_list
-            answer_div = item.find('div', class_='stu-answer')
-            student_answer, correct_answer = "未提供", "未提供"
-            if answer_div:
-                student_ans_span = answer_div.find('span', string=lambda t: t and '我的答案：' in t)
-                if student_ans_span and student_ans_span.find('b'):
-                     student_answer = clean_text(student_ans_span.find('b').get_text(strip=True))
-                correct_ans_span = answer_div.find('span', class_='true-answer')
-                if correct_ans_span and correct_ans_span.find('b'):
-                    correct_answer = clean_text(correct_ans_span.find('b').get_text(strip=True))
-                elif correct_ans_span:
-                    correct_answer_raw = clean_text(correct_ans_span.get_text(strip=True))
-                    match_ans = re.search(r'正确答案：(.*)', correct_answer_raw)
-                    correct_answer = match_ans.group(1).strip() if match_ans else correct_answer_raw
-            question_data['student_answer'] = student_answer
-            question_data['correct_answer'] = correct_answer
-            analysis_tag = item.find('div', class_='analysis')
-            analysis_text = ""
-            if analysis_tag:
-                analysis_content = analysis_tag.find('div', class_='analysis-content')
-                if analysis_content:
-                     analysis_text = clean_text(analysis_content.get_text(separator='\n', strip=True))
-                else:
-                     base_text_tag = analysis_tag.find('p')
-                     if base_text_tag and "本题解析" in base_text_tag.get_text():
-                        analysis_span = base_text_tag.find('span')
-                        if analysis_span:
-                            analysis_text = clean_text(analysis_span.get_text(strip=True))
-                        else:
-                            analysis_text = clean_text(base_text_tag.get_text(strip=True))
-                            analysis_text = re.sub(r'^本题解析\s*：【无】', '', analysis_text).strip()
-                     else:
-                          analysis_text = clean_text(analysis_tag.get_text(separator='\n', strip=True))
-                          analysis_text = re.sub(r'本题解析.*$', '', analysis_text).strip()
-            question_data['analysis'] = analysis_text if analysis_text else "无"
+        question_data = parse_question_item(item, bank_name, len(extracted_data))
+        if question_data is not None:
             extracted_data.append(question_data)
-        except Exception as e:
-            print(f"   处理问题项时出错 ({bank_name} - ID: {item.get('id', 'N/A')}): {e}")
     print(f"   从该文件成功提取 {len(extracted_data)} 个问题。")
     return extracted_data
 
+def extract_questions_from_html_streaming(html_filepath, bank_name):
+    """低内存版本的 extract_questions_from_html，输出的题目字典与之完全相同。
+
+    使用 lxml iterparse 逐块读取文件，每遇到一个完整的 div.question-item 子树，只将该子树交给
+    BeautifulSoup 解析，随后立即释放已处理的节点，内存占用与单个题目大小相关，而不是整个文件。
+    文件缺失或解析中途出错时返回 None (不返回不完整的结果)。
+    """
+    extracted_data = []
+    print(f"   正在流式处理 HTML 文件: {html_filepath} (题库: {bank_name})")
+    if not os.path.exists(html_filepath):
+        print(f"   错误: 文件未找到。")
+        return None
+    items_found = 0
+    try:
+        for _, element in etree.iterparse(html_filepath, events=('end',), tag='div', html=True, encoding='utf-8', recover=True):
+            if 'question-item' not in (element.get('class') or '').split():
+                continue
+            items_found += 1
+            fragment = etree.tostring(element, encoding='unicode', with_tail=False)
+            item = BeautifulSoup(fragment, 'lxml').find('div', class_='question-item')
+            question_data = parse_question_item(item, bank_name, len(extracted_data))
+            if question_data is not None:
+                extracted_data.append(question_data)
+            # 释放已处理的子树及其之前的兄弟节点
+            element.clear()
+            parent = element.getparent()
+            while parent is not None and element.getprevious() is not None:
+                del parent[0]
+    except Exception as e:
+        print(f"   流式解析文件时出错: {e}")
+        return None
+    print(f"   找到 {items_found} 个潜在问题项。")
+    print(f"   从该文件成功提取 {len(extracted_data)} 个问题。")
+    return extracted_data
+
+def _extract_file_task(task):
+    """进程池工作函数: (文件路径, 题库名称, 是否流式解析) -> 题目列表。"""
+    html_filepath, bank_name, streaming = task
+    extractor = extract_questions_from_html_streaming if streaming else extract_questions_from_html
+    return extractor(html_filepath, bank_name)
+
+def extract_files(html_files, workers=1, streaming=False):
+    """提取多个 HTML 文件，按输入顺序返回每个文件的题目列表 (失败的文件为 None)。workers > 1 时使用进程池并行解析。"""
+    tasks = [(html_file, get_bank_name_from_filepath(html_file), streaming) for html_file in html_files]
+    if workers <= 1 or len(tasks) <= 1:
+        return [_extract_file_task(task) for task in tasks]
+    workers = min(workers, len(tasks))
+    print(f"   使用 {workers} 个进程并行解析 {len(tasks)} 个文件...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_extract_file_task, tasks))
+
 # --- Function for reading existing JSON data ---
 def load_existing_json(filepath):
     """如果存在且有效，则从文件加载现有JSON数据。"""
@@ -134,15 +228,204 @@ def load_existing_json(filepath):
         return []
 
 # --- Function for merging and deduplicating data ---
-def merge_and_deduplicate_data(all_data, output_file):
-    """合并并去重一个JSON对象列表，保存到输出文件。"""
+# --- 近似重复检测 (MinHash + LSH) ---
+_NEAR_DUP_STRIP_RE = re.compile(r'[\W_]+')
+_SHINGLE_BASE = np.uint64(1000003)
+_MIX_MULTIPLIER = np.uint64(0xff51afd7ed558ccd)
+NEAR_DUP_KEEP_POLICIES = {
+    'answer': lambda item: tuple(item.get(field) not in MISSING_VALUES for field in ('correct_answer', 'analysis', 'student_answer')),
+    'first': lambda item: (),
+}
+
+def near_dup_stem(item):
+    """规范化后的题干 (去掉空白和标点并转小写，保留数字)。"""
+    return _NEAR_DUP_STRIP_RE.sub('', str(item.get('text'))).lower()
+
+def near_dup_text(item):
+    """近似去重比较的内容: 规范化后的 题干 + 选项。题干缺失时返回空串，不参与比较。"""
+    if item.get('text') in MISSING_VALUES:
+        return ''
+    options = item.get('options')
+    if isinstance(options, list):
+        options = ''.join(str(option) for option in options)
+    return near_dup_stem(item) + _NEAR_DUP_STRIP_RE.sub('', str(options or '')).lower()
+
+def stems_differ_in_key_chars(a, b):
+    """两个规范化题干的字符级差异中是否含有关键字符 (NEAR_DUP_KEY_CHARS_RE)。
+
+    短题干只差一个关键字符时 3-gram Jaccard 仍可能很高 (“FDM是( )多路复用技术” 与 “TDM是...” 为 0.90)，单靠相似度无法区分。
+    """
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return any(NEAR_DUP_KEY_CHARS_RE.search(a[i1:i2] + b[j1:j2]) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal')
+
+def answer_value(item):
+    """用于比较的正确答案，缺失时为 None。"""
+    answer = item.get('correct_answer')
+    return None if answer in MISSING_VALUES else json.dumps(answer, ensure_ascii=False)
+
+def shingle_hashes_batch(texts, size=SHINGLE_SIZE):
+    """所有文本的字符 size-gram 哈希 (uint32，未去重)，按码点一次性向量化计算；短于 size 的文本整体作为一个 gram。
+
+    返回 (哈希, 每个文本的 gram 数)，哈希按文本顺序连续排列。texts 中不能有空串。
+    """
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    widths = np.minimum(lengths, size)
+    counts = lengths - widths + 1
+    owner = np.repeat(np.arange(len(texts)), counts)
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + (np.cumsum(lengths) - lengths)[owner]
+    hashes = np.zeros(len(positions), dtype=np.uint64)
+    for k in range(size):
+        hashes = np.where(k < widths[owner], hashes * _SHINGLE_BASE + codes[np.minimum(positions + k, len(codes) - 1)], hashes)
+    hashes ^= hashes >> np.uint64(33)  # 打散多项式哈希的结构，使 MinHash 的线性置换接近随机
+    hashes *= _MIX_MULTIPLIER
+    hashes ^= hashes >> np.uint64(33)
+    return (hashes >> np.uint64(32)).astype(np.uint32), counts
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """单个文本去重后的 gram 哈希集合，用于精确计算 Jaccard 相似度。"""
+    return np.unique(shingle_hashes_batch([text], size)[0])
+
+def minhash_signatures(texts, num_perm=MINHASH_PERMUTATIONS, seed=1, chunk_size=10000):
+    """每个文本的 MinHash 签名 (len(texts) x num_perm 的 uint32 矩阵)。
+
+    第 k 个置换为 h -> a_k * h + b_k (mod 2^32)，a_k 为奇数时是 uint32 上的双射；按 chunk_size 个文本分块以限制内存。
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64).astype(np.uint32) | np.uint32(1)
+    b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64).astype(np.uint32)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for chunk_start in range(0, len(texts), chunk_size):
+        hashes, counts = shingle_hashes_batch(texts[chunk_start:chunk_start + chunk_size])
+        offsets = np.cumsum(counts) - counts
+        permuted = np.empty_like(hashes)
+        for k in range(num_perm):
+            np.multiply(hashes, a[k], out=permuted)
+            np.add(permuted, b[k], out=permuted)
+            signatures[chunk_start:chunk_start + len(counts), k] = np.minimum.reduceat(permuted, offsets)
+    return signatures
+
+def lsh_params(num_perm, threshold, min_recall=LSH_MIN_RECALL):
+    """选择分带 (bands x rows <= num_perm): 每带行数越多候选对越少，取在阈值处仍有 min_recall 召回率的最大行数。"""
+    bands, rows = num_perm, 1
+    for r in range(1, num_perm + 1):
+        b = num_perm // r
+        if 1 - (1 - threshold ** r) ** b >= min_recall:
+            bands, rows = b, r
+    return bands, rows
+
+def jaccard(a, b):
+    return len(np.intersect1d(a, b, assume_unique=True)) / len(np.union1d(a, b))
+
+def find_near_duplicate_clusters(items, threshold=NEAR_DUP_THRESHOLD, same_bank_only=NEAR_DUP_SAME_BANK_ONLY):
+    """返回近似重复组列表，每组为 [(条目下标, 与组内相连题目的相似度), ...] (至少两条)。
+
+    规范化文本完全相同的条目直接归为一组；其余不同文本只计算一次 MinHash 签名，按 LSH 分带
+    分桶，只对落入同一桶的候选对计算精确 Jaccard 相似度，因此耗时近似线性而不是两两比较。
+    相似度达到阈值的候选对，题干的字符级差异中含有关键字符时仍不合并 (见 stems_differ_in_key_chars)。
+    """
+    groups = {}  # (题库, 规范化文本) -> 条目下标
+    for i, item in enumerate(items):
+        text = near_dup_text(item)
+        if text:
+            groups.setdefault((item.get('bank_name') if same_bank_only else None, text), []).append(i)
+    keys = list(groups)
+    stems = [near_dup_stem(items[groups[key][0]]) for key in keys]
+    parent = list(range(len(keys)))
+    similarity = {}  # 文本下标 -> 合并时的相似度
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    signatures = minhash_signatures([text for _, text in keys])
+    bands, rows = lsh_params(signatures.shape[1], threshold)
+    bank_ids = np.unique([str(bank) for bank, _ in keys], return_inverse=True)[1].astype(np.uint64)  # 不限同题库时全为 0
+    shingles = {}
+    for band in range(bands):
+        # 每带的签名 (及题库) 压成一个 64 位桶键，排序后相邻相等的即同一个桶；桶键碰撞只会多出候选对
+        bucket_keys = bank_ids.copy()
+        for column in signatures[:, band * rows:(band + 1) * rows].T:
+            bucket_keys = bucket_keys * _SHINGLE_BASE + column
+        order = np.argsort(bucket_keys, kind='stable')
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(bucket_keys[order])) + 1, [len(order)]))
+        for bucket in np.flatnonzero(np.diff(bounds) > 1):
+            members = order[bounds[bucket]:bounds[bucket + 1]].tolist()
+            for j, x in enumerate(members):
+                for y in members[:j]:
+                    rx, ry = find(x), find(y)
+                    if rx == ry:
+                        continue
+                    for t in (x, y):
+                        if t not in shingles:
+                            shingles[t] = shingle_hashes(keys[t][1])
+                    score = jaccard(shingles[x], shingles[y])
+                    if score >= threshold and not stems_differ_in_key_chars(stems[x], stems[y]):
+                        parent[rx] = ry
+                        similarity[x] = max(similarity.get(x, 0.0), score)
+                        similarity[y] = max(similarity.get(y, 0.0), score)
+
+    clusters = {}
+    for t, key in enumerate(keys):
+        clusters.setdefault(find(t), []).extend((i, similarity.get(t, 1.0)) for i in groups[key])
+    return [members for members in clusters.values() if len(members) > 1]
+
+def split_by_answer(members, items):
+    """按正确答案拆分一组近似重复: 正确答案不同的题目从不合并。
+
+    组内只有一种正确答案时，缺少答案的题目并入该组；有多种时，缺少答案的题目无法判断归属，单独成组。
+    """
+    by_answer = {}
+    for member in members:
+        by_answer.setdefault(answer_value(items[member[0]]), []).append(member)
+    if len(by_answer) == 2 and None in by_answer:
+        return [members]
+    return [group for group in by_answer.values() if len(group) > 1]
+
+def remove_near_duplicates(items, threshold=NEAR_DUP_THRESHOLD, keep=NEAR_DUP_KEEP, same_bank_only=NEAR_DUP_SAME_BANK_ONLY):
+    """每组近似重复按 keep 策略只保留一条 (同等条件下保留排序靠前的)。返回 (保留的条目, 被合并的条目, 报告)。
+
+    正确答案不同的题目不会合并 (见 split_by_answer)。
+    """
+    rank = NEAR_DUP_KEEP_POLICIES[keep]
+    clusters = [group for members in find_near_duplicate_clusters(items, threshold, same_bank_only) for group in split_by_answer(members, items)]
+    summary = lambda i: {field: items[i].get(field) for field in ('bank_name', 'id', 'number', 'correct_answer')}
+    dropped, report = set(), []
+    for members in clusters:
+        kept = max(members, key=lambda m: (rank(items[m[0]]), -m[0]))[0]
+        dropped.update(i for i, _ in members if i != kept)
+        report.append({
+            'kept': dict(summary(kept), text=items[kept].get('text')),
+            'merged': [dict(summary(i), similarity=round(score, 4)) for i, score in members if i != kept],
+        })
+    report.sort(key=lambda cluster: len(cluster['merged']), reverse=True)
+    return [item for i, item in enumerate(items) if i not in dropped], [items[i] for i in sorted(dropped)], report
+
+def write_near_duplicate_report(report, report_file, threshold, keep):
+    try:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump({'threshold': threshold, 'keep': keep, 'clusters': len(report), 'merged': sum(len(c['merged']) for c in report),
+                       'groups': report}, f, indent=2, ensure_ascii=False)
+        print(f"  近似重复报告已写入: {report_file}")
+    except Exception as e:
+        print(f"  写入近似重复报告 {report_file} 时出错: {e}")
+
+
+def merge_and_deduplicate_data(all_data, output_file, near_dup_threshold=NEAR_DUP_THRESHOLD, keep=NEAR_DUP_KEEP, report_file=None):
+    """合并并去重一个JSON对象列表，保存到输出文件。
+
+    先去掉完全重复的条目，再 (near_dup_threshold > 0 时) 合并近似重复的题目，报告写到 report_file
+    (默认为输出文件旁的 NEAR_DUP_REPORT_FILE)。返回被近似去重合并掉的条目，供签名索引记录。
+    """
     if not all_data:
         print("  没有数据可供处理（合并或去重）。跳过保存步骤。")
         # 如果需要，可以删除空输出文件
         # if os.path.exists(output_file):
         #    os.remove(output_file)
         #    print(f"  已移除空输出文件: {output_file}")
-        return
+        return []
 
     print("-" * 20)
     print(f"开始对总共 {len(all_data)} 条数据进行去重...")
@@ -174,6 +457,18 @@ def merge_and_deduplicate_data(all_data, output_file):
             print(f"    错误: 无法序列化条目进行去重检查 (可能包含不支持的类型)，已跳过: {item} - 错误: {e}")
 
     print(f"去重完成。移除了 {duplicates_count} 条完全重复的数据。")
+
+    merged = []
+    if near_dup_threshold > 0 and unique_data:
+        unique_data, merged, report = remove_near_duplicates(unique_data, near_dup_threshold, keep)
+        print(f"近似去重 (阈值 {near_dup_threshold}, 保留策略 '{keep}'): {len(report)} 组近似重复，合并掉 {len(merged)} 条。")
+        for cluster in report[:5]:  # 合并条数最多的几组
+            kept = cluster['kept']
+            merged_ids = ', '.join(f"{m['bank_name']}#{m['id']} ({m['similarity']})" for m in cluster['merged'][:3])
+            print(f"    [{kept['bank_name']}] {str(kept['text'])[:40]!r} <- {merged_ids}")
+        if report:
+            write_near_duplicate_report(report, report_file or os.path.join(os.path.dirname(os.path.abspath(output_file)), NEAR_DUP_REPORT_FILE),
+                                        near_dup_threshold, keep)
     print(f"最终唯一数据数量: {len(unique_data)} 条。")
 
     # --- 写入输出文件 ---
@@ -184,23 +479,406 @@ def merge_and_deduplicate_data(all_data, output_file):
         print(f"成功将 {len(unique_data)} 条唯一数据写入到文件: {output_file}")
     except Exception as e:
         print(f"写入输出文件 {output_file} 时出错: {e}")
+        raise  # 调用方据此不更新文件清单
+    return merged
+
+
+# --- 增量提取: 文件清单 (manifest) ---
+def file_content_hash(filepath, chunk_size=1 << 20):
+    """计算文件内容的 SHA-256 哈希。"""
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_fingerprint(filepath):
+    """返回文件的 '大小:修改时间' 指纹，文件不存在时返回 None。"""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def load_json_file(filepath, default):
+    """读取辅助 JSON 文件（清单/索引），不存在或损坏时返回默认值。"""
+    if not os.path.exists(filepath):
+        return default
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, type(default)) else default
+    except Exception as e:
+        print(f"  警告: 读取 {filepath} 失败 ({e})，将重新生成。")
+        return default
+
+def save_json_file(data, filepath):
+    try:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"  写入 {filepath} 时出错: {e}")
+
+def check_manifest_entry(html_filepath, manifest):
+    """判断源文件自上次提取后是否未变化。
+
+    先比较大小和修改时间（无需读取文件）；只有两者变化时才计算内容哈希。
+    返回 (是否未变化, 新的清单条目)。
+    """
+    st = os.stat(html_filepath)
+    entry = manifest.get(os.path.abspath(html_filepath))
+    if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+        return True, entry
+    content_hash = file_content_hash(html_filepath)
+    new_entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': content_hash}
+    if entry and entry.get('sha256') == content_hash:
+        new_entry['count'] = entry.get('count')
+        return True, new_entry  # 仅被 touch 过，内容相同
+    return False, new_entry
+
+def manifest_key(mode, target):
+    """清单按输出目标分别记录: JSON 与 SQLite 模式、不同的输出文件各有一份，互不影响。"""
+    return f"{mode}:{os.path.abspath(target)}"
+
+def load_manifest(manifest_file, key, target):
+    """返回该输出目标上次记录的文件清单 {源文件: 条目}。
+
+    输出文件缺失，或其指纹与清单记录的不一致 (被删除、移动或在清单之外被修改) 时返回 None，调用方应完整重建。
+    """
+    record = load_json_file(manifest_file, {}).get(key)
+    fingerprint = file_fingerprint(target)
+    if fingerprint is None or (isinstance(record, dict) and record.get('output_fingerprint') != fingerprint):
+        return None
+    return record.get('files', {}) if isinstance(record, dict) else {}
+
+def save_manifest(manifest_file, key, target, files):
+    """记录输出目标的当前指纹和已写入该目标的源文件，保留其他目标的记录。"""
+    manifests = load_json_file(manifest_file, {})
+    manifests = {k: v for k, v in manifests.items() if isinstance(v, dict) and 'files' in v}  # 丢弃旧格式 (按源文件平铺) 的条目
+    manifests[key] = {'output_fingerprint': file_fingerprint(target), 'files': files}
+    save_json_file(manifests, manifest_file)
+
+# --- 增量提取: 题目签名索引 ---
+def record_signature(item):
+    """与 merge_and_deduplicate_data 相同的完全重复判定，压缩为定长哈希。"""
+    canonical = json.dumps(item, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+def load_hash_index(index_path, output_file):
+    """加载签名索引；若索引缺失或与输出文件不一致，则从输出文件重建一次。"""
+    index = load_json_file(index_path, {})
+    if index.get('output_fingerprint') == file_fingerprint(output_file) and isinstance(index.get('signatures'), list):
+        return set(index['signatures'])
+    print(f"  签名索引缺失或已过期，正在从 {output_file} 重建...")
+    signatures = set()
+    for item in load_existing_json(output_file):
+        if isinstance(item, dict):
+            try:
+                signatures.add(record_signature(item))
+            except TypeError:
+                pass
+    return signatures
+
+def save_hash_index(signatures, index_path, output_file):
+    save_json_file({'output_fingerprint': file_fingerprint(output_file), 'signatures': sorted(signatures)}, index_path)
+
+def append_records_to_json(output_file, records):
+    """将记录追加到已有的 JSON 列表文件末尾（就地写入，不重写已有内容），保持 indent=4 格式。"""
+    with open(output_file, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        tail_size = min(end, 4096)
+        f.seek(end - tail_size)
+        tail = f.read(tail_size)
+        close = tail.rstrip().rfind(b']')
+        if close < 0:
+            raise ValueError(f"{output_file} 的顶层结构不是 JSON 列表")
+        before = tail[:close].rstrip()
+        is_empty = before.endswith(b'[')
+        chunks = []
+        for item in records:
+            item_json = json.dumps(item, indent=4, ensure_ascii=False)
+            chunks.append('\n'.join('    ' + line for line in item_json.split('\n')))
+        text = ('\n' if is_empty else ',\n') + ',\n'.join(chunks) + '\n]'
+        f.seek(end - tail_size + len(before))
+        f.write(text.encode('utf-8'))
+        f.truncate()
+
+def save_merged_hash_index(merged, index_path, output_file):
+    """完整合并后重建签名索引，并加入被近似去重合并掉的条目，使增量提取不会把它们再次追加回来。"""
+    signatures = load_hash_index(index_path, output_file)
+    for item in merged:
+        signatures.add(record_signature(item))
+    save_hash_index(signatures, index_path, output_file)
+
+def upsert_new_questions(new_records, output_file, index_path=HASH_INDEX_FILE, **merge_options):
+    """只对新提取的题目去重并追加到输出文件，耗时与新题目数量成正比，而不是与题库总量成正比。
+
+    近似去重只在完整合并时进行 (首次运行或 --full)；merge_options 传给 merge_and_deduplicate_data。
+    返回追加到输出末尾的条目数；输出被完整重写时返回 None。
+    """
+    if not os.path.exists(output_file):
+        # 首次运行: 走完整的合并去重流程，并建立索引
+        merged = merge_and_deduplicate_data(new_records, output_file, **merge_options)
+        if os.path.exists(output_file):
+            save_merged_hash_index(merged, index_path, output_file)
+        return None
+    signatures = load_hash_index(index_path, output_file)
+    to_append = []
+    duplicates_count = 0
+    for item in new_records:
+        try:
+            signature = record_signature(item)
+        except TypeError as e:
+            print(f"    错误: 无法序列化条目进行去重检查，已跳过: {item} - 错误: {e}")
+            continue
+        if signature in signatures:
+            duplicates_count += 1
+            continue
+        signatures.add(signature)
+        to_append.append(item)
+    print(f"增量去重完成。新数据 {len(new_records)} 条，其中 {duplicates_count} 条已存在。")
+    if to_append:
+        try:
+            append_records_to_json(output_file, to_append)
+            print(f"成功将 {len(to_append)} 条新数据追加到文件: {output_file}")
+        except Exception as e:
+            print(f"追加写入 {output_file} 时出错 ({e})，改为完整合并。")
+            merge_and_deduplicate_data(load_existing_json(output_file) + to_append, output_file)
+            save_hash_index(signatures, index_path, output_file)
+            return None
+    save_hash_index(signatures, index_path, output_file)
+    return len(to_append)
+
+
+# --- SQLite 存储 ---
+def write_to_sqlite(new_records, db_path, json_path, export_json=False):
+    """将新提取的题目 upsert 到 SQLite 数据库；首次创建数据库时先导入已有的 JSON 题库。"""
+    is_new_db = not os.path.exists(db_path)
+    conn = question_db.connect(db_path)
+    try:
+        if is_new_db and os.path.exists(json_path):
+            existing_data = load_existing_json(json_path)
+            inserted, updated, _ = question_db.upsert_questions(conn, existing_data)
+            print(f"  新建数据库 {db_path}，已导入现有 JSON 题库 {inserted} 条 (其中 {updated} 条同键记录被更新)。")
+        if new_records:
+            inserted, updated, unchanged = question_db.upsert_questions(conn, new_records)
+            print(f"写入数据库 {db_path}: 新增 {inserted} 条，更新 {updated} 条，未变化 {unchanged} 条。")
+        else:
+            print(f"\n没有新数据，数据库 {db_path} 保持不变。")
+        if export_json:
+            count = question_db.export_json(conn, json_path)
+            print(f"已从数据库导出 {count} 条数据到 {json_path}")
+        # 将 WAL 写回主数据库文件，使 realtime_ocr.py 能通过文件修改时间察觉题库变化
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+# --- 面向浏览器的派生文件: 紧凑格式与预压缩副本 ---
+def compact_output_path(output_file):
+    return os.path.splitext(output_file)[0] + '.compact.json'
+
+def fuse_index_path(output_file):
+    return os.path.splitext(output_file)[0] + '.fuse-index.json'
+
+def write_compact_json(records, compact_file):
+    """写出紧凑格式: 无缩进，每个题库只存一次 bank_name，题型存为题库内的下标，题目存为按 COMPACT_FIELDS 排列的数组。
+
+    返回按页面解码顺序 (按题库分组) 排列的题目列表，预建索引必须使用同样的顺序。
+    """
+    banks = {}
+    for item in records:
+        if not isinstance(item, dict):
+            continue
+        bank = banks.setdefault(item.get('bank_name'), {'bank_name': item.get('bank_name'), 'types': [], 'questions': []})
+        row = [item.get(field) for field in COMPACT_FIELDS]
+        q_type = item.get('type')
+        if q_type not in bank['types']:
+            bank['types'].append(q_type)
+        row[COMPACT_FIELDS.index('type')] = bank['types'].index(q_type)
+        bank['questions'].append(row)
+        bank.setdefault('items', []).append(item)
+    ordered = [item for bank in banks.values() for item in bank.pop('items')]
+    with open(compact_file, 'w', encoding='utf-8') as f:
+        json.dump({'format': COMPACT_FORMAT, 'fields': list(COMPACT_FIELDS), 'banks': list(banks.values())},
+                  f, ensure_ascii=False, separators=(',', ':'))
+    return ordered
+
+_FUSE_TOKEN_RE = re.compile(r'[^ ]+')  # Fuse.js 字段长度归一化按空格分词
+
+def _fuse_norm(value, cache):
+    """Fuse.js norm(): 1 / sqrt(词数)，保留 3 位小数 (Math.round 为四舍五入)。"""
+    n_tokens = len(_FUSE_TOKEN_RE.findall(value))
+    if n_tokens not in cache:
+        cache[n_tokens] = math.floor(1 / math.sqrt(n_tokens) * 1000 + 0.5) / 1000
+    return cache[n_tokens]
+
+def _fuse_string(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value if isinstance(value, str) else str(value) if isinstance(value, (int, float)) else None
+
+def build_fuse_record(item, doc_index, norm_cache):
+    """与 Fuse.js 6 的 FuseIndex._addObject 输出相同的索引记录。"""
+    record = {'i': doc_index, '$': {}}
+    for key_index, (field, _) in enumerate(FUSE_KEYS):
+        value = item.get(field)
+        if isinstance(value, list):
+            # Fuse 用栈展开数组，子记录顺序因此是倒序的；非字符串元素被忽略
+            sub_records = []
+            stack = [(-1, value)]
+            while stack:
+                nested_index, sub_value = stack.pop()
+                if isinstance(sub_value, str) and sub_value.strip():
+                    sub_records.append({'v': sub_value, 'i': nested_index, 'n': _fuse_norm(sub_value, norm_cache)})
+                elif isinstance(sub_value, list):
+                    stack.extend(enumerate(sub_value))
+            record['$'][str(key_index)] = sub_records
+        else:
+            value = _fuse_string(value)
+            if value and value.strip():
+                record['$'][str(key_index)] = {'v': value, 'n': _fuse_norm(value, norm_cache)}
+    return record
+
+def fuse_keys():
+    """索引中的键定义。权重像 Fuse 的 KeyStore 一样归一化为总和 1 (search_worker.js 自建索引时同样归一化)，两种索引的得分因此相同。"""
+    total_weight = sum(weight for _, weight in FUSE_KEYS)
+    return [{'path': [name], 'id': name, 'weight': weight / total_weight, 'src': name} for name, weight in FUSE_KEYS]
+
+def write_fuse_index(records, source_name, index_file):
+    """写出 Fuse.createIndex(...).toJSON() 等价的预建索引，页面在 Web Worker 中用 Fuse.parseIndex 直接加载。"""
+    norm_cache = {}
+    docs = [item for item in records if isinstance(item, dict)]
+    data = {
+        'format': FUSE_INDEX_FORMAT,
+        'fuse_version': FUSE_VERSION,
+        'source': source_name,  # 索引记录中的 i 对应该文件解码后的题目顺序
+        'count': len(docs),
+        'keys': fuse_keys(),
+        'records': [build_fuse_record(item, doc_index, norm_cache) for doc_index, item in enumerate(docs)],
+    }
+    with open(index_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+def update_fuse_index(records, is_new, source_name, index_file):
+    """增量更新预建索引: 只为新增题目建立记录，已有记录按新的顺序改写下标 i。
+
+    records 为页面解码顺序的全部题目，is_new 标记其中哪些是新增的 (已有题目之间的相对顺序不变)。
+    已有索引缺失或与当前格式、字段、数据文件不符时返回 False，由调用方完整重建。
+    """
+    data = load_json_file(index_file, {})
+    docs = [(item, new) for item, new in zip(records, is_new) if isinstance(item, dict)]
+    old_count = sum(not new for _, new in docs)
+    if (data.get('format') != FUSE_INDEX_FORMAT or data.get('fuse_version') != FUSE_VERSION or data.get('source') != source_name
+            or data.get('keys') != fuse_keys() or data.get('count') != old_count or len(data.get('records', ())) != old_count):
+        return False
+    norm_cache = {}
+    old_records = iter(data['records'])  # 按 i 排序写出
+    index_records = []
+    for doc_index, (item, new) in enumerate(docs):
+        record = build_fuse_record(item, doc_index, norm_cache) if new else next(old_records)
+        record['i'] = doc_index
+        index_records.append(record)
+    data.update(count=len(docs), records=index_records)
+    with open(index_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    return True
+
+def write_compressed_sidecars(filepath):
+    """写出 filepath.gz (以及安装了 brotli 时的 filepath.br)，realtime_ocr.py 的服务器按 Accept-Encoding 直接发送。"""
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    sizes = [f"原始 {len(data) / 1024:.1f} KB"]
+    with open(filepath + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0))  # mtime=0: 内容相同则输出字节相同
+    sizes.append(f"gzip {os.path.getsize(filepath + '.gz') / 1024:.1f} KB")
+    if brotli is not None:
+        with open(filepath + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=BROTLI_QUALITY))
+        sizes.append(f"brotli {os.path.getsize(filepath + '.br') / 1024:.1f} KB")
+    elif os.path.exists(filepath + '.br'):
+        os.remove(filepath + '.br')  # 旧的 .br 已过期，删除以免被误用
+    print(f"  已生成预压缩文件 {os.path.basename(filepath)}: {', '.join(sizes)}")
+
+def write_derived_outputs(output_file, compact=False, appended=None):
+    """输出 JSON 变化后更新紧凑格式 (启用或已存在时)、预建搜索索引和预压缩副本。
+
+    appended 为增量路径追加到输出末尾的条目数: 预建索引只为这些题目建立记录，预压缩副本留给下一次
+    完整重建 (服务器忽略比原文件旧的副本)。为 None 时 (完整合并、首次运行) 全部重新生成。
+    """
+    if not os.path.exists(output_file):
+        return
+    targets = [output_file]
+    records = load_existing_json(output_file)
+    new_ids = {id(item) for item in records[len(records) - appended:]} if appended else set()
+    docs_file = output_file
+    compact_file = compact_output_path(output_file)
+    if compact or os.path.exists(compact_file):
+        records = write_compact_json(records, compact_file)
+        docs_file = compact_file
+        print(f"已写入紧凑格式题库: {compact_file}")
+        targets.append(compact_file)
+    index_file = fuse_index_path(output_file)
+    if appended is not None and update_fuse_index(records, [id(item) in new_ids for item in records], os.path.basename(docs_file), index_file):
+        print(f"已增量更新预建搜索索引: {index_file} (新增 {appended} 条)")
+    else:
+        write_fuse_index(records, os.path.basename(docs_file), index_file)
+        print(f"已写入预建搜索索引: {index_file} (对应 {os.path.basename(docs_file)})")
+    if appended is not None:
+        return
+    targets.append(index_file)
+    for target in targets:
+        try:
+            write_compressed_sidecars(target)
+        except Exception as e:
+            print(f"  生成 {target} 的预压缩文件时出错: {e}")
 
 
 # --- Main Execution - Combined ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从 HTML 题库提取题目，合并去重后写入 JSON。")
+    parser.add_argument('--source-dir', default='.', help="包含 HTML 题库文件的目录 (默认: 当前目录)")
+    parser.add_argument('--output', default='combined_questions_data.json', help="合并去重后的 JSON 输出文件")
+    parser.add_argument('--full', action='store_true', help="忽略文件清单，重新解析所有 HTML 并完整合并去重")
+    parser.add_argument('--workers', type=int, default=1, help="并行解析的进程数 (0 = CPU 核心数，默认 1 即串行)")
+    parser.add_argument('--streaming', action='store_true', help="使用低内存的流式解析器 (lxml iterparse)")
+    parser.add_argument('--sqlite', nargs='?', const=question_db.QUESTION_DB_FILE, help=f"写入 SQLite 数据库而不是 JSON (默认路径: {question_db.QUESTION_DB_FILE})")
+    parser.add_argument('--export-json', action='store_true', help="配合 --sqlite 使用: 写入后从数据库导出 JSON 到 --output，供静态页面使用")
+    parser.add_argument('--compact', action='store_true', help="额外写出紧凑格式的 <输出名>.compact.json (无缩进，题库名/题型只存一次)，供页面优先加载")
+    parser.add_argument('--near-dup-threshold', type=float, default=NEAR_DUP_THRESHOLD, help=f"完整合并时近似去重的 Jaccard 相似度阈值 (0 = 关闭，默认 {NEAR_DUP_THRESHOLD})")
+    parser.add_argument('--near-dup-keep', choices=sorted(NEAR_DUP_KEEP_POLICIES), default=NEAR_DUP_KEEP, help=f"每组近似重复保留哪一条 (默认 {NEAR_DUP_KEEP})")
+    args = parser.parse_args()
+
     # --- 配置区域 ---
     # 包含HTML题库文件的目录
     # '.' 表示当前目录，也可以指定具体路径，如 'C:/Users/YourUser/Documents/QuizFiles'
-    html_source_directory = '.'
+    html_source_directory = args.source_dir
 
     # 合并和去重后的最终JSON输出文件
-    output_json_file = 'combined_questions_data.json'
+    output_json_file = args.output
+    output_dir = os.path.dirname(os.path.abspath(output_json_file))
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE)
+    hash_index_file = os.path.join(output_dir, HASH_INDEX_FILE)
+    merge_options = {'near_dup_threshold': args.near_dup_threshold, 'keep': args.near_dup_keep}
     # --- 配置结束 ---
 
     print("--- 启动 HTML 提取、JSON 合并与去重组合脚本 ---")
+    output_fingerprint_before = file_fingerprint(output_json_file)
 
-    # --- 1. 从 HTML 文件提取数据 ---
+    # --- 1. 从 HTML 文件提取数据 (跳过自上次写入同一输出目标以来未变化的文件) ---
+    target_file, target_mode = (args.sqlite, 'sqlite') if args.sqlite else (output_json_file, 'json')
+    target_key = manifest_key(target_mode, target_file)
+    full = args.full
+    manifest = {} if full else load_manifest(manifest_file, target_key, target_file)
+    if manifest is None:
+        print(f"输出 {target_file} 不存在或已在清单之外被修改，忽略文件清单，按 --full 完整重建。")
+        manifest, full = {}, True
+    new_manifest = {}
+    appended = None  # 增量路径追加到输出末尾的条目数；None 表示输出被完整重写 (或未变化)
+    extracted_entries = {}  # 本次解析成功的文件，写入输出后才加入清单
     newly_extracted_questions = []
+    skipped_files = 0
     # 查找指定目录下的所有 .html 文件
     html_files = glob.glob(os.path.join(html_source_directory, '*.html'))
 
@@ -208,30 +886,67 @@ if __name__ == "__main__":
         print(f"未在目录 {os.path.abspath(html_source_directory)} 中找到 .html 文件。跳过 HTML 提取。")
     else:
         print(f"找到 {len(html_files)} 个 HTML 文件，开始提取...")
+        files_to_extract = []
         for html_file in html_files:
              # 如果是已知的搜索页面，则跳过
              if os.path.basename(html_file) == 'search_questions.html':
                  print(f"--- 跳过已知的搜索页面: {html_file} ---")
                  continue
-             bank_name = get_bank_name_from_filepath(html_file)
-             questions_from_file = extract_questions_from_html(html_file, bank_name)
+             unchanged, entry = check_manifest_entry(html_file, manifest)
+             if unchanged:
+                 new_manifest[os.path.abspath(html_file)] = entry
+                 skipped_files += 1
+                 continue
+             extracted_entries[os.path.abspath(html_file)] = entry
+             files_to_extract.append(html_file)
+
+        workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+        for html_file, questions_from_file in zip(files_to_extract, extract_files(files_to_extract, workers, args.streaming)):
+             if questions_from_file is None:  # 解析失败: 不记入清单，下次运行重试
+                 del extracted_entries[os.path.abspath(html_file)]
+                 continue
+             extracted_entries[os.path.abspath(html_file)]['count'] = len(questions_from_file)
              if questions_from_file:
                  newly_extracted_questions.extend(questions_from_file)
 
         print("-" * 20)
+        if skipped_files:
+            print(f"跳过 {skipped_files} 个自上次提取后未变化的 HTML 文件。")
         if newly_extracted_questions:
             print(f"从 HTML 中提取了 {len(newly_extracted_questions)} 条新问题数据。")
         else:
             print("没有从任何 HTML 文件中提取到新问题。")
 
-    # --- 2. 加载目标 JSON 文件中的现有数据 ---
-    existing_data = load_existing_json(output_json_file)
+    if args.sqlite:
+        # --- 2-4. 写入 SQLite 数据库 (按 bank_name + id 在事务中 upsert) ---
+        write_to_sqlite(newly_extracted_questions, args.sqlite, output_json_file, args.export_json)
+    elif full:
+        # --- 2. 加载目标 JSON 文件中的现有数据 ---
+        existing_data = load_existing_json(output_json_file)
+
+        # --- 3. 合并新数据和现有数据 ---
+        all_data_for_processing = existing_data + newly_extracted_questions
+        print(f"\n合并了现有数据 ({len(existing_data)}) 和新提取的数据 ({len(newly_extracted_questions)})，总共 {len(all_data_for_processing)} 条数据。")
+
+        # --- 4. 对合并后的数据进行去重并保存 ---
+        merged = merge_and_deduplicate_data(all_data_for_processing, output_json_file, **merge_options)
+        if os.path.exists(output_json_file):
+            save_merged_hash_index(merged, hash_index_file, output_json_file)
+    elif newly_extracted_questions:
+        # --- 2-4. 基于签名索引增量去重，只追加新题目 ---
+        appended = upsert_new_questions(newly_extracted_questions, output_json_file, hash_index_file, **merge_options)
+    else:
+        print("\n没有新数据，输出文件保持不变。")
 
-    # --- 3. 合并新数据和现有数据 ---
-    all_data_for_processing = existing_data + newly_extracted_questions
-    print(f"\n合并了现有数据 ({len(existing_data)}) 和新提取的数据 ({len(newly_extracted_questions)})，总共 {len(all_data_for_processing)} 条数据。")
+    # --- 5. 输出变化 (或首次要求紧凑格式) 时更新派生文件; 增量追加只更新索引，预压缩副本留给完整重建 ---
+    derived_missing = (not os.path.exists(fuse_index_path(output_json_file))
+                       or (args.compact and not os.path.exists(compact_output_path(output_json_file)))
+                       or (appended is None and not os.path.exists(output_json_file + '.gz')))
+    if file_fingerprint(output_json_file) != output_fingerprint_before or derived_missing:
+        write_derived_outputs(output_json_file, args.compact, appended)
 
-    # --- 4. 对合并后的数据进行去重并保存 ---
-    merge_and_deduplicate_data(all_data_for_processing, output_json_file)
+    # 只有在输出写入完成后才更新清单 (写入失败会抛出异常)，避免文件被误判为已处理
+    new_manifest.update(extracted_entries)
+    save_manifest(manifest_file, target_key, target_file, new_manifest)
 
     print("--- 组合脚本执行完毕 ---")
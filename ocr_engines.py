@@ -0,0 +1,237 @@
+"""OCR engine backends behind one interface: detect / recognize / recognize_batch.
+
+- PaddleEngine wraps PaddleOCR (the default).
+- OnnxEngine runs PaddleOCR det/rec models exported to ONNX (paddle2onnx) on ONNX Runtime's
+  CPU provider, with the DB post-processing and CTC decoding done here in NumPy/OpenCV.
+  Optionally loads INT8 models written by `python ocr_engines.py quantize`.
+
+The engine is picked with "engine" in ocr_config.json: either a name ("paddle" / "onnx") or an
+object such as {"name": "onnx", "det_model": "models/det.onnx", "rec_model": "models/rec.onnx",
+"rec_dict": "models/ppocr_keys_v1.txt", "int8": true}.
+
+Usage:
+    python ocr_engines.py quantize models/det.onnx models/rec.onnx   # -> models/det.int8.onnx, models/rec.int8.onnx
+"""
+import os
+import sys
+import math
+
+import cv2
+import numpy as np
+
+# --- Engine Configuration ---
+DEFAULT_ENGINE = 'paddle'
+# ONNX backend defaults (PP-OCRv3/v4 inference settings); any of them can be overridden in the engine config
+ONNX_DEFAULTS = {
+    'det_model': 'models/det.onnx',
+    'rec_model': 'models/rec.onnx',
+    'rec_dict': 'models/ppocr_keys_v1.txt',
+    'int8': False, # Load <model>.int8.onnx instead (see quantize_models)
+    'det_limit_side_len': 960, # Longest side the detector sees
+    'det_db_thresh': 0.3, # Probability threshold of the text mask
+    'det_db_box_thresh': 0.6, # Minimum mean probability inside a box
+    'det_db_unclip_ratio': 1.5, # How far shrunk DB boxes are grown back
+    'det_min_size': 3,
+    'rec_image_height': 48,
+    'rec_image_width': 320, # Minimum batch width; wider lines widen their batch
+    'rec_batch_size': 6, # Crops per session run (sorted by aspect ratio, so little padding)
+}
+INT8_SUFFIX = '.int8.onnx'
+DET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+DET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+def to_bgr(img):
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if img.ndim == 2 else (cv2.cvtColor(img, cv2.COLOR_BGRA2BGR) if img.shape[2] == 4 else img)
+
+# --- Interface ---
+class OCREngine:
+    """detect(img) -> [4x2 point arrays] (unordered); recognize_batch(crops) -> [(text, score)] per crop."""
+    name = None
+
+    def detect(self, img):
+        raise NotImplementedError
+
+    def recognize_batch(self, crops):
+        raise NotImplementedError
+
+    def recognize(self, crop):
+        return self.recognize_batch([crop])[0]
+
+    def describe(self):
+        return self.name
+
+# --- PaddleOCR ---
+class PaddleEngine(OCREngine):
+    name = 'paddle'
+
+    def __init__(self, lang='ch', use_gpu=False, cpu_threads=None, enable_mkldnn=False, **options):
+        from paddleocr import PaddleOCR # Imported here: loading paddle takes seconds
+        if cpu_threads: options['cpu_threads'] = cpu_threads
+        self.options = dict(options, lang=lang, use_gpu=use_gpu, enable_mkldnn=enable_mkldnn)
+        self._ocr = PaddleOCR(use_angle_cls=False, show_log=False, **self.options)
+
+    def detect(self, img):
+        result = self._ocr.ocr(to_bgr(img), rec=False, cls=False) # Grayscale, binary and BGRA captures all come in
+        return [np.asarray(points) for points in result[0]] if result and result[0] else []
+
+    def recognize_batch(self, crops):
+        if not crops: return []
+        # A nested list makes PaddleOCR send all crops through the recognizer as one batch; it expects BGR
+        result = self._ocr.ocr([[to_bgr(crop) for crop in crops]], det=False, cls=False)
+        rec_res = (result[0] if result else None) or []
+        return [((rec[0], rec[1]) if rec else ("", 0.0)) for rec in rec_res] + [("", 0.0)] * (len(crops) - len(rec_res))
+
+    def describe(self):
+        return f"paddle ({', '.join(f'{k}={v}' for k, v in self.options.items())})"
+
+# --- ONNX Runtime ---
+class OnnxEngine(OCREngine):
+    """PaddleOCR det (DB) + rec (CTC) models on ONNX Runtime's CPU provider.
+
+    Export the inference models with dynamic shapes, e.g.
+    paddle2onnx --model_dir ch_PP-OCRv4_det_infer --model_filename inference.pdmodel
+                --params_filename inference.pdiparams --save_file models/det.onnx
+    (same for rec), and copy ppocr_keys_v1.txt next to them.
+    """
+    name = 'onnx'
+
+    def __init__(self, cpu_threads=None, **options):
+        import onnxruntime as ort # Optional dependency, only needed for this backend
+        unknown = set(options) - set(ONNX_DEFAULTS) - {'lang', 'use_gpu', 'enable_mkldnn'} # Paddle-only options are ignored
+        if unknown: raise ValueError(f"Unknown onnx engine option(s): {', '.join(sorted(unknown))}")
+        self.config = {**ONNX_DEFAULTS, **{k: v for k, v in options.items() if k in ONNX_DEFAULTS}}
+        det_path, rec_path = self.config['det_model'], self.config['rec_model']
+        if self.config['int8']: det_path, rec_path = int8_path(det_path), int8_path(rec_path)
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if cpu_threads: session_options.intra_op_num_threads = cpu_threads
+        self.cpu_threads = cpu_threads
+        self.det = ort.InferenceSession(det_path, session_options, providers=['CPUExecutionProvider'])
+        self.rec = ort.InferenceSession(rec_path, session_options, providers=['CPUExecutionProvider'])
+        self.det_input = self.det.get_inputs()[0].name
+        self.rec_input = self.rec.get_inputs()[0].name
+        self.det_path, self.rec_path = det_path, rec_path
+        self.characters = load_rec_dict(self.config['rec_dict'])
+
+    def describe(self):
+        return f"onnx ({os.path.basename(self.det_path)}, {os.path.basename(self.rec_path)}, threads={self.cpu_threads or 'default'})"
+
+    # --- Detection (DB) ---
+    def _det_input(self, img):
+        h, w = img.shape[:2]
+        limit = self.config['det_limit_side_len']
+        ratio = limit / max(h, w) if max(h, w) > limit else 1.0
+        resized_h, resized_w = max(32, int(round(h * ratio / 32)) * 32), max(32, int(round(w * ratio / 32)) * 32)
+        resized = cv2.resize(img, (resized_w, resized_h))
+        blob = (resized.astype(np.float32) / 255.0 - DET_MEAN) / DET_STD
+        return blob.transpose(2, 0, 1)[np.newaxis], (h / resized_h, w / resized_w)
+
+    def detect(self, img):
+        img = to_bgr(img)
+        blob, (scale_y, scale_x) = self._det_input(img)
+        prob = self.det.run(None, {self.det_input: blob})[0][0, 0]
+        return [box * (scale_x, scale_y) for box in self._boxes_from_prob(prob)]
+
+    def _boxes_from_prob(self, prob):
+        """DB post-processing: contours of the thresholded map, scored, grown by the unclip ratio."""
+        cfg = self.config
+        mask = (prob > cfg['det_db_thresh']).astype(np.uint8) * 255
+        contours, _ = cv2.findContours(mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        map_h, map_w = prob.shape
+        boxes = []
+        for contour in contours[:1000]:
+            rect = cv2.minAreaRect(contour)
+            if min(rect[1]) < cfg['det_min_size']: continue
+            if box_score(prob, cv2.boxPoints(rect)) < cfg['det_db_box_thresh']: continue
+            (cx, cy), (w, h), angle = rect
+            # Offsetting a rectangle by d grows both sides by 2d (what pyclipper's unclip does, minus the rounded corners)
+            d = w * h * cfg['det_db_unclip_ratio'] / (2 * (w + h))
+            if min(w, h) + 2 * d < cfg['det_min_size'] + 2: continue
+            box = order_points(cv2.boxPoints(((cx, cy), (w + 2 * d, h + 2 * d), angle)))
+            box[:, 0] = np.clip(box[:, 0], 0, map_w)
+            box[:, 1] = np.clip(box[:, 1], 0, map_h)
+            boxes.append(box)
+        return boxes
+
+    # --- Recognition (CTC) ---
+    def recognize_batch(self, crops):
+        if not crops: return []
+        crops = [to_bgr(crop) for crop in crops]
+        height, min_width, batch_size = self.config['rec_image_height'], self.config['rec_image_width'], self.config['rec_batch_size']
+        order = sorted(range(len(crops)), key=lambda i: crops[i].shape[1] / max(1, crops[i].shape[0]))
+        results = [("", 0.0)] * len(crops)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            max_ratio = max(min_width / height, *(crops[i].shape[1] / max(1, crops[i].shape[0]) for i in batch))
+            width = int(math.ceil(height * max_ratio))
+            blob = np.zeros((len(batch), 3, height, width), dtype=np.float32) # Right-padded with zeros like PaddleOCR
+            for row, i in enumerate(batch):
+                crop = crops[i]
+                resized_w = max(1, min(width, int(math.ceil(height * crop.shape[1] / max(1, crop.shape[0])))))
+                resized = cv2.resize(crop, (resized_w, height)).astype(np.float32)
+                blob[row, :, :, :resized_w] = ((resized / 255.0 - 0.5) / 0.5).transpose(2, 0, 1)
+            probs = self.rec.run(None, {self.rec_input: blob})[0]
+            for row, i in enumerate(batch): results[i] = ctc_decode(probs[row], self.characters)
+        return results
+
+# --- Helpers ---
+def order_points(box):
+    """Orders 4 points clockwise from the top-left, like PaddleOCR's get_mini_boxes."""
+    box = sorted(box.tolist(), key=lambda p: p[0])
+    left = sorted(box[:2], key=lambda p: p[1])
+    right = sorted(box[2:], key=lambda p: p[1])
+    return np.array([left[0], right[0], right[1], left[1]], dtype=np.float32)
+
+def box_score(prob, box):
+    """Mean probability inside the box (PaddleOCR's box_score_fast)."""
+    h, w = prob.shape
+    xmin, xmax = int(np.clip(np.floor(box[:, 0].min()), 0, w - 1)), int(np.clip(np.ceil(box[:, 0].max()), 0, w - 1))
+    ymin, ymax = int(np.clip(np.floor(box[:, 1].min()), 0, h - 1)), int(np.clip(np.ceil(box[:, 1].max()), 0, h - 1))
+    mask = np.zeros((ymax - ymin + 1, xmax - xmin + 1), dtype=np.uint8)
+    cv2.fillPoly(mask, [(box - (xmin, ymin)).astype(np.int32)], 1)
+    return cv2.mean(prob[ymin:ymax + 1, xmin:xmax + 1], mask)[0]
+
+def load_rec_dict(path):
+    """Character list for CTC decoding: index 0 is the blank, then the dict lines, then a space."""
+    with open(path, 'r', encoding='utf-8') as f: characters = [line.rstrip('\r\n') for line in f]
+    return ['blank'] + characters + [' ']
+
+def ctc_decode(probs, characters):
+    """Greedy CTC decoding of one (T, C) probability matrix. Returns (text, mean confidence)."""
+    indices, confidences = probs.argmax(axis=1), probs.max(axis=1)
+    keep = indices != 0
+    keep[1:] &= indices[1:] != indices[:-1] # Collapse repeats
+    chars = [characters[i] if i < len(characters) else '' for i in indices[keep]]
+    return "".join(chars), float(confidences[keep].mean()) if keep.any() else 0.0
+
+def int8_path(path):
+    return path[:-len('.onnx')] + INT8_SUFFIX if path.endswith('.onnx') else path + INT8_SUFFIX
+
+def quantize_models(paths):
+    """Writes a dynamically INT8-quantized copy (<model>.int8.onnx) of each ONNX model."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    for path in paths:
+        target = int8_path(path)
+        quantize_dynamic(path, target, weight_type=QuantType.QUInt8)
+        print(f"{path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB) -> {target} ({os.path.getsize(target) / 1024 / 1024:.1f} MB)")
+
+# --- Factory ---
+ENGINES = {'paddle': PaddleEngine, 'onnx': OnnxEngine}
+
+def engine_spec_name(spec):
+    return (spec.get('name') if isinstance(spec, dict) else spec) or DEFAULT_ENGINE
+
+def create_engine(spec=None, **options):
+    """Builds the engine named by `spec` (a name, or a dict with "name" plus backend options); `options` are shared settings."""
+    name = engine_spec_name(spec)
+    if name not in ENGINES: raise ValueError(f"Unknown OCR engine '{name}' (available: {', '.join(ENGINES)})")
+    if isinstance(spec, dict): options.update({k: v for k, v in spec.items() if k != 'name'})
+    return ENGINES[name](**options)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != 'quantize':
+        print(__doc__); sys.exit(1)
+    quantize_models(sys.argv[2:])
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+
+from question_search import normalize_text, field_value, question_key, substring_edit_distance, DEFAULT_TOP_K, RERANK_CANDIDATES, QUERY_CACHE_SIZE
+
+# --- Database Configuration ---
+QUESTION_DB_FILE = 'questions.db'
+QUESTION_FIELDS = ('bank_name', 'id', 'number', 'type', 'text', 'options', 'student_answer', 'correct_answer', 'analysis')
+FTS_COLUMN_WEIGHTS = (1.0, 0.6, 0.3) # bm25() weights for text, options, analysis (same as FIELD_WEIGHTS in question_search)
+UPSERT_BATCH_SIZE = 1000 # Rows per transaction
+
+# One row per question keyed by (bank_name, id). The FTS5 table holds the *normalized* text
+# (CJK + letters, as produced by clean_ocr_text) under the same rowid, tokenized into trigrams,
+# which matches Chinese substrings without a word segmenter.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    row_id INTEGER PRIMARY KEY,
+    bank_name TEXT NOT NULL,
+    id TEXT NOT NULL,
+    number INTEGER,
+    type TEXT,
+    text TEXT,
+    options TEXT,
+    student_answer TEXT,
+    correct_answer TEXT,
+    analysis TEXT,
+    record_hash TEXT NOT NULL,
+    UNIQUE (bank_name, id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(text, options, analysis, tokenize='trigram');
+"""
+
+def connect(db_path, read_only=False):
+    if read_only:
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=WAL") # Readers (realtime_ocr.py) are not blocked by the extractor
+        try: conn.executescript(SCHEMA)
+        except sqlite3.OperationalError as e:
+            raise RuntimeError(f"SQLite {sqlite3.sqlite_version} lacks the FTS5 trigram tokenizer (needs 3.34+): {e}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def record_hash(question):
+    canonical = json.dumps({field: question.get(field) for field in QUESTION_FIELDS}, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+def row_to_question(row):
+    question = {field: row[field] for field in QUESTION_FIELDS}
+    question['options'] = json.loads(question['options']) if question['options'] else []
+    return question
+
+def upsert_questions(conn, questions, batch_size=UPSERT_BATCH_SIZE):
+    """Inserts new questions and updates changed ones (keyed by question_key). Returns (inserted, updated, unchanged)."""
+    inserted = updated = unchanged = 0
+    for start in range(0, len(questions), batch_size):
+        with conn: # One transaction per batch
+            for question in questions[start:start + batch_size]:
+                if not isinstance(question, dict): continue
+                key = question_key(question) # None -> '', the same identity bank deltas use
+                new_hash = record_hash(question)
+                existing = conn.execute("SELECT row_id, record_hash FROM questions WHERE bank_name = ? AND id = ?", key).fetchone()
+                if existing and existing['record_hash'] == new_hash:
+                    unchanged += 1
+                    continue
+                values = (question.get('number'), question.get('type'), question.get('text'),
+                          json.dumps(question.get('options') or [], ensure_ascii=False),
+                          question.get('student_answer'), question.get('correct_answer'), question.get('analysis'), new_hash)
+                if existing:
+                    row_id = existing['row_id']
+                    conn.execute("UPDATE questions SET number = ?, type = ?, text = ?, options = ?, student_answer = ?, "
+                                 "correct_answer = ?, analysis = ?, record_hash = ? WHERE row_id = ?", values + (row_id,))
+                    conn.execute("DELETE FROM questions_fts WHERE rowid = ?", (row_id,))
+                    updated += 1
+                else:
+                    row_id = conn.execute("INSERT INTO questions (bank_name, id, number, type, text, options, student_answer, "
+                                          "correct_answer, analysis, record_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", key + values).lastrowid
+                    inserted += 1
+                conn.execute("INSERT INTO questions_fts (rowid, text, options, analysis) VALUES (?, ?, ?, ?)",
+                             (row_id,) + tuple(normalize_text(field_value(question, field)) for field in ('text', 'options', 'analysis')))
+    return inserted, updated, unchanged
+
+def iter_questions(conn):
+    for row in conn.execute(f"SELECT {', '.join(QUESTION_FIELDS)} FROM questions ORDER BY bank_name, number IS NULL, number, row_id"):
+        yield row_to_question(row)
+
+def export_json(conn, json_path, indent=4):
+    """Writes the whole bank as the JSON list search_questions.html loads (same layout as extract_questions.py)."""
+    questions = list(iter_questions(conn))
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(questions, f, indent=indent, ensure_ascii=False)
+    return len(questions)
+
+def build_match_query(normalized_query):
+    """FTS5 query: any of the query's trigrams (quoted, so CJK and FTS operators are taken literally)."""
+    grams = list(dict.fromkeys(normalized_query[i:i + 3] for i in range(len(normalized_query) - 2)))
+    return " OR ".join('"' + gram.replace('"', '""') + '"' for gram in grams)
+
+# --- Query Side (used by realtime_ocr.py) ---
+class QuestionDB:
+    """Read-only search over questions.db with the same result format as question_search.QuestionIndex."""
+
+    def __init__(self, db_path, cache_size=QUERY_CACHE_SIZE):
+        self.db_path = db_path
+        self._local = threading.local() # sqlite3 connections are per thread (HTTP handlers + OCR publisher)
+        self._count = self._conn().execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+        self._cached_search = functools.lru_cache(maxsize=cache_size)(self._search_uncached)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path, read_only=True)
+        return conn
+
+    def __len__(self):
+        return self._count
+
+    def refresh(self):
+        """Picks up rows the extractor wrote since opening: recounts and drops cached searches."""
+        self._count = self._conn().execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+        self._cached_search.cache_clear()
+
+    def _search_uncached(self, normalized_query, top_k):
+        conn = self._conn()
+        limit = max(top_k, RERANK_CANDIDATES)
+        columns = ", ".join(f"q.{field}" for field in QUESTION_FIELDS)
+        if len(normalized_query) >= 3:
+            rows = conn.execute(f"SELECT {columns}, -bm25(questions_fts, ?, ?, ?) AS score, f.text AS norm_text, f.options AS norm_options "
+                                f"FROM questions_fts f JOIN questions q ON q.row_id = f.rowid "
+                                f"WHERE questions_fts MATCH ? ORDER BY bm25(questions_fts, ?, ?, ?) LIMIT ?",
+                                FTS_COLUMN_WEIGHTS + (build_match_query(normalized_query),) + FTS_COLUMN_WEIGHTS + (limit,)).fetchall()
+        else: # Too short for trigrams: substring scan
+            rows = conn.execute(f"SELECT {columns}, 0.0 AS score, f.text AS norm_text, f.options AS norm_options "
+                                f"FROM questions_fts f JOIN questions q ON q.row_id = f.rowid "
+                                f"WHERE f.text LIKE ? OR f.options LIKE ? LIMIT ?",
+                                (f"%{normalized_query}%", f"%{normalized_query}%", limit)).fetchall()
+        reranked = []
+        for row in rows:
+            distance = substring_edit_distance(normalized_query, row['norm_text'] + row['norm_options'])
+            reranked.append((1.0 - distance / len(normalized_query), row['score'], row_to_question(row)))
+        reranked.sort(key=lambda r: (r[0], r[1]), reverse=True)
+        return tuple(reranked[:top_k])
+
+    def search(self, query, top_k=DEFAULT_TOP_K):
+        """Returns up to `top_k` matches as dicts with 'question', 'score' (BM25) and 'similarity' (0-1)."""
+        normalized_query = normalize_text(query)
+        if not normalized_query: return []
+        return [{'question': question, 'score': round(score, 4), 'similarity': round(similarity, 4)}
+                for similarity, score, question in self._cached_search(normalized_query, top_k)]
+
+    def cache_info(self):
+        return self._cached_search.cache_info()
+
+
+if __name__ == "__main__":
+    import sys
+    db = QuestionDB(sys.argv[2] if len(sys.argv) > 2 else QUESTION_DB_FILE)
+    print(f"{len(db)} questions in {db.db_path}")
+    search_start = time.perf_counter()
+    for match in db.search(sys.argv[1] if len(sys.argv) > 1 else ""):
+        print(f"{match['similarity']:.3f} {match['score']:8.3f}  [{match['question'].get('bank_name')}] {match['question'].get('text')}")
+    print(f"Search took {(time.perf_counter() - search_start) * 1000:.2f} ms")
@@ -0,0 +1,191 @@
+import re
+import json
+import math
+import time
+import functools
+import threading
+from collections import defaultdict
+
+# --- Search Configuration ---
+NGRAM_SIZES = (2, 3) # Character bigrams + trigrams (works for CJK without a word segmenter)
+FIELD_WEIGHTS = {'text': 1.0, 'options': 0.6, 'analysis': 0.3}
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_TOP_K = 10
+RERANK_CANDIDATES = 30 # BM25 candidates that get the (more expensive) edit-distance rerank
+QUERY_CACHE_SIZE = 256
+
+# --- Text Normalization ---
+_NORMALIZE_RE = re.compile(r'[^\u4e00-\u9fffA-Za-z]') # Same character set clean_ocr_text keeps
+
+def normalize_text(text):
+    """Reduces text to the characters OCR output keeps (CJK + latin letters), lowercased."""
+    if not text: return ""
+    return _NORMALIZE_RE.sub('', str(text)).lower()
+
+def char_ngrams(text, sizes=NGRAM_SIZES):
+    grams = []
+    for n in sizes:
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    if not grams and text: grams.append(text) # Single-character strings still get indexed
+    return grams
+
+def question_key(question):
+    """(bank_name, id) as strings: how questions.db and bank deltas identify a question."""
+    return tuple('' if question.get(field) is None else str(question.get(field)) for field in ('bank_name', 'id'))
+
+def field_value(question, field):
+    value = question.get(field)
+    if isinstance(value, list): return "".join(str(v) for v in value)
+    return value or ""
+
+# --- Edit Distance ---
+def substring_edit_distance(pattern, text):
+    """Minimum Levenshtein distance between `pattern` and any substring of `text`.
+
+    Bit-parallel (Myers 1999), so the cost is O(len(text)) big-int operations. Using the
+    substring form means a capture that only covers part of a question still scores well.
+    """
+    m = len(pattern)
+    if m == 0: return 0
+    peq = {}
+    for i, c in enumerate(pattern): peq[c] = peq.get(c, 0) | (1 << i)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    best = m
+    for c in text:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & mask
+        mh = pv & xh
+        if ph & high: score += 1
+        elif mh & high: score -= 1
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+        if score < best: best = score
+    return best
+
+# --- Inverted Index ---
+class QuestionIndex:
+    """Character n-gram inverted index over the question bank, ranked by BM25 with an edit-distance rerank."""
+
+    def __init__(self, questions, cache_size=QUERY_CACHE_SIZE):
+        self.questions = []
+        self.match_texts = [] # Normalized text+options of each question, used for the rerank
+        self.postings = defaultdict(list) # gram -> [(doc_idx, field, tf)]
+        self.field_lengths = {field: [] for field in FIELD_WEIGHTS}
+        self.field_totals = dict.fromkeys(FIELD_WEIGHTS, 0) # Sum of field_lengths over live questions
+        self.avg_field_length = {}
+        self.doc_freq = defaultdict(int) # gram -> number of distinct live questions containing it
+        self.docs_by_key = defaultdict(list) # question_key -> doc indices, for apply_delta
+        self.removed = set() # Doc indices dropped by apply_delta: their postings are skipped, not rewritten
+        self._lock = threading.RLock() # apply_delta vs. searches from the HTTP and OCR threads
+        for question in questions: self._add(question)
+        self._update_averages()
+        self._cached_search = functools.lru_cache(maxsize=cache_size)(self._search_uncached)
+
+    @classmethod
+    def from_json_file(cls, filepath, **kwargs):
+        with open(filepath, 'r', encoding='utf-8') as f: questions = json.load(f)
+        return cls(questions if isinstance(questions, list) else [], **kwargs)
+
+    def _add(self, question):
+        if not isinstance(question, dict): return
+        doc_idx = len(self.questions)
+        self.questions.append(question)
+        normalized = {field: normalize_text(field_value(question, field)) for field in FIELD_WEIGHTS}
+        self.match_texts.append(normalized['text'] + normalized['options'])
+        distinct = set()
+        for field, text in normalized.items():
+            grams = char_ngrams(text)
+            self.field_lengths[field].append(len(grams))
+            self.field_totals[field] += len(grams)
+            counts = defaultdict(int)
+            for gram in grams: counts[gram] += 1
+            for gram, tf in counts.items(): self.postings[gram].append((doc_idx, field, tf))
+            distinct.update(counts)
+        for gram in distinct: self.doc_freq[gram] += 1
+        self.docs_by_key[question_key(question)].append(doc_idx)
+
+    def _remove(self, doc_idx):
+        question = self.questions[doc_idx]
+        distinct = set()
+        for field in FIELD_WEIGHTS:
+            self.field_totals[field] -= self.field_lengths[field][doc_idx]
+            distinct.update(char_ngrams(normalize_text(field_value(question, field))))
+        for gram in distinct: self.doc_freq[gram] -= 1
+        self.removed.add(doc_idx)
+
+    def _update_averages(self):
+        live = len(self)
+        self.avg_field_length = {field: (total / live) if live else 0.0 for field, total in self.field_totals.items()}
+
+    def apply_delta(self, removed_keys, added):
+        """Drops every question under `removed_keys` (question_key tuples), then indexes `added`.
+
+        Costs time proportional to the delta rather than the bank; a changed question is a removal plus an addition.
+        """
+        with self._lock:
+            for key in removed_keys:
+                for doc_idx in self.docs_by_key.pop(tuple(key), ()): self._remove(doc_idx)
+            for question in added: self._add(question)
+            self._update_averages()
+            self._cached_search.cache_clear()
+
+    def __len__(self):
+        return len(self.questions) - len(self.removed)
+
+    def _bm25_scores(self, query_grams):
+        n_docs = len(self)
+        removed = self.removed
+        scores = defaultdict(float)
+        for gram in set(query_grams):
+            postings = self.postings.get(gram)
+            if not postings: continue
+            df = self.doc_freq[gram]
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_idx, field, tf in postings:
+                if doc_idx in removed: continue
+                avg_len = self.avg_field_length[field] or 1.0
+                norm = 1 - BM25_B + BM25_B * self.field_lengths[field][doc_idx] / avg_len
+                scores[doc_idx] += FIELD_WEIGHTS[field] * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return scores
+
+    def _search_uncached(self, normalized_query, top_k):
+        scores = self._bm25_scores(char_ngrams(normalized_query))
+        if not scores: return ()
+        candidates = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:max(top_k, RERANK_CANDIDATES)]
+        reranked = []
+        for doc_idx, score in candidates:
+            distance = substring_edit_distance(normalized_query, self.match_texts[doc_idx])
+            similarity = 1.0 - distance / len(normalized_query)
+            reranked.append((similarity, score, doc_idx))
+        reranked.sort(key=lambda r: (r[0], r[1]), reverse=True)
+        return tuple(reranked[:top_k])
+
+    def search(self, query, top_k=DEFAULT_TOP_K):
+        """Returns up to `top_k` matches as dicts with 'question', 'score' (BM25) and 'similarity' (0-1)."""
+        normalized_query = normalize_text(query)
+        if not normalized_query: return []
+        with self._lock:
+            return [{'question': self.questions[doc_idx], 'score': round(score, 4), 'similarity': round(similarity, 4)}
+                    for similarity, score, doc_idx in self._cached_search(normalized_query, top_k)]
+
+    def cache_info(self):
+        return self._cached_search.cache_info()
+
+
+if __name__ == "__main__":
+    import sys
+    index_start = time.perf_counter()
+    index = QuestionIndex.from_json_file(sys.argv[2] if len(sys.argv) > 2 else 'combined_questions_data.json')
+    print(f"Indexed {len(index)} questions in {(time.perf_counter() - index_start) * 1000:.0f} ms")
+    query = sys.argv[1] if len(sys.argv) > 1 else ""
+    search_start = time.perf_counter()
+    for match in index.search(query):
+        print(f"{match['similarity']:.3f} {match['score']:8.3f}  [{match['question'].get('bank_name')}] {match['question'].get('text')}")
+    print(f"Search took {(time.perf_counter() - search_start) * 1000:.1f} ms")
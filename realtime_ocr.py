@@ -1,75 +1,194 @@
-import cv2
+import time
+LAUNCH_TIME = time.perf_counter() # Reference point for the startup timings reported below
 import numpy as np
-from paddleocr import PaddleOCR
 import webbrowser
 import urllib.parse
 import os
 import sys
 import re
-import time
+import math
 import json
-import tkinter as tk
+import importlib
 from mss import mss
-import keyboard
 import threading
 import http.server
-import socketserver
 import signal
-import queue # Added for SSE message passing
-import select # Added for non-blocking queue read in SSE handler
+import collections
+import hashlib
+import argparse
+import cProfile
+import pstats
+import contextlib
+import email.utils
+from question_search import QuestionIndex, question_key, DEFAULT_TOP_K, RERANK_CANDIDATES
+from question_db import QuestionDB, QUESTION_DB_FILE
+
+# --- Lazy Imports ---
+class LazyModule:
+    """Stands in for a heavy module and imports it on first attribute access.
+
+    Keeps OpenCV, tkinter and keyboard off the startup path (the OCR engine is imported inside
+    initialize_ocr, on the engine loader thread). A failed import (e.g. keyboard without root
+    on Linux) raises on first use instead of at startup.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        if self._module is None: self._module = importlib.import_module(self._name) # The import lock makes racing threads wait
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+cv2 = LazyModule('cv2')
+tk = LazyModule('tkinter')
+keyboard = LazyModule('keyboard')
 
 # --- Configuration ---
+OCR_ENGINE = 'paddle' # 'paddle' or 'onnx' (see ocr_engines.py); "engine" in ocr_config.json overrides it
 OCR_LANG = 'ch'
 USE_GPU = False
+OCR_CPU_THREADS = max(1, (os.cpu_count() or 2) // 2) # Inference threads: leave the other cores to the exam browser
+OCR_ENABLE_MKLDNN = False # MKL-DNN (oneDNN) kernels: usually faster on Intel CPUs, costs memory and a longer warm-up
 CONFIG_FILE = 'ocr_config.json'
+# --- Capture Regions (ocr_config.json: {"regions": {name: {top, left, width, height[, weight]}}}) ---
+DEFAULT_REGION_NAME = 'main' # Name of a single region, and of the legacy {"region": {...}} config
+REGION_KEYS = ('top', 'left', 'width', 'height')
+REGION_MATCH_MODE = 'merge' # 'merge': one query over all regions' text in config order; 'weighted': search each region, average similarities by region weight
+REGION_UNION_MAX_AREA_RATIO = 2.0 # Grab all regions as one bounding rectangle unless it is this much larger than the regions (e.g. two monitors)
+USE_QUESTION_DB = True # Query questions.db (written by `extract_questions.py --sqlite`) when it exists, instead of indexing the JSON
 # --- Hotkeys ---
 TOGGLE_OCR_HOTKEY = 'ctrl+alt+o'
 RESELECT_HOTKEY = 'ctrl+alt+r'
 QUIT_HOTKEY = 'ctrl+alt+q'
+PROFILE_HOTKEY = 'ctrl+alt+p' # Start/stop a cProfile capture of the OCR and publish threads
+CALIBRATE_HOTKEY = 'ctrl+alt+c' # Recalibrate the preprocessing of every region on the next frame
 # --- Server Configuration ---
 SERVER_PORT = 8088
 SERVER_ADDRESS = "localhost"
+SERVER_BIND_ADDRESS = SERVER_ADDRESS # Set to "0.0.0.0" so a phone / second monitor on the LAN can follow the session
 SSE_ENDPOINT = "/ocr-events" # Path for Server-Sent Events
+SEARCH_ENDPOINT = "/search" # Server-side question search: /search?q=...&k=...
+SEARCH_MAX_TOP_K = 50
+SSE_HEARTBEAT_SECONDS = 15 # Comment line sent to idle SSE clients so dead connections get noticed
+SSE_HISTORY_SIZE = 32 # Recent events kept for Last-Event-ID replay
+SSE_RETRY_MS = 2000 # Reconnect delay suggested to EventSource clients
+STATIC_CACHE_CONTROL = 'no-cache' # Browsers keep static files but revalidate (ETag -> 304) on every load
+SIDECAR_ENCODINGS = (('br', '.br'), ('gzip', '.gz')) # Precompressed files written by extract_questions.py, by preference
 # --- OCR Loop ---
-OCR_INTERVAL_SECONDS = 1.0
+CAPTURE_FAST_INTERVAL_SECONDS = 0.04 # Capture poll interval right after a change (catches the settled frame quickly)
+CAPTURE_IDLE_MAX_INTERVAL_SECONDS = 0.16 # Backoff cap while idle: a new question is noticed within ~200 ms
+OCR_CPU_BUDGET_PERCENT = 25 # Average share of all cores that inference may use
+OCR_CPU_BURST_SECONDS = 2.0 # Budget that accumulates while idle, so the first inference after a change starts at once
+PIPELINE_POLL_SECONDS = 0.5 # Max blocking wait in pipeline stages before re-checking the `running` flag
+# --- Change Detection (skip OCR while the captured region is static) ---
+CHANGE_DETECT_ENABLED = True
+CHANGE_DETECT_WIDTH = 160 # Width of the downsampled grayscale thumbnail that gets compared
+CHANGE_PIXEL_TOLERANCE = 24 # Per-pixel gray delta ignored as anti-aliasing/compression noise
+CHANGE_MIN_CHANGED_RATIO = 0.004 # Fraction of thumbnail pixels that must change (ignores cursor blink)
+# --- Preprocessing (normalize the text size, then one of PREPROCESS_STRATEGIES) ---
+PREPROCESS_STRATEGIES = ('none', 'gray', 'otsu', 'adaptive') # 'none' hands the detector the capture itself; 'otsu'/'adaptive' a binary image
+PREPROCESS_STRATEGY = 'auto' # 'auto': calibrated per region (saved in ocr_config.json), or one of PREPROCESS_STRATEGIES for every region
+PREPROCESS_FALLBACK_STRATEGY = 'adaptive' # Used until a region is calibrated (the original preprocessing)
+PREPROCESS_NORMALIZE_ENABLED = True # Crop to the text and downscale it to the target height before detection
+PREPROCESS_TARGET_TEXT_HEIGHT = 32 # Text line height (px) to scale down to; detected line crops then come out near the 48 px recognition input
+PREPROCESS_SCALE_STEP = 0.125 # Scales are rounded up to this step, so the image size (and the line cache) stays put between frames
+PREPROCESS_CROP_TO_CONTENT = True # Crop to the bounding box of the text (plus a margin) first
+PREPROCESS_MIN_LINE_HEIGHT = 4 # Shorter runs of text rows (rules, underlines, noise) are not counted as lines
+PREPROCESS_CROP_MARGIN_LINES = 1.0 # Margin kept around the text bounding box, in line heights
+PREPROCESS_CROP_GRID = 32 # The crop is snapped outwards to this grid, again for a stable size while the text changes a little
+PREPROCESS_SAMPLE_PIXELS = 1 << 18 # The text/background (Otsu) threshold is estimated from a strided sample of about this many pixels
+CALIBRATION_MIN_CONFIDENCE = 0.85 # Calibration picks the fastest strategy whose mean line confidence stays above this
+CALIBRATION_RUNS = 2 # Timed runs per strategy (the fastest counts)
+# --- Incremental Line Recognition (reuse detection boxes between frames) ---
+LINE_CACHE_ENABLED = True
+REC_DROP_SCORE = 0.5 # Lines recognized with lower confidence contribute no text (PaddleOCR's drop_score default)
+LAYOUT_INK_TOLERANCE = 0.001 # Fraction of text pixels outside the cached line boxes that forces a full detection
+SCROLL_MAX_FRACTION = 0.5 # Largest vertical scroll (as a fraction of the region height) that is tracked
+# --- Result Cache (preprocessed image hash -> recognized text + matches) ---
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_MAX_ENTRIES = 256
+RESULT_CACHE_TTL_SECONDS = 24 * 3600
+RESULT_CACHE_FILE = 'ocr_result_cache.json' # Set to None to keep the cache in memory only
+# --- Question Bank Hot Reload (re-extracting the bank while running) ---
+BANK_WATCH_ENABLED = True
+BANK_WATCH_INTERVAL_SECONDS = 1.0 # Poll of the bank files' size/mtime; a change is read once it has been stable for one poll
+BANK_DELTA_EVENT = "bank" # SSE event type carrying {from, version, removed, added} to the page
+BANK_VERSION_HEADER = 'X-Bank-Version' # Sent with the bank JSON so the page knows which version it loaded
+
+METRICS_ENDPOINT = "/metrics" # Prometheus text exposition of the stage timings
+RENDER_BEACON_ENDPOINT = "/metrics/render" # The page POSTs {id, ms} here after rendering an SSE result
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Histogram bounds (seconds)
+METRICS_WINDOW_SAMPLES = 512 # Recent samples per stage kept for the rolling quantiles
+METRICS_QUANTILES = (0.5, 0.9, 0.99)
+PROFILE_DIR = 'profiles' # Where cProfile captures (.prof) are written
+PROFILE_TOP_FUNCTIONS = 15 # Functions printed (by cumulative time) when a capture stops
+# --- Engine Startup ---
+ENGINE_WARMUP_ENABLED = True # Run one inference on a synthetic image while the server starts and the region is picked
+ENGINE_WARMUP_TEXT = "OCR warm-up 0123456789" # Drawn on the dummy image so both detection and recognition run
+ENGINE_STATUS_EVENT = "status" # SSE event type carrying {engine, message} to the page
 
 # --- Global variables ---
-capture_region_coords = None
-ocr_instance = None
+capture_regions = {} # name -> {top, left, width, height[, weight]}, in config order
+ocr_engine = None # ocr_engines.OCREngine, created by initialize_ocr()
 httpd = None
 server_thread = None
 running = True
 ocr_active = False
 last_cleaned_text = "" # Store last *successfully processed* cleaned text
-sse_clients = [] # List to keep track of connected SSE client queues
-sse_message_queue = queue.Queue() # Queue for Python OCR loop to send messages to SSE handlers
+frame_change_detectors = {} # Region name -> FrameChangeDetector, created on first cycle
+question_index = None # QuestionDB over questions.db, or a QuestionIndex over combined_questions_data.json, set up at startup
+line_recognizers = {} # Region name -> IncrementalRecognizer, created on first OCR run
+preprocess_strategies = {} # Region name -> calibrated preprocessing strategy (PREPROCESS_STRATEGY 'auto')
+calibration_failures = set() # Strategies whose calibration run raised (reported once)
+result_cache = None # ResultCache instance, created at startup
+engine_ready = threading.Event() # Set once the model is loaded and warmed up; the pipeline waits for it
+engine_state = "idle" # idle -> loading -> warming -> ready, or failed
+bank_watcher = None # BankWatcher, started after the index is built
+first_result_reported = False
 
-# --- Config Management (load_config, save_config - unchanged) ---
+# --- Config Management ---
 def load_config():
-    global capture_region_coords
+    global capture_regions
     if os.path.exists(CONFIG_FILE):
         try:
             with open(CONFIG_FILE, 'r') as f: config = json.load(f)
-            if isinstance(config.get('region'), dict) and all(k in config['region'] for k in ['top', 'left', 'width', 'height']):
-                capture_region_coords = config['region']; print(f"Loaded region: {capture_region_coords}"); return True
+            regions = config.get('regions') or ({DEFAULT_REGION_NAME: config['region']} if 'region' in config else None)
+            if isinstance(regions, dict) and regions and all(isinstance(r, dict) and all(k in r for k in REGION_KEYS) for r in regions.values()):
+                capture_regions = regions; screen_grabber.set_regions(capture_regions); print(f"Loaded {len(regions)} region(s): {capture_regions}")
+                preprocess_strategies.clear(); preprocess_strategies.update({name: r['preprocess'] for name, r in regions.items() if r.get('preprocess') in PREPROCESS_STRATEGIES})
+                return True
             else: print(f"Invalid region format in {CONFIG_FILE}.")
         except Exception as e: print(f"Error loading config {CONFIG_FILE}: {e}")
     print("Config file not found/invalid.")
     return False
 
-def save_config(region):
+def load_engine_config():
+    """The "engine" entry of ocr_config.json (a name or {"name": ..., options}), else OCR_ENGINE."""
+    try:
+        with open(CONFIG_FILE, 'r') as f: return json.load(f).get('engine') or OCR_ENGINE
+    except (OSError, ValueError, AttributeError): return OCR_ENGINE
+
+def save_config(regions):
     try:
-        with open(CONFIG_FILE, 'w') as f: json.dump({'region': region}, f, indent=4)
-        print(f"Saved region: {region}")
+        config = {}
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r') as f: config = json.load(f) # Keep other settings (e.g. "engine")
+        config.pop('region', None); config['regions'] = regions
+        with open(CONFIG_FILE, 'w') as f: json.dump(config, f, indent=4)
+        print(f"Saved {len(regions)} region(s): {regions}")
     except Exception as e: print(f"Error saving config: {e}")
 
 
-# --- Region Selection GUI (select_region_gui - unchanged) ---
-def select_region_gui():
-    print("\nPlease select capture region...")
+# --- Region Selection GUI ---
+def select_region_gui(name=None):
+    print(f"\nPlease select capture region{f' {name!r}' if name else ''}...")
     root = tk.Tk(); root.attributes("-alpha", 0.3); root.attributes("-fullscreen", True)
     root.wait_visibility(root); root.attributes("-topmost", True)
     canvas = tk.Canvas(root, cursor="cross", bg='gray'); canvas.pack(fill=tk.BOTH, expand=tk.YES)
+    if name: canvas.create_text(20, 20, anchor='nw', text=f"Region: {name}", fill='white', font=('Arial', 24))
     start_x, start_y, rect_id, selected_region = None, None, None, None
     def on_m_down(e): nonlocal start_x,start_y; start_x,start_y=e.x,e.y; canvas.delete(rect_id) if rect_id else None
     def on_m_drag(e):
@@ -88,20 +207,623 @@ def select_region_gui():
     if selected_region: print(f"Region selected: {selected_region}"); return selected_region
     else: print("Region selection cancelled/invalid."); return None
 
+def select_regions_gui(names, previous=None):
+    """Selects each named region in turn (keeping a previous 'weight'). Returns {name: region}, or None if one is cancelled."""
+    regions = {}
+    for name in names:
+        region = select_region_gui(name if len(names) > 1 or name != DEFAULT_REGION_NAME else None)
+        if not region: return None
+        if previous and 'weight' in previous.get(name, {}): region['weight'] = previous[name]['weight']
+        regions[name] = region
+    return regions
+
 # --- Text Cleaning (clean_ocr_text - unchanged) ---
 def clean_ocr_text(text):
     if not text: return ""
     cleaned_text = re.sub(r'[^\u4e00-\u9fffA-Za-z]', '', text)
     return cleaned_text
 
-# --- Image Preprocessing (preprocess_screen_capture - unchanged) ---
-def preprocess_screen_capture(img_np):
+# --- Image Preprocessing ---
+def text_mask(gray):
+    """Otsu split of a grayscale image with text as 255. Text is the minority side, so dark-on-light and light-on-dark both work.
+
+    The threshold comes from a strided sample, so large captures do not pay for a full-resolution histogram.
+    """
+    step = max(1, math.isqrt(gray.size // PREPROCESS_SAMPLE_PIXELS))
+    threshold, sample = cv2.threshold(np.ascontiguousarray(gray[::step, ::step]), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    inverted = cv2.countNonZero(sample) * 2 > sample.size
+    if step == 1: return cv2.bitwise_not(sample) if inverted else sample
+    return cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV if inverted else cv2.THRESH_BINARY)[1]
+
+def text_ink(img):
+    """Boolean text pixels of a preprocessed image (binary, grayscale or colour)."""
+    if img.ndim == 3: img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    return text_mask(img) > 0
+
+def text_window(gray):
+    """Where and how much to shrink a grayscale capture: ((x0, y0, x1, y1) crop, scale), or None if it has no text.
+
+    The line height is the median height of the runs of rows containing text, so a heading bar or
+    a picture counts once and does not skew it. Text is never scaled up.
+    """
+    mask = text_mask(gray)
+    rows = mask.max(axis=1) > 0
+    if not rows.any(): return None
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.view(np.int8), [0]))))
+    heights = edges[1::2] - edges[::2]
+    heights = heights[heights >= PREPROCESS_MIN_LINE_HEIGHT]
+    if not len(heights): return None
+    line_height = float(np.median(heights))
+    scale = min(1.0, math.ceil(PREPROCESS_TARGET_TEXT_HEIGHT / line_height / PREPROCESS_SCALE_STEP) * PREPROCESS_SCALE_STEP)
+
+    height, width = gray.shape
+    crop = (0, 0, width, height)
+    if PREPROCESS_CROP_TO_CONTENT:
+        cols = np.flatnonzero(mask.max(axis=0))
+        margin, grid = int(line_height * PREPROCESS_CROP_MARGIN_LINES), PREPROCESS_CROP_GRID
+        crop = (max(0, (cols[0] - margin) // grid * grid), max(0, (edges[0] - margin) // grid * grid),
+                min(width, -(-(cols[-1] + 1 + margin) // grid) * grid), min(height, -(-(edges[-1] + margin) // grid) * grid))
+    return tuple(int(v) for v in crop), scale
+
+def preprocess_screen_capture(img_np, strategy=PREPROCESS_FALLBACK_STRATEGY, normalize=PREPROCESS_NORMALIZE_ENABLED):
+    """Prepares a BGRA (or grayscale) capture for the detector with one of PREPROCESS_STRATEGIES.
+
+    With `normalize`, the capture is first cropped to its text and scaled so text lines are about
+    PREPROCESS_TARGET_TEXT_HEIGHT px tall: detection cost then follows the amount of text, not the
+    capture resolution. 'otsu' and 'adaptive' return white text on black. Returns None on error.
+    """
     try:
-        gray = cv2.cvtColor(img_np, cv2.COLOR_BGRA2GRAY)
-        processed_img = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 5)
-        return processed_img
+        gray = img_np if img_np.ndim == 2 else cv2.cvtColor(img_np, cv2.COLOR_BGRA2GRAY)
+        window = text_window(gray) if normalize else None
+        if window:
+            (x0, y0, x1, y1), scale = window
+            img_np, gray = img_np[y0:y1, x0:x1], gray[y0:y1, x0:x1]
+            if scale < 1.0:
+                size = (max(1, round((x1 - x0) * scale)), max(1, round((y1 - y0) * scale)))
+                gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+                if strategy == 'none': img_np = cv2.resize(img_np, size, interpolation=cv2.INTER_AREA)
+        if strategy == 'none': return img_np # BGRA (or gray); every engine's detect/recognize_batch converts it to BGR
+        if strategy == 'gray': return gray
+        if strategy == 'otsu': return text_mask(gray)
+        if strategy == 'adaptive': return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 5)
+        raise ValueError(f"unknown strategy {strategy!r}")
     except Exception as e: print(f"Preprocessing error: {e}"); return None
 
+# --- Screen Capture ---
+class ScreenGrabber:
+    """Long-lived mss handle that returns frames as NumPy views over the grab buffer (no np.array copy).
+
+    The mss handle is bound to the thread that uses it (GDI/X11 handles are not shareable), so
+    it is (re)opened lazily by whichever thread grabs. grab_gray() converts straight into a
+    preallocated buffer that is reused until the region size changes.
+
+    Several named regions are grabbed in one pass: when their bounding rectangle is not much
+    larger than the regions themselves it is grabbed once and sliced into per-region views,
+    otherwise each region is grabbed in turn on the same handle.
+    """
+    def __init__(self, regions=None):
+        self._lock = threading.Lock()
+        self._regions = {}
+        self._union = None # Bounding rectangle grabbed once for all regions, or None to grab them one by one
+        self._sct = None
+        self._owner_thread = None
+        self._gray = None
+        self.grabs = 0
+        if regions: self.set_regions(regions)
+
+    def set_regions(self, regions):
+        """Sets the named regions ({name: {top, left, width, height, ...}}) returned by grab_regions()."""
+        with self._lock:
+            self._regions = {name: {k: int(region[k]) for k in REGION_KEYS} for name, region in (regions or {}).items()}
+            rects = list(self._regions.values())
+            self._union = None
+            if len(rects) > 1:
+                left, top = min(r['left'] for r in rects), min(r['top'] for r in rects)
+                width, height = max(r['left'] + r['width'] for r in rects) - left, max(r['top'] + r['height'] for r in rects) - top
+                if width * height <= REGION_UNION_MAX_AREA_RATIO * sum(r['width'] * r['height'] for r in rects):
+                    self._union = {'top': top, 'left': left, 'width': width, 'height': height}
+            self._gray = None # Reallocated on the next grab_gray()
+
+    def set_region(self, region):
+        self.set_regions({DEFAULT_REGION_NAME: region} if region else {})
+
+    def _handle(self):
+        if self._sct is None or self._owner_thread != threading.get_ident():
+            self.close()
+            self._sct, self._owner_thread = mss(), threading.get_ident()
+        return self._sct
+
+    @staticmethod
+    def _as_array(shot):
+        # Each mss grab owns a fresh bytearray, so the view stays valid after it is handed to another stage
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def grab_regions(self):
+        """Returns {name: (H, W, 4) BGRA view} for every region, or None if no region is set."""
+        with self._lock:
+            if not self._regions: return None
+            sct = self._handle()
+            self.grabs += 1
+            if self._union is None: return {name: self._as_array(sct.grab(region)) for name, region in self._regions.items()}
+            frame, top, left = self._as_array(sct.grab(self._union)), self._union['top'], self._union['left']
+            return {name: frame[r['top'] - top:r['top'] - top + r['height'], r['left'] - left:r['left'] - left + r['width']]
+                    for name, r in self._regions.items()}
+
+    def grab(self):
+        """Returns the first region as an (H, W, 4) BGRA view, or None if no region is set."""
+        frames = self.grab_regions()
+        return next(iter(frames.values())) if frames else None
+
+    def grab_gray(self):
+        """Grabs and converts BGRA->gray into the reusable buffer (valid until the next grab_gray call)."""
+        bgra = self.grab()
+        if bgra is None: return None
+        if self._gray is None or self._gray.shape != bgra.shape[:2]:
+            self._gray = np.empty(bgra.shape[:2], dtype=np.uint8)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2GRAY, dst=self._gray)
+
+    def close(self):
+        if self._sct is not None:
+            try: self._sct.close()
+            except Exception: pass
+        self._sct, self._owner_thread = None, None
+
+screen_grabber = ScreenGrabber()
+
+class ReplaySource:
+    """Capture source that replays a directory of screenshots (in name order) or a video file.
+
+    Same interface as ScreenGrabber, so the pipeline and benchmark_ocr.py run on a headless box.
+    grab() returns None once the frames run out, unless loop=True.
+    """
+    IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, path, loop=False):
+        if not os.path.exists(path): raise FileNotFoundError(f"Replay source not found: {path}")
+        self.path = path
+        self.loop = loop
+        self.grabs = 0
+        self.exhausted = False
+        self.current_name = None # File name (or "video#frame") of the frame last returned
+        self._lock = threading.Lock()
+        self._files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(self.IMAGE_EXTENSIONS)) if os.path.isdir(path) else None
+        self._video = None
+        self._position = 0
+        self._gray = None
+
+    def __len__(self):
+        if self._files is not None: return len(self._files)
+        video = cv2.VideoCapture(self.path)
+        try: return int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally: video.release()
+
+    def set_region(self, region):
+        pass # Frames are replayed whole
+
+    def set_regions(self, regions):
+        pass
+
+    def _next_file_frame(self):
+        while self._files:
+            if self._position >= len(self._files):
+                if not self.loop: return None
+                self._position = 0
+            path = self._files[self._position]
+            self._position += 1
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if frame is not None:
+                self.current_name = os.path.basename(path)
+                return frame
+            print(f"Replay: skipping unreadable image {path}")
+        return None
+
+    def _next_video_frame(self):
+        if self._video is None: self._video = cv2.VideoCapture(self.path)
+        ok, frame = self._video.read()
+        if not ok and self.loop and self._position:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0); self._position = 0
+            ok, frame = self._video.read()
+        if not ok: return None
+        self.current_name = f"{os.path.basename(self.path)}#{self._position}"
+        self._position += 1
+        return frame
+
+    def grab(self):
+        """Returns the next frame as (H, W, 4) BGRA like an mss grab, or None when the replay is over."""
+        with self._lock:
+            frame = self._next_file_frame() if self._files is not None else self._next_video_frame()
+            if frame is None:
+                self.exhausted = True
+                return None
+            self.grabs += 1
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+
+    def grab_regions(self):
+        """The whole frame as the single DEFAULT_REGION_NAME region."""
+        frame = self.grab()
+        return {DEFAULT_REGION_NAME: frame} if frame is not None else None
+
+    def grab_gray(self):
+        bgra = self.grab()
+        if bgra is None: return None
+        if self._gray is None or self._gray.shape != bgra.shape[:2]:
+            self._gray = np.empty(bgra.shape[:2], dtype=np.uint8)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2GRAY, dst=self._gray)
+
+    def close(self):
+        if self._video is not None: self._video.release()
+        self._video = None
+
+capture_source = screen_grabber # Where capture_frame() reads from; a ReplaySource with --replay
+
+# --- Frame Change Detection ---
+class FrameChangeDetector:
+    """Compares a downsampled grayscale thumbnail of each raw grab against the last OCR'd frame.
+
+    A frame only counts as changed when more than `min_changed_ratio` of the thumbnail pixels
+    differ by more than `pixel_tolerance`, so a blinking cursor or re-rendered anti-aliasing
+    does not trigger a full OCR pass.
+    """
+    def __init__(self, width=CHANGE_DETECT_WIDTH, pixel_tolerance=CHANGE_PIXEL_TOLERANCE, min_changed_ratio=CHANGE_MIN_CHANGED_RATIO):
+        self.width = width
+        self.pixel_tolerance = pixel_tolerance
+        self.min_changed_ratio = min_changed_ratio
+        self.reference = None # Thumbnail of the last frame that was sent to OCR
+        self.runs = 0
+        self.skips = 0
+        self.skips_since_run = 0
+        self.last_skip_streak = 0 # Unchanged frames skipped before the most recent OCR run
+        self._resized = None # Scratch buffers reused between frames
+        self._scratch = None
+
+    def thumbnail(self, img_np):
+        """Downsamples into reused scratch buffers, so a skipped frame allocates nothing."""
+        h, w = img_np.shape[:2]
+        size = (self.width, max(1, round(h * self.width / w))) if w > self.width else (w, h)
+        if img_np.ndim == 3:
+            if size != (w, h):
+                if self._resized is None or self._resized.shape != (size[1], size[0], img_np.shape[2]):
+                    self._resized = np.empty((size[1], size[0], img_np.shape[2]), dtype=np.uint8)
+                img_np = cv2.resize(img_np, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+            if self._scratch is None or self._scratch.shape != (size[1], size[0]):
+                self._scratch = np.empty((size[1], size[0]), dtype=np.uint8)
+            return cv2.cvtColor(img_np, cv2.COLOR_BGRA2GRAY if img_np.shape[2] == 4 else cv2.COLOR_BGR2GRAY, dst=self._scratch)
+        return cv2.resize(img_np, size, interpolation=cv2.INTER_AREA) if size != (w, h) else img_np.copy()
+
+    def has_changed(self, thumb):
+        if self.reference is None or self.reference.shape != thumb.shape: return True
+        diff = cv2.absdiff(thumb, self.reference)
+        changed = np.count_nonzero(diff > self.pixel_tolerance)
+        return changed > self.min_changed_ratio * diff.size
+
+    def should_process(self, img_np):
+        """Returns True (and records the frame as the new reference) if OCR should run on this grab."""
+        thumb = self.thumbnail(img_np)
+        if not self.has_changed(thumb):
+            self.skips += 1; self.skips_since_run += 1
+            return False
+        # Swap buffers: the old reference becomes the scratch space for the next frame
+        self.reference, self._scratch = thumb, (self.reference if self.reference is not None and self.reference.shape == thumb.shape else None)
+        self.runs += 1
+        self.last_skip_streak, self.skips_since_run = self.skips_since_run, 0
+        return True
+
+    def reset(self):
+        self.reference = None
+        self.skips_since_run = 0
+
+    def stats_line(self):
+        total = self.runs + self.skips
+        ratio = (self.skips / total * 100) if total else 0.0
+        return f"OCR runs: {self.runs}, unchanged frames skipped: {self.skips} ({ratio:.1f}%)"
+
+
+# --- Single-slot "latest value" queue (pipeline stages and SSE subscribers) ---
+class LatestSlot:
+    """Bounded single-slot queue between pipeline stages (and from the SSE broker to each client).
+
+    put() never blocks: an item that has not been consumed yet is replaced by the newer one
+    and counted as dropped, so a slow consumer always works on the freshest frame.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._cond = threading.Condition()
+        self._item = None
+        self._full = False
+        self.puts = 0
+        self.drops = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._full: self.drops += 1
+            self._item, self._full = item, True
+            self.puts += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Blocks until an item is available. Returns None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._full, timeout): return None
+            item, self._item, self._full = self._item, None, False
+            return item
+
+    def clear(self):
+        with self._cond: self._item, self._full = None, False
+
+    def depth(self):
+        return 1 if self._full else 0
+
+    def stats_line(self):
+        return f"{self.name}: depth {self.depth()}/1, put {self.puts}, dropped {self.drops}"
+
+
+# --- Adaptive Scheduler ---
+class AdaptiveScheduler:
+    """Paces the capture and OCR stages.
+
+    Capture polls every `fast` seconds after a change and doubles the interval on each idle poll,
+    up to `idle_max`. OCR is gated by a deficit token bucket in CPU-seconds, refilled at
+    `budget_percent` of all cores: an inference may start while the balance is positive and its
+    measured CPU time is charged afterwards. A change after an idle spell is OCR'd at once, while
+    sustained changes (scrolling, animations) are held to the budget.
+    """
+    def __init__(self, fast=CAPTURE_FAST_INTERVAL_SECONDS, idle_max=CAPTURE_IDLE_MAX_INTERVAL_SECONDS,
+                 budget_percent=OCR_CPU_BUDGET_PERCENT, burst_seconds=OCR_CPU_BURST_SECONDS):
+        self._lock = threading.Lock()
+        self.fast = fast
+        self.idle_max = idle_max
+        self.capture_interval = fast
+        self.set_budget(budget_percent, burst_seconds)
+        self.inferences = 0
+        self.budget_waits = 0
+        self.cpu_seconds = 0.0
+        self.last_cost = 0.0
+
+    def set_budget(self, budget_percent, burst_seconds=OCR_CPU_BURST_SECONDS):
+        with self._lock:
+            self.budget_percent = budget_percent
+            self.rate = max(1e-3, budget_percent / 100 * (os.cpu_count() or 1)) # CPU-seconds granted per second
+            self.capacity = self.rate * burst_seconds
+            self.balance = self.capacity
+            self._refilled_at = time.perf_counter()
+
+    def on_capture(self, changed):
+        """Returns the delay before the next capture poll."""
+        self.capture_interval = self.fast if changed else min(self.idle_max, self.capture_interval * 2)
+        return self.capture_interval
+
+    def _refill(self):
+        now = time.perf_counter()
+        self.balance = min(self.capacity, self.balance + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def ocr_wait(self):
+        """Seconds until the CPU budget allows the next inference (0 if it may start now)."""
+        with self._lock:
+            self._refill()
+            return 0.0 if self.balance > 0 else -self.balance / self.rate
+
+    def charge(self, cpu_seconds):
+        with self._lock:
+            self._refill()
+            self.balance -= cpu_seconds
+            self.inferences += 1
+            self.cpu_seconds += cpu_seconds
+            self.last_cost = cpu_seconds
+
+    def stats_line(self):
+        mean = self.cpu_seconds / self.inferences * 1000 if self.inferences else 0.0
+        return (f"Scheduler: {self.inferences} inferences, mean CPU {mean:.0f} ms, waited for budget {self.budget_waits} time(s) "
+                f"(budget {self.budget_percent}% of {os.cpu_count()} cores, capture interval now {self.capture_interval * 1000:.0f} ms)")
+
+scheduler = AdaptiveScheduler()
+
+# --- Stage Metrics ---
+class StageMetrics:
+    """Latency of each pipeline stage: cumulative Prometheus histograms plus rolling quantiles.
+
+    Stages: grab, preprocess, detection, recognition, cleaning, search, sse_write (publish ->
+    written to a client), render (browser, from the page's beacon) and capture_to_publish, plus
+    the one-off timings engine_load, engine_warmup, launch_to_first_result and calibration.
+    """
+    def __init__(self, buckets=METRICS_BUCKETS, window=METRICS_WINDOW_SAMPLES):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.window = window
+        self._stages = {} # stage -> {'counts': per-bucket counts, 'sum', 'count', 'recent': deque}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0, 'recent': collections.deque(maxlen=self.window)}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound: entry['counts'][i] += 1; break
+            entry['sum'] += seconds
+            entry['count'] += 1
+            entry['recent'].append(seconds)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try: yield
+        finally: self.observe(stage, time.perf_counter() - start)
+
+    def _snapshot(self):
+        with self._lock:
+            return {stage: (list(e['counts']), e['sum'], e['count'], sorted(e['recent'])) for stage, e in self._stages.items()}
+
+    @staticmethod
+    def _quantile(sorted_values, q):
+        return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))] if sorted_values else 0.0
+
+    def prometheus_text(self):
+        snapshot = self._snapshot()
+        out = ["# HELP ibos_stage_seconds Latency of each OCR pipeline stage.", "# TYPE ibos_stage_seconds histogram"]
+        for stage, (counts, total, count, _) in snapshot.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                out.append(f'ibos_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            out.append(f'ibos_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            out.append(f'ibos_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            out.append(f'ibos_stage_seconds_count{{stage="{stage}"}} {count}')
+        out += [f"# HELP ibos_stage_recent_seconds Quantiles over the last {self.window} samples of each stage.", "# TYPE ibos_stage_recent_seconds gauge"]
+        for stage, (_, _, _, recent) in snapshot.items():
+            for q in METRICS_QUANTILES:
+                out.append(f'ibos_stage_recent_seconds{{stage="{stage}",quantile="{q}"}} {self._quantile(recent, q):.6f}')
+        return "\n".join(out) + "\n"
+
+    def stats_lines(self):
+        lines = []
+        for stage, (_, total, count, recent) in self._snapshot().items():
+            p50, p90 = self._quantile(recent, 0.5) * 1000, self._quantile(recent, 0.9) * 1000
+            lines.append(f"{stage:<22} n={count:<6} mean {total / count * 1000:8.1f} ms  p50 {p50:8.1f} ms  p90 {p90:8.1f} ms")
+        return lines
+
+stage_metrics = StageMetrics()
+
+def other_metrics_text():
+    """Gauges/counters besides the stage timings, in Prometheus text format."""
+    out = ["# HELP ibos_sse_clients Connected SSE clients.", "# TYPE ibos_sse_clients gauge", f"ibos_sse_clients {sse_broker.client_count()}",
+           "# HELP ibos_engine_ready Whether the OCR model is loaded and warmed up.", "# TYPE ibos_engine_ready gauge", f"ibos_engine_ready {int(engine_ready.is_set())}",
+           "# HELP ibos_pipeline_dropped_total Frames replaced in a pipeline slot before being consumed.", "# TYPE ibos_pipeline_dropped_total counter"]
+    out += [f'ibos_pipeline_dropped_total{{slot="{slot.name}"}} {slot.drops}' for slot in (capture_slot, publish_slot)]
+    if frame_change_detectors:
+        out += ["# HELP ibos_frames_skipped_total Captures of a region skipped because it did not change.", "# TYPE ibos_frames_skipped_total counter"]
+        out += [f'ibos_frames_skipped_total{{region="{name}"}} {detector.skips}' for name, detector in list(frame_change_detectors.items())]
+    out += ["# HELP ibos_capture_interval_seconds Current capture poll interval (adaptive).", "# TYPE ibos_capture_interval_seconds gauge",
+            f"ibos_capture_interval_seconds {scheduler.capture_interval}",
+            "# HELP ibos_ocr_cpu_balance_seconds CPU-seconds left in the OCR budget (negative: waiting).", "# TYPE ibos_ocr_cpu_balance_seconds gauge",
+            f"ibos_ocr_cpu_balance_seconds {scheduler.balance:.4f}",
+            "# HELP ibos_ocr_cpu_seconds_total CPU time spent in OCR inference.", "# TYPE ibos_ocr_cpu_seconds_total counter",
+            f"ibos_ocr_cpu_seconds_total {scheduler.cpu_seconds:.4f}"]
+    if result_cache:
+        out += ["# HELP ibos_result_cache_hits_total OCR result cache hits.", "# TYPE ibos_result_cache_hits_total counter",
+                f"ibos_result_cache_hits_total {result_cache.hits}"]
+    return "\n".join(out) + "\n"
+
+# --- cProfile Capture (toggled by PROFILE_HOTKEY) ---
+class ThreadProfiler:
+    """cProfile only sees the thread that enabled it, so each pipeline thread calls sync() once per
+    iteration and starts/stops its own profiler when the capture is toggled."""
+    def __init__(self):
+        self.active = False
+        self._local = threading.local()
+        self._started = None
+
+    def toggle(self):
+        self.active = not self.active
+        if self.active: self._started = time.strftime('%Y%m%d_%H%M%S')
+        print(f"\n--- cProfile capture {'started' if self.active else 'stopping'} (OCR and publish threads) ---")
+
+    def sync(self):
+        profiler = getattr(self._local, 'profiler', None)
+        if self.active and profiler is None:
+            self._local.profiler = profiler = cProfile.Profile()
+            profiler.enable()
+        elif not self.active and profiler is not None:
+            self.stop_thread()
+
+    def stop_thread(self):
+        """Called when a pipeline thread exits, so a capture still running at shutdown is not lost."""
+        profiler = getattr(self._local, 'profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            self._local.profiler = None
+            self._dump(profiler)
+
+    def _dump(self, profiler):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"ocr_profile_{self._started}_{threading.current_thread().name}.prof")
+        profiler.dump_stats(path)
+        print(f"\ncProfile of thread '{threading.current_thread().name}' written to {path} (view with: python -m pstats {path})")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+
+stage_profiler = ThreadProfiler()
+
+# --- SSE Broadcast Broker ---
+class EventSlot(LatestSlot):
+    """LatestSlot that keeps the newest pending event of each SSE event type, handed out oldest first.
+
+    A burst of OCR results still collapses to the newest one, but a status or bank event does not
+    replace a result the client has not been sent yet.
+    """
+    def __init__(self, name):
+        super().__init__(name)
+        self._items = {} # event type (or the CLOSED sentinel) -> newest pending event, in publish order
+
+    def put(self, item):
+        key = item[1] if isinstance(item, tuple) else item
+        with self._cond:
+            if self._items.pop(key, None) is not None: self.drops += 1
+            self._items[key] = item
+            self.puts += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout): return None
+            return self._items.pop(next(iter(self._items)))
+
+    def clear(self):
+        with self._cond: self._items.clear()
+
+    def depth(self):
+        return len(self._items)
+
+    def stats_line(self):
+        return f"{self.name}: depth {self.depth()}, put {self.puts}, dropped {self.drops}"
+
+class SSEBroker:
+    """Fans every published event out to all connected SSE clients.
+
+    Each subscriber owns an EventSlot, so a slow client only ever skips to the newest event of
+    each type and never holds up the publisher or the other clients.
+    """
+    CLOSED = object() # Sentinel pushed to subscribers on shutdown
+
+    def __init__(self, history_size=SSE_HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._history = collections.deque(maxlen=history_size) # (event_id, event_type, data, published_at)
+        self._next_id = 1
+
+    def publish(self, data, event_type=None):
+        with self._lock:
+            event = (self._next_id, event_type, data, time.perf_counter())
+            self._next_id += 1
+            self._history.append(event)
+            for slot in self._subscribers.values(): slot.put(event)
+        return event[0]
+
+    def subscribe(self, client_address, last_event_id=None):
+        """Registers a client. Replays the newest event of each type it has not seen (all current ones for new clients), oldest first."""
+        slot = EventSlot(f"sse {client_address[0]}:{client_address[1]}")
+        with self._lock:
+            self._subscribers[client_address] = slot
+            missed = {event[1]: event for event in self._history if last_event_id is None or event[0] > last_event_id}
+            for event in sorted(missed.values()): slot.put(event[:3] + (None,)) # Replays are not counted as enqueue-to-write latency
+        return slot
+
+    def published_at(self, event_id):
+        with self._lock:
+            return next((event[3] for event in self._history if event[0] == event_id), None)
+
+    def unsubscribe(self, client_address):
+        with self._lock: self._subscribers.pop(client_address, None)
+
+    def close(self):
+        with self._lock:
+            for slot in self._subscribers.values(): slot.put(self.CLOSED)
+
+    def client_count(self):
+        with self._lock: return len(self._subscribers)
+
+    def stats_lines(self):
+        with self._lock: return [slot.stats_line() for slot in self._subscribers.values()]
+
+sse_broker = SSEBroker()
 
 # --- Custom HTTP Handler with SSE ---
 class RequestHandler(http.server.SimpleHTTPRequestHandler):
@@ -135,67 +857,146 @@ class RequestHandler(http.server.SimpleHTTPRequestHandler):
             path += '/'
         return path
 
+    def accepted_encodings(self):
+        accepted = set()
+        for part in self.headers.get('Accept-Encoding', '').split(','):
+            coding, _, params = part.partition(';')
+            if re.fullmatch(r'\s*q\s*=\s*0(\.0*)?\s*', params): continue # Explicitly refused
+            if coding.strip(): accepted.add(coding.strip().lower())
+        return accepted
 
-    def do_GET(self):
-        global sse_message_queue, running
-        # Handle SSE connection request
-        if self.path == SSE_ENDPOINT:
+    # Override send_head to add ETag revalidation and precompressed sidecar negotiation
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path): return super().send_head() # Directories, 404s
+        st = os.stat(path)
+
+        serve_path, encoding = path, None
+        accepted = self.accepted_encodings()
+        for coding, suffix in SIDECAR_ENCODINGS:
+            sidecar = path + suffix
+            if coding in accepted and os.path.isfile(sidecar) and os.stat(sidecar).st_mtime_ns >= st.st_mtime_ns:
+                serve_path, encoding = sidecar, coding; break # Only use sidecars at least as new as the source
+
+        # Each representation (identity / br / gzip) gets its own strong ETag
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}' + (f'-{encoding}"' if encoding else '"')
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            not_modified = any(tag.strip() in ('*', etag, 'W/' + etag) for tag in if_none_match.split(','))
+        else:
+            try: not_modified = email.utils.parsedate_to_datetime(self.headers.get('If-Modified-Since')).timestamp() >= int(st.st_mtime)
+            except (TypeError, ValueError): not_modified = False
+
+        if not_modified:
+            self.send_response(304)
+        else:
+            try: f = open(serve_path, 'rb')
+            except OSError: self.send_error(404, "File not found"); return None
             self.send_response(200)
-            self.send_header('Content-Type', 'text/event-stream')
-            self.send_header('Cache-Control', 'no-cache')
-            self.send_header('Connection', 'keep-alive')
-            self.send_header('Access-Control-Allow-Origin', '*') # Allow connections from file:/// or other origins if needed
-            self.end_headers()
+            self.send_header('Content-Type', self.guess_type(path))
+            if encoding: self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+        if bank_watcher and bank_watcher.version and os.path.basename(path) in bank_watcher.served_files:
+            self.send_header(BANK_VERSION_HEADER, bank_watcher.version)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.date_time_string(st.st_mtime))
+        self.send_header('Cache-Control', STATIC_CACHE_CONTROL)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        return None if not_modified else f
 
-            print(f"SSE Client connected: {self.client_address}")
-            local_queue = queue.Queue() # Each client gets its own queue copy mechanism (not ideal, but simple)
-            sse_clients.append(local_queue) # Add this client's queue to the global list
 
-            try:
-                while running: # Keep connection open while script is running
-                    try:
-                        # Use select for non-blocking check on the socket
-                        # This allows checking the `running` flag more frequently
-                        ready_to_read, _, _ = select.select([self.rfile], [], [], 0.1)
-                        if ready_to_read:
-                            # If client sends data or closes connection, reading will succeed/fail
-                            if not self.rfile.read(1): # Try reading 1 byte
-                                print(f"SSE Client {self.client_address} closed connection (read check).")
-                                break # Client likely disconnected
-
-                        # Check our message queue (non-blocking)
-                        message = None
-                        while not sse_message_queue.empty(): # Drain the global queue into local
-                            msg_item = sse_message_queue.get_nowait()
-                            message = msg_item # Keep the last message if multiple came quickly
-                            sse_message_queue.task_done()
-
-                        if message is not None:
-                            # Format and send SSE message: data: message_content\n\n
-                            sse_data = f"data: {message}\n\n"
-                            self.wfile.write(sse_data.encode('utf-8'))
-                            self.wfile.flush() # Ensure data is sent immediately
-                            # print(f"Sent to {self.client_address}: {message}") # Optional: Verbose logging
-
-                    except queue.Empty:
-                        time.sleep(0.1) # Wait briefly if queue is empty
-                        continue
-                    except BrokenPipeError:
-                         print(f"SSE Client {self.client_address} disconnected (BrokenPipeError).")
-                         break # Exit loop if client disconnects
-                    except ConnectionResetError:
-                         print(f"SSE Client {self.client_address} disconnected (ConnectionResetError).")
-                         break
-                    except Exception as e:
-                         print(f"Error in SSE loop for {self.client_address}: {e}")
-                         break # Exit on other errors too
-            finally:
-                print(f"SSE Client disconnected: {self.client_address}")
-                # Clean up: Remove this client's queue (needs robust handling if queues are shared)
-                # Simple approach for this example: clear the global list (not ideal for multiple clients)
-                # A better approach would involve unique client IDs and removing specific queues.
-                # For simplicity here, we just note disconnection. If using shared queues, proper removal is crucial.
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_search(self, query_string):
+        params = urllib.parse.parse_qs(query_string)
+        query = params.get('q', [''])[0]
+        try: top_k = max(1, min(SEARCH_MAX_TOP_K, int(params.get('k', [DEFAULT_TOP_K])[0])))
+        except ValueError: top_k = DEFAULT_TOP_K
+        if question_index is None:
+            self.send_json({'error': 'Question index not loaded'}, status=503); return
+        search_start = time.perf_counter()
+        results = question_index.search(query, top_k)
+        self.send_json({'query': query, 'took_ms': round((time.perf_counter() - search_start) * 1000, 2), 'results': results})
+
+    def handle_sse(self):
+        try: last_event_id = int(self.headers.get('Last-Event-ID', ''))
+        except ValueError: last_event_id = None
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'keep-alive')
+        self.send_header('Access-Control-Allow-Origin', '*') # Allow connections from file:/// or other origins if needed
+        self.end_headers()
+
+        print(f"SSE Client connected: {self.client_address} (clients: {sse_broker.client_count() + 1})")
+        slot = sse_broker.subscribe(self.client_address, last_event_id)
+        try:
+            self.wfile.write(f"retry: {SSE_RETRY_MS}\n\n".encode('utf-8')); self.wfile.flush()
+            while running:
+                # Blocks until the broker hands us an event; times out only to send a heartbeat
+                event = slot.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is SSEBroker.CLOSED: break
+                if event is None:
+                    self.wfile.write(b": heartbeat\n\n") # Also detects clients that went away silently
+                else:
+                    event_id, event_type, data, published_at = event
+                    lines = [f"id: {event_id}"]
+                    if event_type: lines.append(f"event: {event_type}")
+                    lines.extend(f"data: {line}" for line in str(data).split('\n'))
+                    self.wfile.write(("\n".join(lines) + "\n\n").encode('utf-8'))
+                self.wfile.flush() # Ensure data is sent immediately
+                if event is not None and published_at is not None: stage_metrics.observe('sse_write', time.perf_counter() - published_at)
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+        except Exception as e:
+            print(f"Error in SSE loop for {self.client_address}: {e}")
+        finally:
+            sse_broker.unsubscribe(self.client_address)
+            print(f"SSE Client disconnected: {self.client_address} (clients: {sse_broker.client_count()})")
+
+    def handle_metrics(self):
+        body = (stage_metrics.prometheus_text() + other_metrics_text()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_render_beacon(self):
+        """Records the page's render time for an SSE event (and publish -> rendered, measured here)."""
+        try:
+            beacon = json.loads(self.rfile.read(min(int(self.headers.get('Content-Length', 0)), 4096)) or b'{}')
+            stage_metrics.observe('render', max(0.0, float(beacon['ms'])) / 1000)
+            published_at = sse_broker.published_at(int(beacon['id']))
+            if published_at is not None: stage_metrics.observe('publish_to_render', time.perf_counter() - published_at)
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400, "Expected JSON {id, ms}"); return
+        self.send_response(204)
+        self.end_headers()
 
+    def do_POST(self):
+        if self.path.partition('?')[0] == RENDER_BEACON_ENDPOINT: self.handle_render_beacon()
+        else: self.send_error(405, "Method not allowed")
+
+    def do_GET(self):
+        url_path, _, query_string = self.path.partition('?')
+        if url_path == SEARCH_ENDPOINT:
+            self.handle_search(query_string)
+        elif url_path == METRICS_ENDPOINT:
+            self.handle_metrics()
+        # Handle SSE connection request
+        elif url_path == SSE_ENDPOINT:
+            self.handle_sse()
 
         # Handle regular file requests (HTML, JSON, JS etc.)
         else:
@@ -211,10 +1012,10 @@ def start_web_server(port, directory):
         from functools import partial
         handler_with_directory = partial(RequestHandler, directory=directory)
 
-        socketserver.TCPServer.allow_reuse_address = True
-        httpd = socketserver.TCPServer((SERVER_ADDRESS, port), handler_with_directory)
+        # Threaded server: each long-lived SSE connection gets its own thread and never blocks file requests
+        httpd = http.server.ThreadingHTTPServer((SERVER_BIND_ADDRESS, port), handler_with_directory)
 
-        print(f"Serving HTTP+SSE on http://{SERVER_ADDRESS}:{port}/ from directory {directory}...")
+        print(f"Serving HTTP+SSE on http://{SERVER_BIND_ADDRESS}:{port}/ from directory {directory}...")
         server_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
         server_thread.start()
         return True
@@ -228,71 +1029,678 @@ def start_web_server(port, directory):
 # stop_web_server remains the same
 def stop_web_server():
     global httpd, server_thread
+    sse_broker.close() # Release handler threads blocked waiting for events
     if httpd:
         print("\nShutting down web server..."); httpd.shutdown(); httpd.server_close()
         print("Web server stopped.")
     if server_thread and server_thread.is_alive(): server_thread.join(timeout=1)
 
 
-# --- OCR Cycle ---
-def perform_ocr_and_search_cycle():
-    global capture_region_coords, ocr_instance, last_cleaned_text, sse_message_queue
+# --- Incremental Line Recognition ---
+def line_box(points):
+    """Axis-aligned (x0, y0, x1, y1) bounds of a detected quadrilateral."""
+    points = np.asarray(points)
+    return (int(points[:, 0].min()), int(points[:, 1].min()), int(np.ceil(points[:, 0].max())), int(np.ceil(points[:, 1].max())))
 
-    if not capture_region_coords or ocr_instance is None: return
+def detect_and_recognize(img):
+    """Detection, then one batched recognition call over the line crops (timed as separate stages).
 
-    try:
-        with mss() as sct: sct_img = sct.grab(capture_region_coords)
-        img_np = np.array(sct_img)
-        processed_image = preprocess_screen_capture(img_np)
-        if processed_image is None: return
+    Returns [(box, text)] in reading order, box = (x0, y0, x1, y1). Low-confidence lines keep their
+    box (so IncrementalRecognizer still treats their ink as known layout) but get empty text.
+    """
+    boxes = detect_text_boxes(img)
+    results = recognize_crops_scored([img[y0:y1, x0:x1] for x0, y0, x1, y1 in boxes])
+    return [(box, text if score >= REC_DROP_SCORE else "") for box, (text, score) in zip(boxes, results)]
+
+def detect_text_boxes(img):
+    """Detection-only engine pass. Returns line boxes in reading order (top to bottom, then left to right)."""
+    with stage_metrics.time('detection'):
+        quads = ocr_engine.detect(img)
+    if not quads: return []
+    height, width = img.shape[:2]
+    boxes = [(max(0, x0), max(0, y0), min(width, x1), min(height, y1)) for x0, y0, x1, y1 in (line_box(points) for points in quads)]
+    boxes = sorted((b for b in boxes if b[2] > b[0] and b[3] > b[1]), key=lambda b: (b[1], b[0]))
+    # Same ordering fix-up as PaddleOCR's sorted_boxes: boxes on one visual line go left to right
+    for i in range(len(boxes) - 1):
+        for j in range(i, -1, -1):
+            if abs(boxes[j + 1][1] - boxes[j][1]) < 10 and boxes[j + 1][0] < boxes[j][0]:
+                boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+            else: break
+    return boxes
+
+def recognize_crops_scored(crops):
+    """Recognition-only engine call for a batch of line crops. Returns one (text, score) per crop."""
+    if not crops: return []
+    with stage_metrics.time('recognition'):
+        return ocr_engine.recognize_batch(crops)
+
+class IncrementalRecognizer:
+    """Caches the text-line boxes of the last full detection and only re-recognizes lines whose pixels changed.
+
+    Each line crop is hashed; unchanged lines reuse their previous text. If the lines moved together,
+    the vertical scroll offset is estimated from the row ink profile and the boxes are shifted instead
+    of re-detected. A full detection only runs when text appears outside the (shifted) boxes.
+    """
+    def __init__(self):
+        self.reset()
+        self.full_detections = 0
+        self.incremental_runs = 0
+        self.lines_recognized = 0
+        self.lines_reused = 0
+        self.scrolls_tracked = 0
+
+    def reset(self):
+        self.shape = None
+        self._pending = None # (shape, boxes, hashes, texts with None for lines to recognize, profile) between plan() and commit()
+        self.boxes = []
+        self.line_hashes = []
+        self.line_texts = []
+        self.row_profile = None
+
+    @staticmethod
+    def _line_hash(img, box):
+        x0, y0, x1, y1 = box
+        return hashlib.blake2b(np.ascontiguousarray(img[y0:y1, x0:x1]).data, digest_size=8).digest()
+
+    def _estimate_scroll(self, profile):
+        """Vertical shift (pixels) that best aligns the new row ink profile with the cached one, or 0."""
+        old = self.row_profile
+        height = len(profile)
+        max_shift = int(height * SCROLL_MAX_FRACTION)
+        def error(dy):
+            if dy >= 0: a, b = old[:height - dy], profile[dy:]
+            else: a, b = old[-dy:], profile[:height + dy]
+            return float(np.abs(a - b).mean()) if len(a) else float('inf')
+        base = error(0)
+        best_dy = min(range(-max_shift, max_shift + 1), key=error, default=0)
+        return best_dy if best_dy and error(best_dy) < 0.5 * base else 0
+
+    def _plan_full_pass(self, img, profile):
+        boxes = detect_text_boxes(img)
+        self.full_detections += 1
+        self.lines_recognized += len(boxes)
+        self._pending = (img.shape, boxes, [self._line_hash(img, box) for box in boxes], [None] * len(boxes), profile)
+        return [img[y0:y1, x0:x1] for x0, y0, x1, y1 in boxes]
+
+    def recognize(self, img):
+        """Returns the raw OCR text (lines joined in reading order) for a preprocessed image."""
+        return self.commit(recognize_crops_scored(self.plan(img)))
+
+    def plan(self, img):
+        """First half of recognize(): works out the line crops that need recognition and returns them.
+
+        Split from commit() so the crops of several regions can share one recognition batch.
+        """
+        ink = text_ink(img)
+        profile = ink.sum(axis=1).astype(np.int32)
+        if self.shape != img.shape: return self._plan_full_pass(img, profile)
+
+        known = dict(zip(self.line_hashes, self.line_texts))
+        boxes = self.boxes
+        hashes = [self._line_hash(img, box) for box in boxes]
+        if hashes != self.line_hashes:
+            dy = self._estimate_scroll(profile)
+            if dy:
+                # Keep only lines that are still fully visible after the scroll
+                shifted = [(x0, y0 + dy, x1, y1 + dy) for x0, y0, x1, y1 in boxes]
+                shifted = [box for box in shifted if box[1] >= 0 and box[3] <= img.shape[0]]
+                shifted_hashes = [self._line_hash(img, box) for box in shifted]
+                # Only trust the scroll estimate if it lets more lines be reused than staying put
+                if sum(h in known for h in shifted_hashes) > sum(h in known for h in hashes):
+                    boxes, hashes = shifted, shifted_hashes
+                    self.scrolls_tracked += 1
+
+        # Text outside every cached box means lines were added/moved: the layout has to be re-detected
+        outside = ink.copy()
+        for x0, y0, x1, y1 in boxes: outside[y0:y1, x0:x1] = False
+        if np.count_nonzero(outside) > LAYOUT_INK_TOLERANCE * ink.size: return self._plan_full_pass(img, profile)
+
+        texts = [known.get(h) for h in hashes]
+        todo = [i for i, text in enumerate(texts) if text is None]
+        self.incremental_runs += 1
+        self.lines_recognized += len(todo)
+        self.lines_reused += len(texts) - len(todo)
+        self._pending = (img.shape, boxes, hashes, texts, profile)
+        return [img[y0:y1, x0:x1] for x0, y0, x1, y1 in (boxes[i] for i in todo)]
+
+    def commit(self, results):
+        """Second half of recognize(): takes one (text, score) per planned crop and returns the raw text.
+
+        Low-confidence lines keep their box (their ink stays known layout) but contribute no text.
+        """
+        shape, boxes, hashes, texts, profile = self._pending
+        results = iter(results)
+        for i, text in enumerate(texts):
+            if text is None:
+                text, score = next(results)
+                texts[i] = text if score >= REC_DROP_SCORE else ""
+        self.shape, self.boxes, self.line_hashes, self.line_texts, self.row_profile = shape, boxes, hashes, texts, profile
+        self._pending = None
+        return "".join(texts)
+
+    def stats_line(self):
+        return (f"Full detections: {self.full_detections}, incremental runs: {self.incremental_runs} "
+                f"(lines re-recognized: {self.lines_recognized}, reused: {self.lines_reused}, scrolls tracked: {self.scrolls_tracked})")
+
+# --- Result Cache ---
+class ResultCache:
+    """Bounded LRU cache keyed by a hash of the preprocessed capture: text -> OCR text, plus its resolved matches.
+
+    Entries expire after `ttl` seconds. Matches depend on the question bank, so they are dropped
+    (texts are kept) whenever the size/mtime fingerprint of `bank_paths` (the files question_index is
+    built from) changes.
+    """
+    def __init__(self, bank_paths, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL_SECONDS, persist_path=None):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # key -> {'time', 'text', 'matches'}
+        self.bank_paths = bank_paths
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.bank_fingerprint = self._current_bank_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        self.match_hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(image, engine=''):
+        """Hash of the preprocessed capture and the engine that read it (another backend or model may read it differently)."""
+        digest = hashlib.blake2b(engine.encode() + b'\0', digest_size=16, person=str(image.shape).encode()[:16])
+        digest.update(np.ascontiguousarray(image).data)
+        return digest.hexdigest()
+
+    def _current_bank_fingerprint(self):
+        return ",".join(BankWatcher._fingerprint(path) or '-' for path in self.bank_paths)
+
+    def _check_bank(self):
+        fingerprint = self._current_bank_fingerprint()
+        if fingerprint != self.bank_fingerprint:
+            for entry in self._entries.values(): entry['matches'] = None
+            self.bank_fingerprint = fingerprint
+            print(f"[{time.strftime('%H:%M:%S')}] Question bank changed, cached matches invalidated.")
+
+    def invalidate_matches(self):
+        """Drops every cached match. Called once the index holds the new bank (matches cached in between are stale)."""
+        with self._lock:
+            for entry in self._entries.values(): entry['matches'] = None
+            self.bank_fingerprint = self._current_bank_fingerprint()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None: return None
+        if time.time() - entry['time'] > self.ttl:
+            del self._entries[key]; self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_text(self, key):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None: self.misses += 1; return None
+            self.hits += 1
+            return entry['text']
+
+    def get_matches(self, key):
+        with self._lock:
+            self._check_bank()
+            entry = self._lookup(key)
+            if entry is None or entry['matches'] is None: return None
+            self.match_hits += 1
+            return entry['matches']
+
+    def _insert(self, key, text):
+        self._entries[key] = {'time': time.time(), 'text': text, 'matches': None}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False); self.evictions += 1
+
+    def put_text(self, key, text):
+        with self._lock: self._insert(key, text)
+
+    def ensure_text(self, key, text):
+        """Adds an entry unless `key` is cached (keeping its matches). Not counted as a hit or miss."""
+        with self._lock:
+            if self._lookup(key) is None: self._insert(key, text)
+
+    def put_matches(self, key, matches):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None: entry['matches'] = matches
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path): return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f: data = json.load(f)
+            same_bank = data.get('bank_fingerprint') == self.bank_fingerprint
+            now = time.time()
+            with self._lock:
+                for key, entry in data.get('entries', []):
+                    if now - entry['time'] > self.ttl: continue
+                    if not same_bank: entry['matches'] = None
+                    self._entries[key] = entry
+                while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+            print(f"Loaded {len(self._entries)} cached OCR result(s) from {self.persist_path}" + ("." if same_bank else " (bank changed, matches dropped)."))
+        except Exception as e: print(f"Error loading OCR result cache {self.persist_path}: {e}")
+
+    def save(self):
+        if not self.persist_path: return
+        try:
+            with self._lock: data = {'bank_fingerprint': self.bank_fingerprint, 'entries': list(self._entries.items())}
+            with open(self.persist_path, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False)
+            print(f"Saved {len(data['entries'])} cached OCR result(s) to {self.persist_path}")
+        except Exception as e: print(f"Error saving OCR result cache {self.persist_path}: {e}")
 
-        result = ocr_instance.ocr(processed_image, cls=False)
+    def stats_line(self):
+        total = self.hits + self.misses
+        ratio = (self.hits / total * 100) if total else 0.0
+        return f"Result cache: {len(self._entries)} entries, hits {self.hits}, misses {self.misses} ({ratio:.1f}% hit), match hits {self.match_hits}, evictions {self.evictions}"
 
-        if not result or not result[0]: return
+# --- Question Bank Hot Reload ---
+class BankWatcher:
+    """Polls the bank JSON (and questions.db) and pushes what changed to the server index and the open pages.
 
-        lines = [line[1][0] for res_list in result for line in res_list]
-        raw_text = "".join(lines).strip()
-        cleaned_text = clean_ocr_text(raw_text)
+    Records are grouped by question_key (bank_name + id). A group that changed in any way is sent as
+    removed + re-added, so applying a delta twice is harmless. `version` hashes the JSON content; the
+    page gets it with the bank file and reloads in full when a delta or result shows it missed one.
+    """
+    def __init__(self, json_path, db_path=None):
+        self.json_path = json_path
+        self.db_path = db_path # Set when question_index is a QuestionDB, which is refreshed when the database changes
+        self.index_paths = bank_index_paths(json_path, db_path) # What question_index (and the result cache fingerprint) follows
+        stem = os.path.splitext(os.path.basename(json_path))[0]
+        self.served_files = {os.path.basename(json_path), stem + '.compact.json'} # Bank files the page may load
+        self.version = None
+        self.groups = {} # question_key -> [records], as of `version`
+        self._seen = {} # (paths) -> fingerprints on the previous poll
+        self._loaded = {} # (paths) -> fingerprints last acted on
+        self.reloads = 0
 
-        # Check if cleaned text is valid and different from last time
-        if cleaned_text and cleaned_text != last_cleaned_text:
-            print(f"\n[{time.strftime('%H:%M:%S')}] OCR Found New Text:")
-            print(f"    Cleaned: '{cleaned_text}'")
+    @staticmethod
+    def _fingerprint(path):
+        try: st = os.stat(path); return f"{st.st_size}:{st.st_mtime_ns}"
+        except OSError: return None
 
-            last_cleaned_text = cleaned_text # Update history
+    def _settled_change(self, *paths):
+        """True once `paths` changed and then stayed the same for a poll (the extractor may still be writing)."""
+        current = tuple(self._fingerprint(path) for path in paths)
+        if current != self._seen.get(paths): self._seen[paths] = current; return False
+        if current == self._loaded.get(paths): return False
+        self._loaded[paths] = current
+        return True
+
+    def _read_groups(self):
+        with open(self.json_path, 'rb') as f: raw = f.read()
+        records = json.loads(raw)
+        if not isinstance(records, list): raise ValueError("top level is not a list")
+        groups = collections.defaultdict(list)
+        for record in records:
+            if isinstance(record, dict): groups[question_key(record)].append(record)
+        return dict(groups), hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+    def poll(self):
+        if self.db_path and self._settled_change(*self.index_paths):
+            question_index.refresh()
+            if result_cache: result_cache.invalidate_matches()
+            print(f"[{time.strftime('%H:%M:%S')}] {os.path.basename(self.db_path)} changed: {len(question_index)} questions.")
+        if not self._settled_change(self.json_path): return
+        with stage_metrics.time('bank_reload'):
+            try: groups, version = self._read_groups()
+            except (OSError, ValueError) as e: print(f"Error reading {self.json_path} (kept the previous bank): {e}"); return
+            if version == self.version: return
+            previous = self.version
+            removed = [key for key, records in self.groups.items() if groups.get(key) != records]
+            added = [key for key, records in groups.items() if self.groups.get(key) != records]
+            self.groups, self.version = groups, version
+            if previous is None: return # First read: the index was built from this file at startup
+            added_records = [record for key in added for record in groups[key]]
+            if not self.db_path: # A QuestionDB index only changes with the database, handled above
+                question_index.apply_delta(removed, added_records)
+                if result_cache: result_cache.invalidate_matches()
+            self.reloads += 1
+        sse_broker.publish(json.dumps({'from': previous, 'version': version, 'removed': [list(key) for key in removed], 'added': added_records},
+                                      ensure_ascii=False), event_type=BANK_DELTA_EVENT)
+        changed = len(set(removed) & set(added))
+        print(f"[{time.strftime('%H:%M:%S')}] Question bank changed: {len(added) - changed} added, {changed} changed, {len(removed) - changed} removed "
+              f"({len(groups)} questions). Delta sent to {sse_broker.client_count()} SSE client(s).")
+
+    def run(self):
+        self._seen[(self.json_path,)] = (self._fingerprint(self.json_path),) # Read the current bank on the first poll
+        if self.db_path:
+            self._seen[self.index_paths] = self._loaded[self.index_paths] = tuple(self._fingerprint(path) for path in self.index_paths)
+        while running:
+            try: self.poll()
+            except Exception as e: print(f"Error in question bank watcher: {e}")
+            time.sleep(BANK_WATCH_INTERVAL_SECONDS)
+
+def bank_index_paths(json_path, db_path=None):
+    """Files the server-side index is built from: questions.db (plus its write-ahead log) when in use, else the JSON."""
+    return (db_path, db_path + '-wal') if db_path else (json_path,)
+
+def start_bank_watcher(json_path, db_path=None):
+    global bank_watcher
+    bank_watcher = BankWatcher(json_path, db_path)
+    thread = threading.Thread(target=bank_watcher.run, name="bank-watcher", daemon=True)
+    thread.start()
+    return thread
+
+# --- Preprocessing Calibration ---
+def calibrate_strategy(img_np, normalize=PREPROCESS_NORMALIZE_ENABLED):
+    """Runs every preprocessing strategy (preprocess + detection + recognition) on one capture.
+
+    Returns (chosen strategy, {strategy: (seconds, confidence)}), or (None, {}) if no strategy found text.
+    Confidence is the mean line score, where lines another strategy found but this one missed count as 0.
+    The fastest strategy at or above CALIBRATION_MIN_CONFIDENCE is chosen, else the most confident one.
+    """
+    trials = {}
+    for strategy in PREPROCESS_STRATEGIES:
+        seconds, scores = float('inf'), []
+        try:
+            for _ in range(CALIBRATION_RUNS):
+                start = time.perf_counter()
+                processed = preprocess_screen_capture(img_np, strategy, normalize)
+                if processed is None: break
+                crops = [processed[y0:y1, x0:x1] for x0, y0, x1, y1 in detect_text_boxes(processed)]
+                scores = [score for _, score in recognize_crops_scored(crops)]
+                seconds = min(seconds, time.perf_counter() - start)
+        except Exception as e: # A strategy the engine cannot handle just loses; the others still calibrate
+            seconds, scores = float('inf'), []
+            if strategy not in calibration_failures:
+                calibration_failures.add(strategy)
+                print(f"Calibration: strategy '{strategy}' failed ({e}), skipping it.")
+        trials[strategy] = (seconds, scores)
+    lines = max(len(scores) for _, scores in trials.values())
+    if not lines: return None, {}
+    results = {strategy: (seconds, sum(scores) / lines) for strategy, (seconds, scores) in trials.items()}
+    confident = [strategy for strategy, (_, confidence) in results.items() if confidence >= CALIBRATION_MIN_CONFIDENCE]
+    if confident: return min(confident, key=lambda strategy: results[strategy][0]), results
+    return max(results, key=lambda strategy: results[strategy][1]), results
+
+def calibrate_region(name, img_np):
+    """Calibrates a region's preprocessing on this capture and keeps the result (in ocr_config.json for a live region).
+
+    Returns the strategy, or None if the capture has no text (the next frame tries again).
+    """
+    with stage_metrics.time('calibration'):
+        choice, results = calibrate_strategy(img_np)
+    if choice is None: return None
+    preprocess_strategies[name] = choice
+    summary = ", ".join(f"{strategy} {seconds * 1000:.0f} ms @ {confidence:.2f}" for strategy, (seconds, confidence) in results.items())
+    print(f"[{time.strftime('%H:%M:%S')}] Region {name!r} preprocessing calibrated: {choice} ({summary})")
+    if capture_source is screen_grabber and name in capture_regions:
+        capture_regions[name]['preprocess'] = choice; save_config(capture_regions)
+    return choice
+
+def region_strategy(name):
+    """PREPROCESS_STRATEGY, or under 'auto' the region's calibrated strategy (None until it is calibrated)."""
+    return preprocess_strategies.get(name) if PREPROCESS_STRATEGY == 'auto' else PREPROCESS_STRATEGY
+
+# --- OCR Stages ---
+def capture_frame():
+    """Grabs all capture regions in one pass. Returns {name: raw BGRA frame}, or None if no region changed since the last OCR run."""
+    with stage_metrics.time('grab'):
+        frames = capture_source.grab_regions()
+    if not frames: return None
+
+    # Skip preprocessing and inference entirely while every region is static
+    if CHANGE_DETECT_ENABLED:
+        with stage_metrics.time('change_detect'):
+            for name in frames:
+                if name not in frame_change_detectors: frame_change_detectors[name] = FrameChangeDetector()
+            # Every detector sees its region so each keeps its own reference frame
+            changed = [name for name, img_np in frames.items() if frame_change_detectors[name].should_process(img_np)]
+        if not changed: return None
+        streak = max(frame_change_detectors[name].last_skip_streak for name in changed)
+        if streak:
+            label = f"Region {', '.join(changed)}" if len(frames) > 1 else "Region"
+            print(f"[{time.strftime('%H:%M:%S')}] {label} changed after {streak} unchanged frame(s), running OCR.")
+    return frames
+
+def recognize_regions(images):
+    """OCRs preprocessed region images ({name: image}) with one recognition batch for all their lines. Returns {name: raw text}."""
+    plans, crops = {}, []
+    for name, img in images.items():
+        if LINE_CACHE_ENABLED:
+            if name not in line_recognizers: line_recognizers[name] = IncrementalRecognizer()
+            region_crops = line_recognizers[name].plan(img)
+        else:
+            region_crops = [img[y0:y1, x0:x1] for x0, y0, x1, y1 in detect_text_boxes(img)]
+        plans[name] = (len(crops), len(region_crops))
+        crops.extend(region_crops)
+    results = recognize_crops_scored(crops)
+    texts = {}
+    for name, (start, count) in plans.items():
+        scored = results[start:start + count]
+        texts[name] = line_recognizers[name].commit(scored) if LINE_CACHE_ENABLED else "".join(text for text, score in scored if score >= REC_DROP_SCORE)
+    return texts
+
+def recognize_frame(frames):
+    """Preprocesses and OCRs the raw region frames. Returns ({name: cleaned text or ''}, result cache key or None)."""
+    region_texts, keys, pending = {}, {}, {}
+    for name, img_np in frames.items():
+        strategy = region_strategy(name) or calibrate_region(name, img_np) or PREPROCESS_FALLBACK_STRATEGY
+        with stage_metrics.time('preprocess'):
+            processed_image = preprocess_screen_capture(img_np, strategy)
+        region_texts[name] = ""
+        if processed_image is None: continue
+        # A capture we have seen before (e.g. flipping back to a question, or a static options pane) skips inference entirely
+        if result_cache is not None:
+            keys[name] = result_cache.key_for(processed_image, ocr_engine.describe())
+            cached_text = result_cache.get_text(keys[name])
+            if cached_text is not None: region_texts[name] = cached_text; continue
+        pending[name] = processed_image
+
+    for name, raw_text in recognize_regions(pending).items():
+        with stage_metrics.time('cleaning'):
+            region_texts[name] = clean_ocr_text(raw_text.strip())
+        if name in keys: result_cache.put_text(keys[name], region_texts[name])
+
+    if len(keys) != len(frames): return region_texts, None
+    if len(keys) == 1: return region_texts, keys[next(iter(keys))]
+    # Matches of a region combination are cached under a key derived from the region keys (and how they are matched)
+    weights = [capture_regions.get(name, {}).get('weight', 1.0) for name in keys]
+    cache_key = hashlib.blake2b(json.dumps([REGION_MATCH_MODE, list(keys.items()), weights]).encode(), digest_size=16).hexdigest()
+    result_cache.ensure_text(cache_key, merge_region_texts(region_texts))
+    return region_texts, cache_key
+
+def merge_region_texts(region_texts):
+    """All regions' text in config order (e.g. stem then options), as one query."""
+    return "".join(region_texts.values())
+
+def accept_new_text(region_texts):
+    """Returns True (and records it) if the cleaned text of the regions is valid and different from last time."""
+    global last_cleaned_text
+    cleaned_text = merge_region_texts(region_texts)
+    if not cleaned_text or cleaned_text == last_cleaned_text: return False
+    print(f"\n[{time.strftime('%H:%M:%S')}] OCR Found New Text:")
+    if len(region_texts) > 1:
+        for name, text in region_texts.items(): print(f"    {name}: '{text}'")
+    else: print(f"    Cleaned: '{cleaned_text}'")
+    last_cleaned_text = cleaned_text # Update history
+    return True
+
+def resolve_matches(region_texts, top_k=DEFAULT_TOP_K):
+    """Looks the recognized text ({region name: cleaned text}) up in the in-process question index."""
+    if question_index is None: return []
+    with stage_metrics.time('search'):
+        if REGION_MATCH_MODE == 'weighted' and len(region_texts) > 1: return weighted_region_search(region_texts, top_k)
+        return question_index.search(merge_region_texts(region_texts), top_k)
+
+def weighted_region_search(region_texts, top_k=DEFAULT_TOP_K):
+    """Searches each region's text on its own and ranks questions by the region-weighted mean similarity.
+
+    A question missing from one region's candidates counts as similarity 0 for that region.
+    """
+    combined, total_weight = {}, 0.0
+    for name, text in region_texts.items():
+        weight = float(capture_regions.get(name, {}).get('weight', 1.0))
+        if not text or weight <= 0: continue
+        total_weight += weight
+        for match in question_index.search(text, RERANK_CANDIDATES):
+            question = match['question']
+            entry = combined.setdefault((question.get('bank_name'), question.get('id'), question.get('text')), {'question': question, 'score': 0.0, 'similarity': 0.0})
+            entry['score'] += weight * match['score']
+            entry['similarity'] += weight * match['similarity']
+    ranked = sorted(combined.values(), key=lambda m: (m['similarity'], m['score']), reverse=True)[:top_k]
+    return [{'question': m['question'], 'score': round(m['score'] / total_weight, 4), 'similarity': round(m['similarity'] / total_weight, 4)} for m in ranked]
+
+def publish_text(region_texts, cache_key=None):
+    cleaned_text = merge_region_texts(region_texts)
+    matches = result_cache.get_matches(cache_key) if cache_key is not None else None
+    if matches is None:
+        matches = resolve_matches(region_texts)
+        if cache_key is not None: result_cache.put_matches(cache_key, matches)
+    if matches:
+        best = matches[0]
+        print(f"    Best match ({best['similarity']:.2f}): [{best['question'].get('bank_name')}] 正确答案: {best['question'].get('correct_answer')}")
+    # --- Broadcast over SSE ---
+    # One JSON line per event: the page renders the ranked results directly instead of searching itself
+    payload = {'query': cleaned_text, 'results': matches}
+    if len(region_texts) > 1: payload['regions'] = region_texts
+    if bank_watcher and bank_watcher.version: payload['bank_version'] = bank_watcher.version # Lets a page that missed a delta notice
+    sse_broker.publish(json.dumps(payload, ensure_ascii=False))
+    print(f"    Sent {len(matches)} ranked result(s) to {sse_broker.client_count()} SSE client(s).")
+    if not first_result_reported: report_first_result()
+
+def report_first_result():
+    global first_result_reported
+    first_result_reported = True
+    elapsed = time.perf_counter() - LAUNCH_TIME
+    stage_metrics.observe('launch_to_first_result', elapsed)
+    print(f"    First OCR result published {elapsed:.1f} s after launch.")
 
-            # --- Send to SSE Queue ---
-            sse_message_queue.put(cleaned_text)
-            print(f"    Sent to SSE queue for browser update.")
-            # --- NO webbrowser.open() here anymore ---
+# --- OCR Cycle (synchronous, one grab -> OCR -> publish) ---
+def capture_ready():
+    """A live capture needs a selected region; a replay source is always ready."""
+    return capture_source is not screen_grabber or bool(capture_regions)
 
+def perform_ocr_and_search_cycle():
+    if not capture_ready() or not engine_ready.is_set(): return
+
+    try:
+        frames = capture_frame()
+        if frames is None: return
+        region_texts, cache_key = recognize_frame(frames)
+        if accept_new_text(region_texts): publish_text(region_texts, cache_key)
     except Exception as e:
         print(f"\nError during OCR cycle: {e}")
 
+# --- OCR Pipeline (capture thread -> OCR worker -> publisher) ---
+capture_slot = LatestSlot("capture->ocr")
+publish_slot = LatestSlot("ocr->publish")
+
+def capture_stage_loop():
+    """Polls the regions at the scheduler's adaptive interval and hands changed frames to the OCR worker."""
+    replay_reported = False
+    while running:
+        started = time.time()
+        interval = scheduler.capture_interval
+        if ocr_active and engine_ready.is_set() and capture_ready(): # Replay frames wait for the engine instead of being dropped
+            try:
+                frames = capture_frame()
+                if frames is not None: capture_slot.put((started, frames))
+                interval = scheduler.on_capture(frames is not None)
+            except Exception as e:
+                print(f"\nError during screen capture: {e}")
+        if getattr(capture_source, 'exhausted', False) and not replay_reported:
+            print(f"\n--- Replay finished: {capture_source.grabs} frame(s) from {capture_source.path}. Press Ctrl+C to exit. ---")
+            replay_reported = True
+        time.sleep(max(0.0, interval - (time.time() - started)))
+    capture_source.close() # Release the mss handle from the thread that owns it
+
+def ocr_stage_loop():
+    """Runs inference on the newest captured frame whenever the scheduler's CPU budget allows."""
+    waiting = False
+    while running:
+        stage_profiler.sync()
+        wait = scheduler.ocr_wait()
+        if wait > 0: # Frames captured meanwhile replace each other in the slot
+            if not waiting: scheduler.budget_waits += 1; waiting = True
+            time.sleep(min(wait, PIPELINE_POLL_SECONDS)); continue
+        waiting = False
+        item = capture_slot.get(timeout=PIPELINE_POLL_SECONDS)
+        if item is None or not ocr_active or not engine_ready.is_set(): continue
+        captured_at, frames = item
+        cpu_start = time.process_time() # Whole process: also counts paddle's worker threads
+        try:
+            region_texts, cache_key = recognize_frame(frames)
+            scheduler.charge(time.process_time() - cpu_start)
+            if accept_new_text(region_texts): publish_slot.put((captured_at, region_texts, cache_key))
+        except Exception as e:
+            print(f"\nError during OCR cycle: {e}")
+    stage_profiler.stop_thread()
+
+def publish_stage_loop():
+    while running:
+        stage_profiler.sync()
+        item = publish_slot.get(timeout=PIPELINE_POLL_SECONDS)
+        if item is None: continue
+        captured_at, region_texts, cache_key = item
+        publish_text(region_texts, cache_key)
+        latency = time.time() - captured_at
+        stage_metrics.observe('capture_to_publish', latency)
+        print(f"    Capture-to-publish latency: {latency * 1000:.0f} ms")
+    stage_profiler.stop_thread()
+
+def start_ocr_pipeline():
+    threads = [threading.Thread(target=loop, name=name, daemon=True) for name, loop in
+               (("capture", capture_stage_loop), ("ocr", ocr_stage_loop), ("publish", publish_stage_loop))]
+    for t in threads: t.start()
+    return threads
+
+def region_stats_lines():
+    """Change-detection and line-cache stats, per region when there are several."""
+    lines = []
+    for stats in (frame_change_detectors, line_recognizers):
+        lines += [f"{name}: {obj.stats_line()}" if len(stats) > 1 else obj.stats_line() for name, obj in list(stats.items())]
+    return lines
+
+def pipeline_stats_line():
+    return f"Pipeline queues - {capture_slot.stats_line()}; {publish_slot.stats_line()}"
+
 # --- Hotkey Callbacks ---
 def toggle_ocr_active():
     global ocr_active, last_cleaned_text
     ocr_active = not ocr_active
     if ocr_active:
         last_cleaned_text = "!RESET!" # Force update on first OCR after activation
-        print(f"\n--- Continuous OCR Activated (Interval: {OCR_INTERVAL_SECONDS}s) ---")
+        for detector in frame_change_detectors.values(): detector.reset() # First cycle always runs OCR
+        for recognizer in line_recognizers.values(): recognizer.reset() # ...with a full detection
+        capture_slot.clear(); publish_slot.clear() # Drop frames left over from the previous session
+        print(f"\n--- Continuous OCR Activated (CPU budget: {scheduler.budget_percent}% of {os.cpu_count()} cores) ---")
+        if not engine_ready.is_set(): print(f"    OCR engine is still {engine_state}; capture starts as soon as it is ready.")
     else:
         print("\n--- Continuous OCR Deactivated ---")
+        for line in region_stats_lines(): print(f"    {line}")
+        if result_cache: print(f"    {result_cache.stats_line()}")
+        print(f"    {pipeline_stats_line()}")
+        print(f"    {scheduler.stats_line()}")
+        for line in stage_metrics.stats_lines(): print(f"    {line}")
 
 # trigger_reselect remains the same
 def trigger_reselect():
-    global capture_region_coords, ocr_active
+    global capture_regions, ocr_active
     was_active = ocr_active
     if ocr_active: toggle_ocr_active() # Pause OCR
     print(f"\n--- Hotkey '{RESELECT_HOTKEY}' pressed: Reselecting region ---")
-    new_region = select_region_gui()
-    if new_region:
-        capture_region_coords = new_region; save_config(capture_region_coords)
+    new_regions = select_regions_gui(list(capture_regions) or [DEFAULT_REGION_NAME], capture_regions)
+    if new_regions:
+        capture_regions = new_regions; save_config(capture_regions)
+        screen_grabber.set_regions(capture_regions) # Reallocates buffers for the new size
+        preprocess_strategies.clear() # New regions are calibrated on their first frame
         print("Region updated. OCR remains deactivated.")
     else:
         print("Reselection cancelled. OCR remains deactivated.")
         # if was_active: toggle_ocr_active() # Option to restart if cancelled
 
+def trigger_calibrate():
+    if PREPROCESS_STRATEGY != 'auto': print(f"\nPreprocessing is fixed to '{PREPROCESS_STRATEGY}'; nothing to calibrate."); return
+    print(f"\n--- Hotkey '{CALIBRATE_HOTKEY}' pressed: recalibrating preprocessing on the next frame ---")
+    preprocess_strategies.clear()
+    for region in capture_regions.values(): region.pop('preprocess', None)
+    for detector in frame_change_detectors.values(): detector.reset() # The current screen counts as changed
+
 # trigger_quit remains the same
 def trigger_quit():
     global running
@@ -300,23 +1708,83 @@ def trigger_quit():
     running = False
 
 # --- Initialization ---
-# initialize_ocr remains the same
-def initialize_ocr():
-    global ocr_instance
-    print(f"\nInitializing PaddleOCR...")
+def initialize_ocr(engine=None, **engine_options):
+    """Creates the OCR engine (`engine`: a name or config dict, default from ocr_config.json / OCR_ENGINE).
+
+    engine_options override OCR_CPU_THREADS / OCR_ENABLE_MKLDNN and are passed through.
+    """
+    global ocr_engine
+    engine = engine or load_engine_config()
+    engine_options = {'lang': OCR_LANG, 'use_gpu': USE_GPU, 'cpu_threads': OCR_CPU_THREADS, 'enable_mkldnn': OCR_ENABLE_MKLDNN, **engine_options}
     try:
-        ocr_instance = PaddleOCR(use_angle_cls=False, lang=OCR_LANG, use_gpu=USE_GPU, show_log=False)
-        print("PaddleOCR initialized.")
+        from ocr_engines import create_engine, engine_spec_name # Imported here: engine backends pull in paddle / onnxruntime
+        print(f"\nInitializing OCR engine '{engine_spec_name(engine)}'...")
+        ocr_engine = create_engine(engine, **engine_options)
+        print(f"OCR engine initialized: {ocr_engine.describe()}")
         return True
     except Exception as e: print(f"\nFATAL OCR Init Error: {e}"); return False
 
+def warm_up_engine():
+    """One detection and one recognition on a synthetic text image, so graph/kernel setup is not paid by the first real capture."""
+    img = np.full((64, 480, 3), 255, dtype=np.uint8)
+    cv2.putText(img, ENGINE_WARMUP_TEXT, (10, 42), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+    # Called directly so the warm-up stays out of the detection/recognition metrics
+    ocr_engine.detect(img)
+    ocr_engine.recognize_batch([img[8:56, :]])
+
+def set_engine_state(state, message=""):
+    """Records the engine state and pushes it to the page as an SSE status event."""
+    global engine_state
+    engine_state = state
+    sse_broker.publish(json.dumps({'engine': state, 'message': message}, ensure_ascii=False), event_type=ENGINE_STATUS_EVENT)
+
+def engine_loader():
+    """Background thread: import and load the model, then warm it up. Shuts the app down if loading fails."""
+    global running
+    set_engine_state("loading", "Loading the OCR model")
+    cv2.load() # Needed by preprocessing and the warm-up image anyway; import it off the main thread
+    load_start = time.perf_counter()
+    if not initialize_ocr():
+        set_engine_state("failed", "The OCR model failed to load")
+        print("\nOCR engine unavailable, shutting down."); running = False; return
+    stage_metrics.observe('engine_load', time.perf_counter() - load_start)
+    warmup_start = time.perf_counter()
+    if ENGINE_WARMUP_ENABLED:
+        set_engine_state("warming", "Warming up the OCR engine")
+        try:
+            warm_up_engine()
+            stage_metrics.observe('engine_warmup', time.perf_counter() - warmup_start)
+        except Exception as e: print(f"\nOCR warm-up failed (continuing): {e}")
+    engine_ready.set()
+    set_engine_state("ready", "OCR engine ready")
+    print(f"\n[{time.strftime('%H:%M:%S')}] OCR engine ready {time.perf_counter() - LAUNCH_TIME:.1f} s after launch "
+          f"(model load {warmup_start - load_start:.1f} s, warm-up {time.perf_counter() - warmup_start:.1f} s).")
+
+def start_engine_loader():
+    thread = threading.Thread(target=engine_loader, name="engine-loader", daemon=True)
+    thread.start()
+    return thread
+
 # signal_handler remains the same
 def signal_handler(sig, frame): print("\nTermination signal received..."); trigger_quit()
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time OCR of a screen region, matched against the question bank and pushed to search_questions.html.")
+    parser.add_argument('--replay', metavar='PATH', help="Replay a directory of screenshots or a video file instead of capturing the screen (no region selection or hotkeys needed)")
+    parser.add_argument('--loop', action='store_true', help="With --replay: start over when the frames run out")
+    parser.add_argument('--cpu-budget', type=float, default=OCR_CPU_BUDGET_PERCENT, metavar='PERCENT', help="Average share of all CPU cores OCR may use")
+    parser.add_argument('--cpu-threads', type=int, default=OCR_CPU_THREADS, help="OCR engine inference threads")
+    parser.add_argument('--mkldnn', action=argparse.BooleanOptionalAction, default=OCR_ENABLE_MKLDNN, help="Use MKL-DNN (oneDNN) CPU kernels")
+    parser.add_argument('--preprocess', choices=('auto',) + PREPROCESS_STRATEGIES, default=PREPROCESS_STRATEGY, help="Preprocessing strategy for every region; 'auto' calibrates each region on its first frame with text")
+    parser.add_argument('--regions', metavar='NAMES', help=f"Comma-separated region names (e.g. stem,options) to select one after another and save to {CONFIG_FILE}")
+    args = parser.parse_args()
+    OCR_CPU_THREADS, OCR_ENABLE_MKLDNN, PREPROCESS_STRATEGY = max(1, args.cpu_threads), args.mkldnn, args.preprocess
+    scheduler.set_budget(max(1.0, min(100.0, args.cpu_budget)))
     signal.signal(signal.SIGINT, signal_handler); signal.signal(signal.SIGTERM, signal_handler)
     print("--- Real-time OCR -> Single Web Page Update via SSE ---")
+    # Model import/load and warm-up overlap with indexing, the server start and region selection
+    engine_thread = start_engine_loader()
     print("      (Requires Admin/Root privileges)")
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -329,6 +1797,18 @@ if __name__ == "__main__":
          print(f"\nERROR: Missing files in {script_dir}\n - search_questions.html: {'OK' if os.path.exists(search_html_path) else 'MISSING!'}\n - combined_questions_data.json: {'OK' if os.path.exists(json_data_path) else 'MISSING!'}")
          sys.exit(1)
 
+    # Open the question database, or build the server-side search index from the JSON
+    index_start = time.perf_counter()
+    db_path = os.path.join(script_dir, QUESTION_DB_FILE)
+    bank_path = db_path if USE_QUESTION_DB and os.path.exists(db_path) else json_data_path
+    try: question_index = QuestionDB(db_path) if bank_path == db_path else QuestionIndex.from_json_file(json_data_path)
+    except Exception as e: print(f"\nERROR loading question bank {bank_path}: {e}"); sys.exit(1)
+    print(f"{'Opened' if bank_path == db_path else 'Indexed'} {len(question_index)} questions from {os.path.basename(bank_path)} in {(time.perf_counter() - index_start) * 1000:.0f} ms.")
+    if RESULT_CACHE_ENABLED:
+        result_cache = ResultCache(bank_index_paths(json_data_path, db_path if bank_path == db_path else None), persist_path=os.path.join(script_dir, RESULT_CACHE_FILE) if RESULT_CACHE_FILE else None)
+        result_cache.load()
+    if BANK_WATCH_ENABLED: start_bank_watcher(json_data_path, db_path if bank_path == db_path else None)
+
     # Start Server
     if not start_web_server(SERVER_PORT, script_dir): sys.exit(1)
 
@@ -336,44 +1816,56 @@ if __name__ == "__main__":
     print(f" - Press '{TOGGLE_OCR_HOTKEY}' to START/STOP continuous OCR.")
     print(f" - Press '{RESELECT_HOTKEY}' to redefine capture region (stops OCR).")
     print(f" - Press '{QUIT_HOTKEY}' to exit.")
+    print(f" - Press '{CALIBRATE_HOTKEY}' to recalibrate preprocessing (strategy: {PREPROCESS_STRATEGY}).")
+    print(f" - Press '{PROFILE_HOTKEY}' to start/stop a cProfile capture (written to '{PROFILE_DIR}/').")
+    print(f" - Stage timings: http://{SERVER_ADDRESS}:{SERVER_PORT}{METRICS_ENDPOINT}")
 
-    # Load/Select Region
-    if not load_config():
-        new_region = select_region_gui()
-        if new_region: capture_region_coords = new_region; save_config(new_region)
+    # Load/Select Region (a replay source needs none)
+    if args.replay:
+        try: capture_source = ReplaySource(args.replay, loop=args.loop)
+        except Exception as e: print(f"\nERROR opening replay source: {e}"); stop_web_server(); sys.exit(1)
+        print(f"\nReplaying {len(capture_source)} frame(s) from {args.replay}{' (looping)' if args.loop else ''}.")
+    elif not load_config() or args.regions: # Loaded first so reselected regions keep their weights
+        names = [name.strip() for name in args.regions.split(',') if name.strip()] if args.regions else [DEFAULT_REGION_NAME]
+        new_regions = select_regions_gui(names, capture_regions)
+        if new_regions: capture_regions = new_regions; screen_grabber.set_regions(new_regions); save_config(new_regions); preprocess_strategies.clear()
         else: print("\nERROR: Region selection required."); stop_web_server(); sys.exit(1)
 
-    # Initialize OCR
-    if not initialize_ocr(): stop_web_server(); sys.exit(1)
-
-    # Setup Hotkeys
+    # Setup Hotkeys (optional when replaying)
     try:
         keyboard.add_hotkey(TOGGLE_OCR_HOTKEY, toggle_ocr_active, trigger_on_release=False)
         keyboard.add_hotkey(RESELECT_HOTKEY, trigger_reselect, trigger_on_release=False)
         keyboard.add_hotkey(QUIT_HOTKEY, trigger_quit, trigger_on_release=False)
+        keyboard.add_hotkey(PROFILE_HOTKEY, stage_profiler.toggle, trigger_on_release=False)
+        keyboard.add_hotkey(CALIBRATE_HOTKEY, trigger_calibrate, trigger_on_release=False)
         print("\nHotkeys registered.")
     except Exception as e:
-         print(f"\nERROR registering hotkeys: {e}\nEnsure Admin/Root privileges."); stop_web_server(); sys.exit(1)
+        if args.replay: print(f"\nHotkeys unavailable ({e}); press Ctrl+C to exit.")
+        else: print(f"\nERROR registering hotkeys: {e}\nEnsure Admin/Root privileges."); stop_web_server(); sys.exit(1)
 
     # --- Open browser ONCE ---
     initial_url = f"http://{SERVER_ADDRESS}:{SERVER_PORT}/search_questions.html"
     print(f"\nOpening search page: {initial_url}")
     webbrowser.open_new_tab(initial_url) # Use open_new_tab to prefer a new tab
-    print(f"Press '{TOGGLE_OCR_HOTKEY}' to start sending OCR updates to the page.")
+    if not args.replay: print(f"Press '{TOGGLE_OCR_HOTKEY}' to start sending OCR updates to the page.")
     # ---
 
     # --- Main Loop ---
-    last_ocr_time = time.time()
+    # Capture, OCR and publishing run in their own threads; the main thread just waits for shutdown.
+    pipeline_threads = start_ocr_pipeline()
+    if args.replay: toggle_ocr_active() # Replay starts right away
     print("\nWaiting for hotkey commands or exit signal...")
     while running:
-        current_time = time.time()
-        if ocr_active and (current_time - last_ocr_time >= OCR_INTERVAL_SECONDS):
-            perform_ocr_and_search_cycle()
-            last_ocr_time = current_time
-
-        time.sleep(0.05) # Prevent high CPU usage
+        time.sleep(PIPELINE_POLL_SECONDS)
     # --- End Main Loop ---
 
     # Cleanup
+    engine_thread.join(timeout=PIPELINE_POLL_SECONDS) # Still loading at quit: it is a daemon thread, don't wait for it
+    for t in pipeline_threads: t.join(timeout=2 * PIPELINE_POLL_SECONDS)
+    for line in region_stats_lines(): print(line)
+    print(pipeline_stats_line())
+    print(scheduler.stats_line())
+    for line in stage_metrics.stats_lines(): print(line)
+    if result_cache: print(result_cache.stats_line()); result_cache.save()
     stop_web_server()
     print("\nScript finished.")
\ No newline at end of file
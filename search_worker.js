@@ -0,0 +1,156 @@
+// Search worker for search_questions.html: loads the bank and the prebuilt Fuse index
+// written by extract_questions.py, and runs Fuse.js searches off the main thread.
+importScripts('https://cdn.jsdelivr.net/npm/fuse.js@6.6.2/dist/fuse.min.js');
+
+const BANK_FILE = 'combined_questions_data.json';
+const COMPACT_BANK_FILE = 'combined_questions_data.compact.json';
+const INDEX_FILE = 'combined_questions_data.fuse-index.json';
+const BANK_VERSION_HEADER = 'X-Bank-Version'; // Must match BANK_VERSION_HEADER in realtime_ocr.py
+
+// Used when no prebuilt index is available (same keys/weights as FUSE_KEYS in extract_questions.py)
+const DEFAULT_KEYS = normalizeWeights([ { name: "text", weight: 0.7 }, { name: "options", weight: 0.5 }, { name: "correct_answer", weight: 0.3 }, { name: "analysis", weight: 0.2 }, { name: "bank_name", weight: 0.4 }, { name: "type", weight: 0.1 } ]);
+const FUSE_OPTIONS = {
+   shouldSort: true, threshold: 0.4, location: 0, distance: 100,
+   maxPatternLength: 32, minMatchCharLength: 1
+};
+
+let fuse = null;
+let pendingSearch = null; // Only the newest query is kept; anything older is superseded
+let lastSearch = { id: 0, items: [] }; // Full result list of the latest search, paged out on request
+let searchScheduled = false;
+let bankVersion = null; // Version of the loaded bank as reported by realtime_ocr.py (null: unknown, e.g. plain file server)
+let loading = false;
+let pendingDeltas = []; // Bank deltas that arrived while loading, applied once the load finishes
+
+// Weights scaled to sum to 1, as Fuse's KeyStore does and as the prebuilt index stores them, so both indexes score alike
+function normalizeWeights(keys) {
+    const total = keys.reduce((sum, key) => sum + key.weight, 0);
+    return keys.map(key => ({ name: key.name, weight: key.weight / total }));
+}
+
+// --- Compact bank format (extract_questions.py --compact) ---
+// { format, fields: [...], banks: [{ bank_name, types: [...], questions: [[...], ...] }] }
+function expandCompactBank(data) {
+    const questions = [];
+    for (const bank of data.banks) {
+        for (const row of bank.questions) {
+            const question = { bank_name: bank.bank_name }; // Same key order as the full JSON
+            data.fields.forEach((field, i) => { question[field] = field === 'type' ? bank.types[row[i]] : row[i]; });
+            questions.push(question);
+        }
+    }
+    return questions;
+}
+
+async function fetchJsonResponse(url) {
+    const response = await fetch(url); // Revalidated with ETag; served gzip/br precompressed when available
+    if (!response.ok) throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    const contentType = response.headers.get("content-type");
+    if (!contentType || !contentType.includes("application/json")) throw new Error(`Expected JSON, got ${contentType}`);
+    return response;
+}
+
+async function fetchJson(url) {
+    return (await fetchJsonResponse(url)).json();
+}
+
+// --- Load Bank & Index ---
+async function loadBank() {
+    const start = performance.now();
+    loading = true;
+    let docs, source, version;
+    try {
+        const response = await fetchJsonResponse(COMPACT_BANK_FILE);
+        const data = await response.json();
+        if (data.format !== 'ibos-compact-v1') throw new Error(`Unknown format ${data.format}`);
+        docs = expandCompactBank(data);
+        source = COMPACT_BANK_FILE;
+        version = response.headers.get(BANK_VERSION_HEADER);
+    } catch (compactError) {
+        console.log("Compact bank unavailable, loading full JSON:", compactError.message);
+        const response = await fetchJsonResponse(BANK_FILE);
+        docs = await response.json();
+        source = BANK_FILE;
+        version = response.headers.get(BANK_VERSION_HEADER);
+    }
+
+    let keys = DEFAULT_KEYS, index = null;
+    try {
+        const data = await fetchJson(INDEX_FILE);
+        if (data.fuse_version !== Fuse.version) throw new Error(`index built for Fuse ${data.fuse_version}, worker has ${Fuse.version}`);
+        if (data.source !== source || data.count !== docs.length) throw new Error(`index is for ${data.source} (${data.count}), loaded ${source} (${docs.length})`);
+        keys = data.keys.map(key => ({ name: key.src, weight: key.weight })); // Key order must match the index records
+        index = Fuse.parseIndex(data);
+    } catch (indexError) {
+        console.log("Prebuilt index unavailable, building it in the worker:", indexError.message);
+    }
+    fuse = new Fuse(docs, { ...FUSE_OPTIONS, keys }, index || undefined);
+    bankVersion = version;
+    loading = false;
+    postMessage({ type: 'ready', count: docs.length, prebuilt: !!index, version: bankVersion, ms: Math.round(performance.now() - start) });
+    for (const delta of pendingDeltas.splice(0)) applyDelta(delta); // Ones older than the loaded bank are skipped
+    scheduleSearch(); // Queries that arrived while loading
+}
+
+function reloadBank() {
+    if (loading) return;
+    loadBank().catch(error => { loading = false; console.error("Bank reload failed, keeping the loaded bank:", error); });
+}
+
+// --- Bank Deltas (pushed by realtime_ocr.py when the bank file changes) ---
+// Same identity as question_key in question_search.py
+function questionKey(doc) {
+    return [doc.bank_name, doc.id].map(value => value == null ? '' : String(value)).join('\u0000');
+}
+
+// Patches the index in place: every question under a removed key is dropped, then the added ones are indexed.
+// Returns false if the delta does not start from the loaded version (an earlier one was missed).
+function applyDelta(delta) {
+    if (bankVersion && delta.version === bankVersion) return true; // Already part of the loaded bank
+    if (bankVersion && delta.from !== bankVersion) return false;
+    const start = performance.now();
+    const removedKeys = new Set(delta.removed.map(key => key.join('\u0000')));
+    const removed = removedKeys.size ? fuse.remove(doc => removedKeys.has(questionKey(doc))).length : 0;
+    for (const doc of delta.added) fuse.add(doc);
+    bankVersion = delta.version;
+    postMessage({ type: 'patched', version: bankVersion, added: delta.added.length, removed, count: fuse.getIndex().size(), ms: Math.round(performance.now() - start) });
+    return true;
+}
+
+// --- Search ---
+function scheduleSearch() {
+    if (searchScheduled || !pendingSearch) return;
+    searchScheduled = true;
+    setTimeout(runPendingSearch, 0); // Lets messages already queued replace pendingSearch first
+}
+
+function runPendingSearch() {
+    searchScheduled = false;
+    if (!fuse || !pendingSearch) return;
+    const { id, query, count } = pendingSearch;
+    pendingSearch = null;
+    const start = performance.now();
+    const items = query ? fuse.search(query).map(r => r.item) : [];
+    lastSearch = { id, items };
+    // Only the first page crosses to the main thread; the page asks for more as the user scrolls
+    postMessage({ type: 'results', id, query, total: items.length, items: count ? items.slice(0, count) : items, ms: Math.round(performance.now() - start) });
+}
+
+onmessage = (event) => {
+    const message = event.data;
+    if (message.type === 'search') {
+        pendingSearch = message;
+        scheduleSearch();
+    } else if (message.type === 'page') {
+        if (message.id === lastSearch.id) postMessage({ type: 'page', id: message.id, items: lastSearch.items.slice(message.offset, message.offset + message.count) });
+    } else if (message.type === 'cancel') {
+        if (pendingSearch && pendingSearch.id <= message.id) pendingSearch = null;
+    } else if (message.type === 'delta') {
+        if (loading || !fuse) pendingDeltas.push(message.delta);
+        else if (!applyDelta(message.delta)) reloadBank();
+    } else if (message.type === 'reload') {
+        reloadBank();
+    }
+};
+
+loadBank().catch(error => { loading = false; postMessage({ type: 'error', message: String(error) }); });
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""近似去重的回归测试: python -m pytest test_extract_questions.py"""
+from extract_questions import remove_near_duplicates
+
+OPTIONS = ["A．时分", "B．频分", "C．波分", "D．码分"]
+
+
+def make_question(qid, text, answer, bank_name='测试2'):
+    return {'bank_name': bank_name, 'id': qid, 'number': 1, 'type': '单选', 'text': text, 'options': OPTIONS,
+            'student_answer': '未提供', 'correct_answer': answer, 'analysis': '：【无】'}
+
+
+def test_stems_differing_by_one_key_character_are_kept():
+    # 3-gram Jaccard 为 0.9048，超过默认阈值，但 FDM / TDM / WDM 是三道不同的题
+    items = [make_question('1', "FDM是（ ）多路复用技术。", 'B'),
+             make_question('2', "TDM是（ ）多路复用技术。", 'A'),
+             make_question('3', "WDM是（ ）多路复用技术。", 'C')]
+    kept, dropped, report = remove_near_duplicates(items)
+    assert kept == items and dropped == [] and report == []
+
+
+def test_different_answers_are_never_merged():
+    items = [make_question('1', "FDM是（ ）多路复用技术。", 'B'),
+             make_question('2', "FDM是（）多路复用技术", 'A', bank_name='测试1')]
+    kept, dropped, report = remove_near_duplicates(items)
+    assert kept == items and dropped == []
+
+
+def test_same_question_with_missing_answer_is_merged():
+    items = [make_question('1', "FDM是（ ）多路复用技术。", 'B'),
+             make_question('2', "FDM是（）多路复用技术", '未提供', bank_name='测试1')]
+    kept, dropped, report = remove_near_duplicates(items)
+    assert kept == items[:1] and dropped == items[1:]
+    assert len(report) == 1 and report[0]['merged'][0]['id'] == '2'
+
+
+def test_clusters_are_split_by_answer():
+    items = [make_question(str(i), "FDM是（ ）多路复用技术。", answer) for i, answer in enumerate('BBAA')]
+    kept, dropped, report = remove_near_duplicates(items)
+    assert [item['correct_answer'] for item in kept] == ['B', 'A'] and len(dropped) == 2 and len(report) == 2